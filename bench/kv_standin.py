@@ -0,0 +1,375 @@
+"""
+Сервер с протоколом Redis в том же процессе — для проверки STORAGE_BACKEND=redis
+без настоящего Redis. Поддерживает только команды, которые использует
+services/redis_store.py, данные живут в памяти.
+
+    server = KVStandin()
+    port = await server.start()      # REDIS_URL=redis://127.0.0.1:<port>/0
+    ...
+    await server.stop()
+
+Отдельно: python bench/kv_standin.py --port 6399
+"""
+import argparse
+import asyncio
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.resp import encode  # noqa: E402
+
+
+class _Error(Exception):
+    pass
+
+
+def _reply(value):
+    if isinstance(value, _Error):
+        return b"-ERR %s\r\n" % str(value).encode()
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, _Status):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_reply(item) for item in value)
+    return encode(value)[len(b"*1\r\n"):]
+
+
+class _Status(str):
+    pass
+
+
+OK = _Status("OK")
+QUEUED = _Status("QUEUED")
+
+
+def _bound(text):
+    text = text.lower()
+    if text.startswith("("):
+        return float(text[1:]), True
+    return float(text), False
+
+
+def _lex_bound(text):
+    """Граница ZRANGEBYLEX: ("строка", открытая ли); "-" и "+" — концы множества."""
+    if text in ("-", "+"):
+        return text, False
+    return text[1:], text[0] == "("
+
+
+def _fmt_score(score):
+    return str(int(score)) if not math.isinf(score) and score == int(score) else repr(score)
+
+
+# ------------------- ДАННЫЕ -------------------
+class KVStandin:
+    def __init__(self):
+        self.data = {}      # key -> str | dict (хэш) | _ZSet (member -> score)
+        self.expires = {}   # key -> monotonic deadline
+        self.versions = {}  # key -> номер изменения, для WATCH
+        self._server = None
+
+    # ----- служебное -----
+    def _alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._delete(key)
+        return key in self.data
+
+    def _delete(self, key):
+        existed = self.data.pop(key, None) is not None
+        self.expires.pop(key, None)
+        self._touch(key)
+        return existed
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _get(self, key, kind):
+        if not self._alive(key):
+            return None
+        value = self.data[key]
+        if not isinstance(value, kind):
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _zset(self, key, create=False):
+        value = self._get(key, _ZSet)
+        if value is None and create:
+            value = self.data[key] = _ZSet()
+        return value
+
+    # ----- команды -----
+    def cmd_ping(self, *args):
+        return _Status("PONG")
+
+    def cmd_select(self, db):
+        return OK
+
+    def cmd_auth(self, *args):
+        return OK
+
+    def cmd_flushdb(self):
+        for key in list(self.data):
+            self._delete(key)
+        return OK
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def cmd_get(self, key):
+        return self._get(key, str)
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        ttl = None
+        for name, scale in (("PX", 1 / 1000), ("EX", 1)):
+            if name in options:
+                ttl = int(options[options.index(name) + 1]) * scale
+        exists = self._alive(key)
+        if ("NX" in options and exists) or ("XX" in options and not exists):
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if ttl is not None:
+            self.expires[key] = time.monotonic() + ttl
+        self._touch(key)
+        return OK
+
+    def cmd_del(self, *keys):
+        return sum(1 for key in keys if self._alive(key) and self._delete(key))
+
+    def cmd_incrby(self, key, amount):
+        value = int(self._get(key, str) or 0) + int(amount)
+        self.data[key] = str(value)
+        self._touch(key)
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, 1)
+
+    def cmd_decr(self, key):
+        return self.cmd_incrby(key, -1)
+
+    def cmd_pexpire(self, key, ms):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(ms) / 1000
+        self._touch(key)
+        return 1
+
+    def cmd_expire(self, key, seconds):
+        return self.cmd_pexpire(key, int(seconds) * 1000)
+
+    def cmd_hset(self, key, *pairs):
+        value = self._get(key, dict)
+        if value is None:
+            value = self.data[key] = {}
+        added = 0
+        for i in range(0, len(pairs), 2):
+            added += pairs[i] not in value
+            value[pairs[i]] = pairs[i + 1]
+        self._touch(key)
+        return added
+
+    def cmd_hincrby(self, key, field, amount):
+        value = self._get(key, dict)
+        if value is None:
+            value = self.data[key] = {}
+        result = int(value.get(field) or 0) + int(amount)
+        value[field] = str(result)
+        self._touch(key)
+        return result
+
+    def cmd_hdel(self, key, *fields):
+        value = self._get(key, dict) or {}
+        removed = sum(value.pop(field, None) is not None for field in fields)
+        if removed:
+            if not value:
+                self._delete(key)
+            self._touch(key)
+        return removed
+
+    def cmd_hget(self, key, field):
+        return (self._get(key, dict) or {}).get(field)
+
+    def cmd_hmget(self, key, *fields):
+        value = self._get(key, dict) or {}
+        return [value.get(field) for field in fields]
+
+    def cmd_hgetall(self, key):
+        value = self._get(key, dict) or {}
+        return [item for pair in value.items() for item in pair]
+
+    def cmd_zadd(self, key, *pairs):
+        zset = self._zset(key, create=True)
+        added = 0
+        for i in range(0, len(pairs), 2):
+            added += pairs[i + 1] not in zset
+            zset[pairs[i + 1]] = float(pairs[i])
+        self._touch(key)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        zset = self._zset(key)
+        if zset is None:
+            return 0
+        removed = sum(1 for member in members if zset.pop(member, None) is not None)
+        if removed:
+            self._touch(key)
+        if not zset:
+            self._delete(key)
+        return removed
+
+    def cmd_zscore(self, key, member):
+        score = (self._zset(key) or {}).get(member)
+        return None if score is None else _fmt_score(score)
+
+    def _sorted(self, key):
+        return sorted((self._zset(key) or {}).items(), key=lambda item: (item[1], item[0]))
+
+    def _by_score(self, key, low, high):
+        (low, low_open), (high, high_open) = _bound(low), _bound(high)
+        return [
+            (member, score) for member, score in self._sorted(key)
+            if (score > low if low_open else score >= low) and (score < high if high_open else score <= high)
+        ]
+
+    def _by_lex(self, key, low, high):
+        (low, low_open), (high, high_open) = _lex_bound(low), _lex_bound(high)
+        return [
+            (member, score) for member, score in self._sorted(key)
+            if (low == "-" or (member > low if low_open else member >= low))
+            and (high == "+" or (member < high if high_open else member <= high))
+        ]
+
+    @staticmethod
+    def _with_scores(items, args):
+        upper = [arg.upper() for arg in args]
+        if "LIMIT" in upper:
+            offset, count = int(args[upper.index("LIMIT") + 1]), int(args[upper.index("LIMIT") + 2])
+            items = items[offset:] if count < 0 else items[offset:offset + count]
+        if "WITHSCORES" in upper:
+            return [value for member, score in items for value in (member, _fmt_score(score))]
+        return [member for member, _ in items]
+
+    def cmd_zrange(self, key, start, stop, *args):
+        items = self._sorted(key)
+        start, stop = int(start), int(stop)
+        stop = len(items) + stop if stop < 0 else stop
+        return self._with_scores(items[start:stop + 1], args)
+
+    def cmd_zrangebyscore(self, key, low, high, *args):
+        return self._with_scores(self._by_score(key, low, high), args)
+
+    def cmd_zrevrangebyscore(self, key, high, low, *args):
+        return self._with_scores(self._by_score(key, low, high)[::-1], args)
+
+    def cmd_zrangebylex(self, key, low, high, *args):
+        return self._with_scores(self._by_lex(key, low, high), args)
+
+    def cmd_zrevrangebylex(self, key, high, low, *args):
+        return self._with_scores(self._by_lex(key, low, high)[::-1], args)
+
+    def cmd_zremrangebyscore(self, key, low, high):
+        items = self._by_score(key, low, high)
+        return self.cmd_zrem(key, *[member for member, _ in items]) if items else 0
+
+    # ----- выполнение -----
+    def call(self, args):
+        handler = getattr(self, "cmd_" + args[0].lower(), None)
+        if handler is None:
+            return _Error(f"unknown command '{args[0]}'")
+        try:
+            return handler(*args[1:])
+        except _Error as e:
+            return e
+        except (TypeError, ValueError, IndexError) as e:
+            return _Error(f"wrong arguments for '{args[0]}': {e}")
+
+    async def _serve(self, reader, writer):
+        watched, queued = {}, None
+        try:
+            while True:
+                args = await _read_command(reader)
+                if args is None:
+                    break
+                name = args[0].upper()
+                if name == "WATCH":
+                    watched.update({key: self.versions.get(key, 0) for key in args[1:]})
+                    reply = OK
+                elif name == "UNWATCH":
+                    watched, reply = {}, OK
+                elif name == "MULTI":
+                    queued, reply = [], OK
+                elif name == "DISCARD":
+                    queued, watched, reply = None, {}, OK
+                elif name == "EXEC":
+                    if queued is None:
+                        reply = _Error("EXEC without MULTI")
+                    elif any(self.versions.get(key, 0) != version for key, version in watched.items()):
+                        reply = None
+                    else:
+                        reply = [self.call(command) for command in queued]
+                    queued, watched = None, {}
+                elif queued is not None:
+                    queued.append(args)
+                    reply = QUEUED
+                else:
+                    reply = self.call(args)
+                writer.write(_reply(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+class _ZSet(dict):
+    pass
+
+
+async def _read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.decode().split()  # inline-команда, например из telnet
+    args = []
+    for _ in range(int(line[1:-2])):
+        size = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(size + 2))[:-2].decode())
+    return args
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Сервер с протоколом Redis в памяти")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+
+    server = KVStandin()
+    await server.start(args.host, args.port)
+    print(f"Слушаю redis://{args.host}:{args.port}/0")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
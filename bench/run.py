@@ -0,0 +1,446 @@
+"""
+Офлайн-бенчмарк диспетчера: синтетические апдейты прогоняются через dp.feed_update
+с заглушкой вместо HTTP-сессии, поэтому в Telegram ничего не уходит.
+
+    python bench/run.py                      # все сценарии
+    python bench/run.py -s allowed -n 5000   # один сценарий
+    python bench/run.py --no-save            # не дописывать результат в историю
+    python bench/run.py --storage redis      # хранилище redis на kv_standin в этом же процессе
+    python bench/run.py --api-delay 50 -c 1  # ответ Bot API за 50 мс, апдейты по одному
+
+Результаты дописываются в bench/results.jsonl и сравниваются с предыдущим запуском.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join(ROOT, "bench", "results.jsonl")
+
+ADMIN_ID = 1
+GROUP_ID = -1001
+BENCH_GROUPS = 100  # групп в сценарии multi_group
+TMP_DIR = tempfile.mkdtemp(prefix="bench_")
+
+# хранилище нужно знать до импорта config, остальные аргументы разбираются в main()
+_early = argparse.ArgumentParser(add_help=False)
+_early.add_argument("--storage", choices=["sqlite", "redis"], default="sqlite")
+STORAGE = _early.parse_known_args()[0].storage
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+STANDIN_PORT = free_port()
+
+# окружение задаётся до импорта config
+os.environ.update({
+    "STORAGE_BACKEND": STORAGE,
+    "REDIS_URL": f"redis://127.0.0.1:{STANDIN_PORT}/0",
+    "API_TOKEN": "123456:BENCHMARK",
+    "ADMIN_IDS": str(ADMIN_ID),
+    "GROUP_ID": str(GROUP_ID),
+    "DB_PATH": os.path.join(TMP_DIR, "bench.db"),
+    "OUTBOX_RATE": "1000000",
+    "OUTBOX_CHAT_INTERVAL": "0",
+    "OUTBOX_GROUP_INTERVAL": "0",
+})
+sys.path.insert(0, ROOT)
+
+from aiogram import BaseMiddleware  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+import config  # noqa: E402
+
+
+# ------------------- ЗАГЛУШКА BOT API -------------------
+class StubSession(BaseSession):
+    """Отвечает на любые методы Bot API правдоподобным результатом без сети."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.delay = 0.0  # имитация сетевой задержки Bot API (сек)
+        self._message_id = 10 ** 6
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        name = type(method).__name__
+        if name == "GetUpdates":
+            if method.timeout:  # долгий опрос; разбор пропущенного при запуске спрашивает с timeout=0
+                await asyncio.sleep(1)
+            return []
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if name == "GetMe":
+            return method.__returning__.model_validate(
+                {"id": 42, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+            )
+        if name == "SendMessage":
+            self._message_id += 1
+            return method.__returning__.model_validate({
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": method.chat_id, "type": "private" if method.chat_id > 0 else "supergroup"},
+                "text": method.text,
+            }, context={"bot": bot})
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+session = StubSession()
+config.bot.session = session
+
+import bot as bot_module  # noqa: E402
+import database  # noqa: E402
+from config import dp, bot  # noqa: E402
+from storage import store  # noqa: E402
+from bench.kv_standin import KVStandin  # noqa: E402
+from services.quota import day_index  # noqa: E402
+from services.groups import default_policy  # noqa: E402
+from services.updates import scheduler  # noqa: E402
+
+
+# ------------------- СИНТЕТИЧЕСКИЕ АПДЕЙТЫ -------------------
+class UpdateFactory:
+    def __init__(self):
+        self.update_id = 0
+
+    def _next(self):
+        self.update_id += 1
+        return self.update_id
+
+    def message(self, chat_id, user_id, text, chat_type="supergroup"):
+        update_id = self._next()
+        payload = {
+            "message_id": update_id,
+            "date": int(time.time()) + 60,
+            "chat": {"id": chat_id, "type": chat_type},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u", "username": f"user{user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            payload["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return Update.model_validate({"update_id": update_id, "message": payload}, context={"bot": bot})
+
+    def callback(self, user_id, data):
+        update_id = self._next()
+        return Update.model_validate({"update_id": update_id, "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "bench",
+            "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "admin"},
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "card",
+            },
+        }}, context={"bot": bot})
+
+
+# ------------------- ПОДГОТОВКА ДАННЫХ -------------------
+async def seed(users, max_posts, posts_today=0, expires_in=timedelta(days=30), group_id=GROUP_ID):
+    now = datetime.now(timezone.utc)
+    if STORAGE == "redis":
+        for user_id in users:
+            await store.grant_access(group_id, user_id, f"user{user_id}", now + expires_in, max_posts)
+        if posts_today:
+            await store._client.pipeline([
+                ["SET", store._key("quota", group_id, user_id, day_index(now)), posts_today] for user_id in users
+            ])
+        await bot_module.access_cache.load()
+        return
+
+    async with database.transaction() as db:
+        await db.executemany(
+            "REPLACE INTO access (group_id, user_id, username, expires_at, posts_today, max_posts, quota_day) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (group_id, user_id, f"user{user_id}", int((now + expires_in).timestamp()), posts_today, max_posts,
+                 day_index(now))
+                for user_id in users
+            ]
+        )
+    await bot_module.access_cache.load()
+
+
+async def clear():
+    if STORAGE == "redis":
+        await store._client.execute("FLUSHDB")
+    else:
+        async with database.transaction() as db:
+            await db.execute("DELETE FROM access")
+            await db.execute("DELETE FROM requests")
+            await db.execute("DELETE FROM events")
+            await db.execute("DELETE FROM decisions")
+            await db.execute("DELETE FROM decision_cards")
+            await db.execute("DELETE FROM fingerprints")
+            await db.execute("DELETE FROM groups")
+    await bot_module.groups.load()
+    await bot_module.access_cache.load()
+    bot_module.throttle.request_cooldown.clear()
+    bot_module.throttle.buckets.clear()
+    bot_module.duplicates.clear()
+
+
+# ------------------- СЦЕНАРИИ -------------------
+async def scenario_allowed(factory, n):
+    users = range(10_000, 10_000 + max(n // 100, 1))
+    await seed(users, max_posts=n)
+    return [factory.message(GROUP_ID, 10_000 + i % len(users), f"вакансия {i}") for i in range(n)]
+
+
+async def scenario_over_limit(factory, n):
+    users = range(20_000, 20_000 + max(n // 100, 1))
+    await seed(users, max_posts=3, posts_today=3)
+    return [factory.message(GROUP_ID, 20_000 + i % len(users), f"вакансия {i}") for i in range(n)]
+
+
+async def scenario_non_subscriber(factory, n):
+    return [factory.message(GROUP_ID, 30_000 + i, f"спам {i}") for i in range(n)]
+
+
+async def scenario_request_flood(factory, n):
+    # каждый пользователь шлёт /request по 5 раз подряд
+    return [factory.message(40_000 + i // 5, 40_000 + i // 5, "/request", chat_type="private") for i in range(n)]
+
+
+async def scenario_approve(factory, n):
+    # заявки зарегистрированы заранее, как после /request; каждую одобряют дважды — второе нажатие ничего не меняет
+    now = datetime.now(timezone.utc)
+    for i in range(n // 2):
+        await store.open_decision(f"bench{i}", GROUP_ID, 50_000 + i, f"user{50_000 + i}", now)
+    return [factory.callback(ADMIN_ID, f"approve:bench{i // 2}") for i in range(n)]
+
+
+async def scenario_multi_group(factory, n):
+    # бот модерирует BENCH_GROUPS групп со своими правилами, у каждого пользователя доступ в одной из них
+    group_ids = [GROUP_ID - 1 - i for i in range(BENCH_GROUPS)]
+    for group_id in group_ids:
+        await bot_module.groups.save(default_policy(group_id)._replace(max_posts=n))
+    users = range(70_000, 70_000 + max(n // 100, 1))
+    for k, group_id in enumerate(group_ids[:len(users)]):
+        await seed(users[k::len(group_ids)], max_posts=n, group_id=group_id)
+    return [
+        factory.message(group_ids[(i % len(users)) % len(group_ids)], 70_000 + i % len(users), f"вакансия {i}")
+        for i in range(n)
+    ]
+
+
+async def scenario_mixed(factory, n):
+    updates = []
+    parts = [scenario_allowed, scenario_over_limit, scenario_non_subscriber, scenario_request_flood]
+    for make in parts:
+        updates.extend(await make(factory, n // len(parts)))
+    # перемешиваем детерминированно, чтобы запуски были сравнимы
+    return [updates[(i * 7919) % len(updates)] for i in range(len(updates))]
+
+
+SCENARIOS = {
+    "allowed": scenario_allowed,
+    "over_limit": scenario_over_limit,
+    "non_subscriber": scenario_non_subscriber,
+    "request_flood": scenario_request_flood,
+    "approve": scenario_approve,
+    "multi_group": scenario_multi_group,
+    "mixed": scenario_mixed,
+}
+
+
+# ------------------- ЗАМЕРЫ -------------------
+class LatencyProbe(BaseMiddleware):
+    """Время обработки апдейта без ожидания в очереди: стоит за планировщиком, в его обработчике."""
+
+    def __init__(self):
+        self.latencies = []
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+probe = LatencyProbe()
+dp.update.outer_middleware(probe)
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement):
+        self.count += 1
+
+    async def attach(self):
+        if STORAGE == "redis":
+            store._client.trace = self
+            return
+        for db in [database._writer, *database._reader_conns]:
+            await db.set_trace_callback(self)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def run_scenario(name, n, counter):
+    await clear()
+    factory = UpdateFactory()
+    updates = await SCENARIOS[name](factory, n)
+
+    probe.latencies = latencies = []
+    counter.count = 0
+    api_calls = session.calls
+    shed = scheduler.shed
+    started = time.perf_counter()
+    # как при polling: апдейты отдаются планировщику подряд, приём ждёт только при переполненной очереди
+    for update in updates:
+        await dp.feed_update(bot, update)
+    await scheduler.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "scenario": name,
+        "updates": len(updates),
+        "throughput": round(len(updates) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "db_statements_per_update": round(counter.count / len(updates), 2),
+        "api_calls_per_update": round((session.calls - api_calls) / len(updates), 2),
+        "shed": scheduler.shed - shed,
+    }
+
+
+async def run_expiry(n, counter):
+    """Снятие n истёкших доступов циклом check_expired."""
+    from services.expiry import expiry_queue
+
+    await clear()
+    await seed(range(60_000, 60_000 + n), max_posts=3, expires_in=timedelta(seconds=-1))
+    counter.count = 0
+    started = time.perf_counter()
+    expiry_queue.load(await store.list_deadlines())
+    while len(expiry_queue):
+        await asyncio.sleep(0.001)
+    while await store.list_deadlines():
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    return {
+        "scenario": "expiry",
+        "updates": n,
+        "throughput": round(n / elapsed, 1),
+        "p50_ms": None,
+        "p99_ms": None,
+        "db_statements_per_update": round(counter.count / n, 2),
+        "api_calls_per_update": None,
+        "shed": None,
+    }
+
+
+# ------------------- ИСТОРИЯ РЕЗУЛЬТАТОВ -------------------
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _setup_key(record):
+    """Сравниваются только запуски с одинаковыми условиями."""
+    return record.get("storage", "sqlite"), record.get("concurrency"), record.get("api_delay_ms", 0)
+
+
+def load_previous():
+    previous = {}
+    if os.path.exists(RESULTS_PATH):
+        with open(RESULTS_PATH, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                previous[_setup_key(record), record["scenario"]] = record
+    return previous
+
+
+def report(results, previous, setup):
+    header = f"{'сценарий':<16}{'апд/с':>10}{'p50 мс':>10}{'p99 мс':>10}{'SQL/апд':>10}{'API/апд':>10}{'выброш.':>10}{'Δ апд/с':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        before = previous.get((setup, r["scenario"]))
+        delta = ""
+        if before and before.get("throughput"):
+            delta = f"{(r['throughput'] / before['throughput'] - 1) * 100:+.1f}%"
+        print(
+            f"{r['scenario']:<16}{r['throughput']:>10}{str(r['p50_ms']):>10}{str(r['p99_ms']):>10}"
+            f"{r['db_statements_per_update']:>10}{str(r['api_calls_per_update']):>10}{str(r['shed']):>10}{delta:>10}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк обработки апдейтов")
+    parser.add_argument("-s", "--scenario", action="append", choices=[*SCENARIOS, "expiry"])
+    parser.add_argument("-n", "--updates", type=int, default=2000)
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--storage", choices=["sqlite", "redis"], default="sqlite")
+    parser.add_argument("-c", "--concurrency", type=int, default=scheduler.concurrency,
+                        help="обработчиков апдейтов (UPDATE_CONCURRENCY)")
+    parser.add_argument("--api-delay", type=float, default=0, help="задержка ответа Bot API, мс")
+    args = parser.parse_args()
+    scheduler.concurrency = max(args.concurrency, 1)
+    session.delay = args.api_delay / 1000
+
+    standin = KVStandin()
+    if STORAGE == "redis":
+        await standin.start(port=STANDIN_PORT)
+    await bot_module.on_startup()
+    counter = StatementCounter()
+    await counter.attach()
+
+    results = []
+    try:
+        for name in args.scenario or [*SCENARIOS, "expiry"]:
+            if name == "expiry":
+                results.append(await run_expiry(args.updates, counter))
+            else:
+                results.append(await run_scenario(name, args.updates, counter))
+    finally:
+        await bot_module.on_shutdown()
+        await standin.stop()
+
+    meta = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "storage": STORAGE,
+        "concurrency": scheduler.concurrency,
+        "api_delay_ms": args.api_delay,
+    }
+    print(f"хранилище {STORAGE}, обработчиков {scheduler.concurrency}, задержка Bot API {args.api_delay:g} мс")
+    report(results, load_previous(), _setup_key(meta))
+
+    if not args.no_save:
+        with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps({**meta, **r}, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
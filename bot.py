@@ -1,7 +1,17 @@
 import asyncio
-from config import dp, bot
-from database import init_db
-from services.scheduler import reset_daily, check_expired, cleanup_requests
+import logging
+from config import dp, bot, BOT_MODE
+from storage import store
+from services.scheduler import check_expired
+from services.access_cache import access_cache
+from services.groups import groups
+from services.outbox import outbox
+from services.deleter import deleter
+from services.journal import journal
+from services.albums import albums
+from services.duplicates import duplicates
+from services.maintenance import maintenance
+from services import metrics, throttle, restart, decisions, updates, logs
 
 # Подключаем все handlers
 import handlers.start
@@ -9,24 +19,95 @@ import handlers.request
 import handlers.admin
 import handlers.group
 
+log = logging.getLogger(__name__)
+
+updates.setup(dp)
+logs.setup(dp)
+metrics.setup(dp, bot)
+throttle.setup(dp)
+restart.setup(dp)
+tacks = []
+
+
+# ------------------- ЗАПУСК И ОСТАНОВКА -------------------
+# Одинаковы для polling и webhook: aiogram вызывает их через dp.startup / dp.shutdown
+@dp.startup()
+async def on_startup():
+    timer = restart.StartupTimer()
+    await store.connect()
+    await store.init_db()
+    timer.mark("storage")
+    await groups.load()
+    await access_cache.load()
+    await throttle.request_cooldown.load()
+    await decisions.prune()
+    timer.mark("cache")
+    await duplicates.load()
+    timer.mark("fingerprints")
+    await restart.load_snapshot()
+    timer.mark("snapshot")
+    updates.scheduler.start()
+    outbox.start()
+    deleter.start()
+    journal.start()
+    duplicates.start()
+    maintenance.start()
+    await metrics.start_server()
+    # Пропущенное за время простоя — до обычного опроса и до снятия истёкших доступов,
+    # чтобы сообщения проверялись по подпискам, действовавшим в момент отправки
+    if BOT_MODE != "webhook":
+        drained = await restart.drain_backlog()
+        timer.mark("backlog")
+        if drained:
+            log.info("Разобрано пропущенных апдейтов: %s", drained)
+    tacks.append(asyncio.create_task(check_expired()))
+    tacks.append(asyncio.create_task(restart.keep_snapshot()))
+    log.info(timer.summary())
+
+
+@dp.shutdown()
+async def on_shutdown():
+    # Останавливаем фоновые задачи
+    for task in tacks:
+        task.cancel()
+    await asyncio.gather(*tacks, return_exceptions=True)
+    tacks.clear()
+    # Прерываем копию базы, если она идёт
+    await maintenance.stop()
+    # Дорабатываем принятые апдейты
+    await updates.scheduler.stop()
+    # Проверяем альбомы, которые ещё собираются
+    await albums.stop()
+    # Досылаем накопившиеся уведомления и удаляем предупреждения
+    await outbox.stop()
+    await decisions.stop()
+    await deleter.stop()
+    # Дописываем журнал, пока хранилище ещё открыто
+    await journal.stop()
+    await duplicates.stop()
+    try:
+        await restart.save_snapshot()
+    except Exception as e:
+        log.warning("Не удалось сохранить снимок состояния: %s", e)
+    # Закрываем соединения с БД и эндпоинт метрик
+    await store.close()
+    await metrics.stop_server()
+
 
 # ------------------- ЗАПУСК -------------------
 async def main():
-    await init_db()
-    tacks = [
-        asyncio.create_task(reset_daily()),
-        asyncio.create_task(check_expired()),
-        asyncio.create_task(cleanup_requests()),
-    ]
+    logs.start()
     try:
-        await dp.start_polling(bot)
+        if BOT_MODE == "webhook":
+            from services.webhook import run_webhook
+            await run_webhook()
+        else:
+            # апдейты раздаёт services/updates.py: опрос ждёт, только пока его очередь переполнена
+            await dp.start_polling(bot, handle_as_tasks=False)
     finally:
-        # Останавливаем фоновые задачи
-        for task in tacks:
-            task.cancel()
-        await asyncio.gather(*tacks, return_exceptions=True)
-        # Закрываем сессию бота
+        # Закрываем сессию бота и дописываем логи
         await bot.session.close()
+        logs.stop()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,9 @@
 from aiogram.client.bot import DefaultBotProperties
 from aiogram import Bot, Dispatcher
-from datetime import datetime, timezone
+import os
+import socket
 from environs import Env
 
-BOT_START_TIME = datetime.now(timezone.utc)
-
 env = Env()
 env.read_env()  # подгрузит .env
 
@@ -13,9 +12,106 @@ if not API_TOKEN:
     raise RuntimeError("API_TOKEN is missing. Set it in .env")
 
 ADMIN_IDS = env.list("ADMIN_IDS", subcast=int, default=[])
-GROUP_ID = env.int("GROUP_ID", 0)
+GROUP_ID = env.int("GROUP_ID", 0)  # группа, которую бот модерирует с первого запуска; остальные добавляет /group
+# Правила новой группы по умолчанию; у каждой группы они меняются командой /group
+ACCESS_DAYS = env.int("ACCESS_DAYS", 7)  # на сколько дней выдаётся доступ по заявке
+MAX_POSTS = env.int("MAX_POSTS", 3)  # постов в день
+ADMIN_CONTACT = env.str("ADMIN_CONTACT", "@hrd_timur")  # кому писать о рекламе, показывается в предупреждении
 DB_PATH = env.str("DB_PATH", "group_access.db")
 
+# Хранилище: sqlite (локальный файл DB_PATH) или redis (общее для нескольких экземпляров)
+STORAGE_BACKEND = env.str("STORAGE_BACKEND", "sqlite")
+REDIS_URL = env.str("REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_PREFIX = env.str("REDIS_PREFIX", "tgbot:")  # префикс всех ключей бота
+REDIS_POOL = env.int("REDIS_POOL", 4)  # соединений в пуле
+INSTANCE_ID = env.str("INSTANCE_ID", "") or f"{socket.gethostname()}:{os.getpid()}"  # имя экземпляра в арендах
+LEASE_TTL = env.float("LEASE_TTL", 30.0)  # аренда фоновой задачи живёт столько секунд без продления
+# как часто сверять кэш доступов с хранилищем (сек); 0 — кэш единственный источник правды
+ACCESS_CACHE_TTL = env.float("ACCESS_CACHE_TTL", 5.0 if STORAGE_BACKEND == "redis" else 0.0)
+
+# Режим получения апдейтов: polling или webhook
+BOT_MODE = env.str("BOT_MODE", "polling")
+WEBHOOK_URL = env.str("WEBHOOK_URL", "")  # публичный адрес, например https://bot.example.com
+WEBHOOK_HOST = env.str("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = env.int("WEBHOOK_PORT", 8080)
+WEBHOOK_PATH = env.str("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = env.str("WEBHOOK_SECRET", "")  # сверяется с заголовком X-Telegram-Bot-Api-Secret-Token
+HEALTH_PATH = env.str("HEALTH_PATH", "/health")
+DB_READERS = env.int("DB_READERS", 2)  # соединений на чтение в пуле
+DB_CACHE_SIZE_KB = env.int("DB_CACHE_SIZE_KB", 16384)  # page cache SQLite на соединение
+DAY_TIMEZONE = env.str("DAY_TIMEZONE", "UTC")  # часовой пояс, в котором начинаются сутки для лимита постов
+
+# Очередь исходящих сообщений (лимиты Telegram: ~30 сообщений/сек, 1/сек в личку, 20/мин в группу)
+OUTBOX_RATE = env.float("OUTBOX_RATE", 25.0)
+OUTBOX_CHAT_INTERVAL = env.float("OUTBOX_CHAT_INTERVAL", 1.0)
+OUTBOX_GROUP_INTERVAL = env.float("OUTBOX_GROUP_INTERVAL", 3.0)
+OUTBOX_CONCURRENCY = env.int("OUTBOX_CONCURRENCY", 8)
+OUTBOX_MAX_RETRIES = env.int("OUTBOX_MAX_RETRIES", 3)
+
+# Обработка апдейтов: параллельно по ключу (чат, пользователь), по порядку внутри ключа
+UPDATE_CONCURRENCY = env.int("UPDATE_CONCURRENCY", 16)  # апдейтов обрабатывается одновременно
+UPDATE_MAX_PENDING = env.int("UPDATE_MAX_PENDING", 1000)  # при стольких апдейтах в очереди приём новых ждёт
+UPDATE_SHED_PENDING = env.int("UPDATE_SHED_PENDING", 500)  # с такой очереди личные сообщения не админов выбрасываются
+
+LIST_PAGE_SIZE = env.int("LIST_PAGE_SIZE", 25)  # строк на странице /list
+
+# Анти-флуд в личке и на кнопках: token bucket на пару (пользователь, команда)
+THROTTLE_RATE = env.float("THROTTLE_RATE", 0.5)  # токенов в секунду
+THROTTLE_BURST = env.int("THROTTLE_BURST", 5)  # ёмкость ведра
+THROTTLE_MAX_KEYS = env.int("THROTTLE_MAX_KEYS", 10000)  # сколько вёдер держать в памяти
+THROTTLE_IDLE_TTL = env.float("THROTTLE_IDLE_TTL", 600.0)  # через сколько секунд простоя ведро забывается
+REQUEST_COOLDOWN = env.int("REQUEST_COOLDOWN", 3600)  # не чаще одной заявки за столько секунд
+DECISION_TTL_DAYS = env.int("DECISION_TTL_DAYS", 30)  # сколько дней по заявке можно принять решение
+
+# Перезапуск: снимок состояния и апдейты, пришедшие, пока бот не работал
+SNAPSHOT_INTERVAL = env.float("SNAPSHOT_INTERVAL", 10.0)  # как часто сохранять снимок (сек)
+BACKLOG_MAX_UPDATES = env.int("BACKLOG_MAX_UPDATES", 5000)  # сколько пропущенных апдейтов разобрать при запуске
+BACKLOG_MAX_AGE = env.int("BACKLOG_MAX_AGE", 86400)  # сообщения старше (сек) в группе не модерируются
+
+# Логи: JSON-строки в stdout и, если задан LOG_FILE, в файл с ротацией
+LOG_LEVEL = env.str("LOG_LEVEL", "INFO")
+LOG_LEVELS = env.dict("LOG_LEVELS", default={"aiogram.event": "WARNING"})  # уровни по модулям: services.outbox=DEBUG,aiogram=WARNING
+LOG_FORMAT = env.str("LOG_FORMAT", "json")  # json или text
+LOG_FILE = env.str("LOG_FILE", "")
+LOG_MAX_BYTES = env.int("LOG_MAX_BYTES", 10 * 1024 * 1024)  # размер файла, после которого он ротируется
+LOG_BACKUPS = env.int("LOG_BACKUPS", 5)  # сколько старых файлов хранить
+LOG_RATE_LIMIT = env.int("LOG_RATE_LIMIT", 10)  # одинаковых предупреждений за LOG_RATE_INTERVAL, дальше подавляются; 0 — без ограничения
+LOG_RATE_INTERVAL = env.float("LOG_RATE_INTERVAL", 60.0)
+LOG_SLOW_HANDLER = env.float("LOG_SLOW_HANDLER", 1.0)  # хэндлер дольше (сек) пишется предупреждением
+
+# Обслуживание файла SQLite: копии и сжатие
+BACKUP_DIR = env.str("BACKUP_DIR", "backups")
+BACKUP_INTERVAL_HOURS = env.float("BACKUP_INTERVAL_HOURS", 24)  # как часто делать копию; 0 — только по /backup
+BACKUP_KEEP = env.int("BACKUP_KEEP", 7)  # сколько последних копий хранить
+BACKUP_STEP_PAGES = env.int("BACKUP_STEP_PAGES", 256)  # страниц за шаг копирования
+BACKUP_STEP_DELAY = env.float("BACKUP_STEP_DELAY", 0.02)  # пауза между шагами копирования (сек)
+MAINTENANCE_INTERVAL = env.float("MAINTENANCE_INTERVAL", 300)  # как часто проверять, не пора ли обслужить базу (сек)
+MAINTENANCE_IDLE_RATE = env.float("MAINTENANCE_IDLE_RATE", 1.0)  # апдейтов в секунду, ниже которых трафик низкий
+VACUUM_STEP_PAGES = env.int("VACUUM_STEP_PAGES", 512)  # страниц за шаг incremental vacuum
+
+# Метрики Prometheus
+METRICS_ENABLED = env.bool("METRICS_ENABLED", False)
+METRICS_HOST = env.str("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = env.int("METRICS_PORT", 0)  # 0 — не поднимать HTTP-эндпоинт /metrics
+
+# Журнал событий модерации: пишется в память и сбрасывается в хранилище пачками
+JOURNAL_BUFFER = env.int("JOURNAL_BUFFER", 10000)  # событий в памяти; при переполнении теряются самые старые
+JOURNAL_BATCH = env.int("JOURNAL_BATCH", 500)  # событий в одной транзакции записи
+JOURNAL_FLUSH_INTERVAL = env.float("JOURNAL_FLUSH_INTERVAL", 2.0)  # как часто сбрасывать (сек)
+JOURNAL_RETENTION_DAYS = env.int("JOURNAL_RETENTION_DAYS", 90)  # сколько дней хранить, 0 — бессрочно
+
+# Удаление сообщений и предупреждения в группе
+DELETE_BATCH_DELAY = env.float("DELETE_BATCH_DELAY", 0.3)  # окно сбора удалений в один deleteMessages (сек)
+ALBUM_WINDOW = env.float("ALBUM_WINDOW", 1.0)  # сколько ждать остальные сообщения альбома (сек)
+
+# Повторы постов
+DUPLICATE_WINDOW_HOURS = env.float("DUPLICATE_WINDOW_HOURS", 72)  # сколько часов помнить посты, 0 — не проверять
+DUPLICATE_MAX_DISTANCE = env.int("DUPLICATE_MAX_DISTANCE", 3)  # отличие SimHash в битах из 64, при котором пост — повтор
+DUPLICATE_MAX_ENTRIES = env.int("DUPLICATE_MAX_ENTRIES", 300000)  # сколько постов помнить не больше
+WARNING_TTL = env.float("WARNING_TTL", 12.0)  # сколько живёт предупреждение (сек)
+WARNING_CHAT_LIMIT = env.int("WARNING_CHAT_LIMIT", 3)  # живых предупреждений в чате одновременно
+WARNING_EDIT_DELAY = env.float("WARNING_EDIT_DELAY", 2.0)  # правки предупреждения не чаще (сек)
+
 bot = Bot(
     token=API_TOKEN,
     default=DefaultBotProperties(parse_mode="HTML")
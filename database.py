@@ -1,28 +1,1194 @@
+import asyncio
+import logging
+import sqlite3
+import time
 import aiosqlite
-from config import DB_PATH
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+from config import DB_PATH, DB_READERS, DB_CACHE_SIZE_KB, GROUP_ID
+from services.quota import day_index, used_today
+from services.metrics import timed_query
+
+log = logging.getLogger(__name__)
+
+# Бэкенд хранилища на SQLite (STORAGE_BACKEND=sqlite), интерфейс описан в storage.py.
+# Одно соединение на запись и небольшой пул соединений на чтение.
+# В режиме WAL читатели не ждут писателя, поэтому /list и проверка
+# истёкших доступов работают параллельно с записями из группы.
+_writer: Optional[aiosqlite.Connection] = None
+_readers: "asyncio.Queue[aiosqlite.Connection]" = None
+_reader_conns = []
+_write_lock = asyncio.Lock()
+
+# локальный файл: состояние видит только этот процесс
+SHARED = False
+
+
+class AccessRow(NamedTuple):
+    group_id: int
+    user_id: int
+    username: Optional[str]
+    expires_at: Optional[datetime]
+    posts_today: int
+    last_post_date: Optional[datetime]
+    max_posts: int
+    quota_day: Optional[int]
+
+
+class QuotaResult(NamedTuple):
+    allowed: bool
+    posts_today: int
+    max_posts: int
+
+
+class AccessFilter(NamedTuple):
+    """Фильтр /list и массовых команд: истекающие за N дней, упёршиеся в лимит, префикс username."""
+    expiring_days: Optional[int] = None
+    at_limit: bool = False
+    username_prefix: Optional[str] = None
+    now: Optional[datetime] = None
+
+
+class Event(NamedTuple):
+    """Запись журнала: что случилось, с кем и кто это сделал (actor_id — админ)."""
+    at: datetime
+    kind: str
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+    actor_id: Optional[int] = None
+    chat_id: Optional[int] = None
+    message_id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class Decision(NamedTuple):
+    """Заявка на доступ, разосланная админам: кому и в какую группу выдать доступ, кто и как решил, карточки (admin_id, message_id)."""
+    token: str
+    group_id: int
+    user_id: int
+    username: Optional[str]
+    created_at: datetime
+    action: Optional[str] = None
+    actor_id: Optional[int] = None
+    decided_at: Optional[datetime] = None
+    cards: tuple = ()
+
+
+class Fingerprint(NamedTuple):
+    """Отпечаток опубликованного поста (services/duplicates.py): хэши без знака, 64 бита."""
+    at: datetime
+    exact: int
+    simhash: int
+    user_id: Optional[int] = None
+    chat_id: Optional[int] = None
+    message_id: Optional[int] = None
+
+
+class GroupPolicy(NamedTuple):
+    """Правила группы: срок доступа по заявке (дней), постов в день, контакт админа, сколько живёт предупреждение (сек)."""
+    group_id: int
+    title: Optional[str]
+    access_days: int
+    max_posts: int
+    admin_contact: Optional[str]
+    warning_ttl: float
+
+
+ACCESS_COLUMNS = "group_id, user_id, username, expires_at, posts_today, last_post_date, max_posts, quota_day"
+
+
+# Время хранится целыми секундами Unix (UTC): сравнения и индексы — по числу,
+# а наружу отдаются datetime с часовым поясом, как и раньше.
+def _ts(value: Optional[datetime]) -> Optional[int]:
+    return int(value.timestamp()) if value is not None else None
+
+
+def _dt(value: Optional[int]) -> Optional[datetime]:
+    return datetime.fromtimestamp(value, timezone.utc) if value is not None else None
+
+
+def _access_row(row) -> AccessRow:
+    group_id, user_id, username, expires_at, posts_today, last_post_date, max_posts, quota_day = row
+    return AccessRow(group_id, user_id, username, _dt(expires_at), posts_today, _dt(last_post_date), max_posts, quota_day)
+
+
+# ------------------- ПОДКЛЮЧЕНИЕ -------------------
+async def _open():
+    # cached_statements — кэш подготовленных запросов sqlite3 на соединение
+    db = await aiosqlite.connect(DB_PATH, cached_statements=256)
+    # действует только на новую пустую базу; старую переводит maintenance (incremental_vacuum)
+    await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    await db.execute("PRAGMA busy_timeout=5000")
+    await db.execute("PRAGMA temp_store=MEMORY")
+    return db
+
+
+async def connect():
+    global _writer, _readers
+    if _writer is not None:
+        return
+
+    _writer = await _open()
+    _readers = asyncio.Queue()
+    for _ in range(DB_READERS):
+        db = await _open()
+        _reader_conns.append(db)
+        _readers.put_nowait(db)
+
+
+async def close():
+    global _writer, _readers
+    for db in _reader_conns:
+        await db.close()
+    _reader_conns.clear()
+    _readers = None
+
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
+
+
+# ------------------- БАЗОВЫЕ ОПЕРАЦИИ -------------------
+@asynccontextmanager
+async def transaction():
+    """Одна транзакция на запись: commit при успехе, rollback при ошибке."""
+    async with _write_lock:
+        try:
+            yield _writer
+            await _writer.commit()
+        except BaseException:
+            await _writer.rollback()
+            raise
+
+
+async def execute(sql, params=()):
+    async with transaction() as db:
+        cursor = await db.execute(sql, params)
+        return cursor.rowcount
+
+
+async def executemany(sql, seq):
+    async with transaction() as db:
+        await db.executemany(sql, seq)
+
+
+@asynccontextmanager
+async def reader():
+    db = await _readers.get()
+    try:
+        yield db
+    finally:
+        _readers.put_nowait(db)
+
+
+async def fetch_one(sql, params=()):
+    async with reader() as db:
+        cursor = await db.execute(sql, params)
+        row = await cursor.fetchone()
+        await cursor.close()
+        return row
+
+
+async def fetch_all(sql, params=()):
+    async with reader() as db:
+        cursor = await db.execute(sql, params)
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return rows
+
+
+# ------------------- ОБСЛУЖИВАНИЕ ФАЙЛА -------------------
+class BackupCancelled(Exception):
+    pass
+
+
+def backup_to(path, pages, delay, cancelled=lambda: False) -> int:
+    """
+    Копия базы в path через online backup API. Блокирующая: вызывается
+    в отдельном потоке (asyncio.to_thread) и работает на своём соединении.
+    Копирует по pages страниц с паузой delay секунд. Открытая транзакция чтения
+    держит снимок: в WAL записи бота её не ждут и не заставляют копирование
+    начинаться заново. cancelled() == True прерывает копирование.
+    Возвращает число страниц в копии.
+    """
+    source = sqlite3.connect(DB_PATH, isolation_level=None)
+    target = sqlite3.connect(path, isolation_level=None)
+    copied = 0
+
+    def progress(status, remaining, total):
+        nonlocal copied
+        copied = total
+        if cancelled():
+            raise BackupCancelled(path)
+        if remaining:
+            time.sleep(delay)
+
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT 1 FROM sqlite_master LIMIT 1")  # снимок фиксируется первым чтением
+        source.backup(target, pages=pages, progress=progress)
+        source.execute("COMMIT")
+        # копия — один самостоятельный файл, без -wal рядом
+        target.execute("PRAGMA journal_mode=DELETE")
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+        if check != "ok":
+            raise sqlite3.DatabaseError(f"копия не прошла quick_check: {check}")
+        return copied
+    finally:
+        source.close()
+        target.close()
+
+
+@timed_query
+async def checkpoint(truncate=False):
+    """
+    Переносит WAL в основной файл. PASSIVE не ждёт читателей; TRUNCATE ждёт их
+    и обрезает файл -wal до нуля. Возвращает (busy, страниц в WAL, перенесено).
+    """
+    mode = "TRUNCATE" if truncate else "PASSIVE"
+    async with _write_lock:
+        cursor = await _writer.execute(f"PRAGMA wal_checkpoint({mode})")
+        row = await cursor.fetchone()
+        await cursor.close()
+        return tuple(row)
+
+
+async def _pragma(db, name):
+    cursor = await db.execute(f"PRAGMA {name}")
+    row = await cursor.fetchone()
+    await cursor.close()
+    return row[0]
+
+
+@timed_query
+async def incremental_vacuum(pages) -> tuple:
+    """
+    Возвращает файловой системе до pages свободных страниц.
+    Базу без auto_vacuum=INCREMENTAL (созданную до этой версии) первый вызов
+    переводит в этот режим полным VACUUM — запись ждёт, пока он идёт.
+    Возвращает (освобождено страниц, свободных осталось).
+    """
+    async with _write_lock:
+        free = await _pragma(_writer, "freelist_count")
+        if await _pragma(_writer, "auto_vacuum") != 2:
+            await _writer.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await _writer.execute("VACUUM")
+            log.info("База переведена на auto_vacuum=INCREMENTAL")
+            return free, await _pragma(_writer, "freelist_count")
+        if not free:
+            return 0, 0
+        # страницы освобождаются по одной на шаг запроса — нужен fetchall
+        cursor = await _writer.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+        await cursor.fetchall()
+        await cursor.close()
+        left = await _pragma(_writer, "freelist_count")
+        return free - left, left
+
+
+# ------------------- МИГРАЦИИ -------------------
+# Версия схемы хранится в PRAGMA user_version. MIGRATIONS[i] переводит базу
+# с версии i на i + 1; init_db применяет недостающие по порядку, каждую —
+# одной транзакцией вместе с новым номером версии. Базы, созданные до
+# появления версий, имеют user_version = 0 и проходят весь путь.
+async def _migrate_1(db):
+    """Схема без версий: текстовые даты ISO 8601."""
+    # Таблица активных доступов
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS access (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        expires_at TEXT,
+        posts_today INTEGER DEFAULT 0,
+        last_post_date TEXT,
+        max_posts INTEGER DEFAULT 3,
+        quota_day INTEGER
+    )
+    """)
+
+    # quota_day — номер дня, для которого записан posts_today
+    cursor = await db.execute("PRAGMA table_info(access)")
+    columns = {row[1] for row in await cursor.fetchall()}
+    if "quota_day" not in columns:
+        await db.execute("ALTER TABLE access ADD COLUMN quota_day INTEGER")
+        cursor = await db.execute("SELECT user_id, last_post_date FROM access WHERE last_post_date IS NOT NULL")
+        await db.executemany(
+            "UPDATE access SET quota_day=? WHERE user_id=?",
+            [(day_index(datetime.fromisoformat(last_post)), user_id) for user_id, last_post in await cursor.fetchall()]
+        )
+
+    # Таблица заявок
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS requests (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        requested_at TEXT
+    )
+    """)
+
+    # Аренды фоновых задач: какой экземпляр бота сейчас их выполняет
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT,
+        expires_at REAL
+    )
+    """)
+
+
+def _epoch(table, user_id, value):
+    """ISO-строка из схемы 1 → секунды Unix. Даты без пояса бот писал в UTC."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise RuntimeError(f"Миграция БД: в {table} у user_id={user_id} непонятная дата {value!r}") from None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+async def _migrate_2(db):
+    """Даты — целые секунды Unix, индексы по срокам доступа и времени заявок."""
+    # SQLite не меняет тип столбца — таблицы пересоздаются с переносом строк
+    await db.execute("""
+    CREATE TABLE access_new (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        expires_at INTEGER,
+        posts_today INTEGER DEFAULT 0,
+        last_post_date INTEGER,
+        max_posts INTEGER DEFAULT 3,
+        quota_day INTEGER
+    )
+    """)
+    # столбцы схемы 2 (до появления group_id), а не текущий ACCESS_COLUMNS
+    columns = "user_id, username, expires_at, posts_today, last_post_date, max_posts, quota_day"
+    cursor = await db.execute(f"SELECT {columns} FROM access")
+    await db.executemany(
+        f"INSERT INTO access_new ({columns}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (user_id, username, _epoch("access", user_id, expires_at), posts_today,
+             _epoch("access", user_id, last_post_date), max_posts, quota_day)
+            for user_id, username, expires_at, posts_today, last_post_date, max_posts, quota_day
+            in await cursor.fetchall()
+        ]
+    )
+    await db.execute("DROP TABLE access")
+    await db.execute("ALTER TABLE access_new RENAME TO access")
+    # Индекс для планировщика истечения доступов и фильтра /list e<N>
+    await db.execute("CREATE INDEX idx_access_expires_at ON access (expires_at)")
+
+    await db.execute("""
+    CREATE TABLE requests_new (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        requested_at INTEGER
+    )
+    """)
+    cursor = await db.execute("SELECT user_id, username, requested_at FROM requests")
+    await db.executemany(
+        "INSERT INTO requests_new (user_id, username, requested_at) VALUES (?, ?, ?)",
+        [
+            (user_id, username, _epoch("requests", user_id, requested_at))
+            for user_id, username, requested_at in await cursor.fetchall()
+        ]
+    )
+    await db.execute("DROP TABLE requests")
+    await db.execute("ALTER TABLE requests_new RENAME TO requests")
+    # Индекс для загрузки действующих заявок и удаления старых
+    await db.execute("CREATE INDEX idx_requests_requested_at ON requests (requested_at)")
+
+
+async def _migrate_3(db):
+    """Журнал событий модерации."""
+    await db.execute("""
+    CREATE TABLE events (
+        id INTEGER PRIMARY KEY,
+        at INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        user_id INTEGER,
+        username TEXT,
+        actor_id INTEGER,
+        chat_id INTEGER,
+        message_id INTEGER,
+        detail TEXT
+    )
+    """)
+    # Выборка за период и история одного пользователя
+    await db.execute("CREATE INDEX idx_events_at ON events (at)")
+    await db.execute("CREATE INDEX idx_events_user_id ON events (user_id, at)")
+    # Журнал только дополняется: старые записи можно удалить по сроку хранения, но не исправить
+    await db.execute("""
+    CREATE TRIGGER events_append_only BEFORE UPDATE ON events
+    BEGIN
+        SELECT RAISE(ABORT, 'events is append-only');
+    END
+    """)
+
+
+async def _migrate_4(db):
+    """Состояние бота между перезапусками (services/restart.py)."""
+    await db.execute("""
+    CREATE TABLE state (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    )
+    """)
+
+
+async def _migrate_5(db):
+    """Заявки на доступ и карточки, разосланные по ним админам."""
+    await db.execute("""
+    CREATE TABLE decisions (
+        token TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        created_at INTEGER NOT NULL,
+        action TEXT,
+        actor_id INTEGER,
+        decided_at INTEGER
+    )
+    """)
+    await db.execute("CREATE INDEX idx_decisions_created_at ON decisions (created_at)")
+    await db.execute("""
+    CREATE TABLE decision_cards (
+        token TEXT NOT NULL,
+        admin_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        PRIMARY KEY (token, admin_id)
+    )
+    """)
+
+
+async def _migrate_6(db):
+    """Отпечатки недавних постов для поиска повторов."""
+    await db.execute("""
+    CREATE TABLE fingerprints (
+        id INTEGER PRIMARY KEY,
+        at INTEGER NOT NULL,
+        exact INTEGER NOT NULL,
+        simhash INTEGER NOT NULL,
+        user_id INTEGER,
+        chat_id INTEGER,
+        message_id INTEGER
+    )
+    """)
+    await db.execute("CREATE INDEX idx_fingerprints_at ON fingerprints (at)")
+
+
+async def _migrate_7(db):
+    """Несколько групп: правила каждой группы, доступы и заявки с group_id."""
+    await db.execute("""
+    CREATE TABLE groups (
+        group_id INTEGER PRIMARY KEY,
+        title TEXT,
+        access_days INTEGER NOT NULL,
+        max_posts INTEGER NOT NULL,
+        admin_contact TEXT,
+        warning_ttl REAL NOT NULL
+    )
+    """)
+
+    # до этой версии бот модерировал одну группу — GROUP_ID
+    cursor = await db.execute("SELECT EXISTS (SELECT 1 FROM access UNION ALL SELECT 1 FROM decisions)")
+    has_rows = (await cursor.fetchone())[0]
+    await cursor.close()
+    if has_rows and not GROUP_ID:
+        raise RuntimeError("Миграция БД: доступы и заявки пока без группы — укажите в GROUP_ID, к какой они относятся")
+
+    await db.execute("""
+    CREATE TABLE access_new (
+        group_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        expires_at INTEGER,
+        posts_today INTEGER DEFAULT 0,
+        last_post_date INTEGER,
+        max_posts INTEGER DEFAULT 3,
+        quota_day INTEGER,
+        PRIMARY KEY (group_id, user_id)
+    )
+    """)
+    await db.execute(
+        "INSERT INTO access_new (group_id, user_id, username, expires_at, posts_today, last_post_date, "
+        "max_posts, quota_day) SELECT ?, user_id, username, expires_at, posts_today, last_post_date, "
+        "max_posts, quota_day FROM access",
+        (GROUP_ID,)
+    )
+    await db.execute("DROP TABLE access")
+    await db.execute("ALTER TABLE access_new RENAME TO access")
+    await db.execute("CREATE INDEX idx_access_expires_at ON access (expires_at)")
+
+    await db.execute("ALTER TABLE decisions ADD COLUMN group_id INTEGER")
+    await db.execute("UPDATE decisions SET group_id = ?", (GROUP_ID,))
+
+
+async def _migrate_8(db):
+    """Сводка по дням и по пользователям; заполняется из журнала, который уже есть."""
+    await db.execute("""
+    CREATE TABLE stats_days (
+        group_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY (group_id, kind, day)
+    ) WITHOUT ROWID
+    """)
+    await db.execute("""
+    CREATE TABLE stats_users (
+        group_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY (group_id, user_id, kind)
+    ) WITHOUT ROWID
+    """)
+    cursor = await db.execute(f"SELECT {EVENT_COLUMNS} FROM events ORDER BY at, id")
+    while rows := await cursor.fetchmany(10000):
+        await _add_stats(db, [Event(_dt(row[0]), *row[1:]) for row in rows])
+    await cursor.close()
+
+
+async def _migrate_9(db):
+    """Индекс для /list по сроку внутри группы; бессрочные доступы — в конце."""
+    await db.execute(f"CREATE INDEX idx_access_group_expiry ON access (group_id, {EXPIRY_KEY}, user_id)")
+
+
+MIGRATIONS = [
+    _migrate_1, _migrate_2, _migrate_3, _migrate_4, _migrate_5, _migrate_6, _migrate_7, _migrate_8, _migrate_9
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
 
 # ------------------- ИНИЦИАЛИЗАЦИЯ БД -------------------
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Таблица активных доступов
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS access (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            expires_at TEXT,
-            posts_today INTEGER DEFAULT 0,
-            last_post_date TEXT,
-            max_posts INTEGER DEFAULT 3
-        )
-        """)
-
-        # Таблица заявок
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS requests (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            requested_at TEXT
-        )
-        """)
-
-        await db.commit()
\ No newline at end of file
+    """Создаёт базу или доводит существующую до SCHEMA_VERSION."""
+    async with _write_lock:
+        while True:
+            # IMMEDIATE: второй экземпляр, запущенный одновременно, ждёт
+            # и затем видит уже обновлённую версию
+            await _writer.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = await _writer.execute("PRAGMA user_version")
+                version = (await cursor.fetchone())[0]
+                await cursor.close()
+                if version > SCHEMA_VERSION:
+                    raise RuntimeError(
+                        f"Схема БД версии {version} новее, чем знает этот код ({SCHEMA_VERSION})"
+                    )
+                if version == SCHEMA_VERSION:
+                    await _writer.commit()
+                    return
+                await MIGRATIONS[version](_writer)
+                await _writer.execute(f"PRAGMA user_version = {version + 1}")
+                await _writer.commit()
+            except BaseException:
+                await _writer.rollback()
+                raise
+            log.info("Схема БД обновлена до версии %s", version + 1)
+
+
+# ------------------- ГРУППЫ -------------------
+GROUP_COLUMNS = "group_id, title, access_days, max_posts, admin_contact, warning_ttl"
+
+
+@timed_query
+async def list_groups() -> list[GroupPolicy]:
+    rows = await fetch_all(f"SELECT {GROUP_COLUMNS} FROM groups ORDER BY group_id")
+    return [GroupPolicy(*row) for row in rows]
+
+
+@timed_query
+async def save_group(policy):
+    await execute(f"REPLACE INTO groups ({GROUP_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", tuple(policy))
+
+
+@timed_query
+async def delete_group(group_id) -> bool:
+    """Группа больше не модерируется; доступы в ней остаются до своего срока."""
+    return await execute("DELETE FROM groups WHERE group_id=?", (group_id,)) > 0
+
+
+# ------------------- ДОСТУПЫ -------------------
+# Доступ выдаётся в конкретной группе: ключ записи — (group_id, user_id).
+@timed_query
+async def get_access(group_id, user_id) -> Optional[AccessRow]:
+    row = await fetch_one(f"SELECT {ACCESS_COLUMNS} FROM access WHERE group_id=? AND user_id=?", (group_id, user_id))
+    return _access_row(row) if row else None
+
+
+@timed_query
+async def list_access() -> list[AccessRow]:
+    """Доступы во всех группах."""
+    rows = await fetch_all(f"SELECT {ACCESS_COLUMNS} FROM access")
+    return [_access_row(row) for row in rows]
+
+
+# ------------------- ПОСТРАНИЧНЫЙ СПИСОК -------------------
+def _filter_sql(group_id, flt):
+    """Группа и AccessFilter → условие WHERE и параметры."""
+    clauses, params = ["group_id = ?"], [group_id]
+    if flt is None:
+        return clauses, params
+    if flt.expiring_days is not None:
+        clauses.append("expires_at <= ?")
+        params.append(_ts(flt.now + timedelta(days=flt.expiring_days)))
+    if flt.at_limit:
+        clauses.append("CASE WHEN quota_day = ? THEN posts_today ELSE 0 END >= max_posts")
+        params.append(day_index(flt.now))
+    if flt.username_prefix:
+        # username хранится и с «@», и без него
+        pattern = flt.username_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        clauses.append("(username LIKE ? ESCAPE '\\' OR username LIKE ? ESCAPE '\\')")
+        params.extend([pattern, "@" + pattern])
+    return clauses, params
+
+
+# Бессрочный доступ (expires_at IS NULL) в сортировке по сроку — после всех сроков.
+# Выражение совпадает с индексом idx_access_group_expiry буквально, иначе SQLite его не возьмёт.
+NO_EXPIRY = 9223372036854775807
+EXPIRY_KEY = f"COALESCE(expires_at, {NO_EXPIRY})"
+
+
+@timed_query
+async def iter_access_page(group_id, flt=None, by_expiry=False, anchor=None, backwards=False, limit=25):
+    """
+    Keyset-пагинация доступов группы по (user_id) или (срок, user_id).
+    anchor — (expires_at, user_id) крайней строки соседней страницы, как она была
+    показана: строку могли с тех пор продлить или удалить, страница от этого не съедет.
+    Строки читаются из курсора по одной, в памяти держится только текущая страница.
+    """
+    key = f"({EXPIRY_KEY}, user_id)" if by_expiry else "user_id"
+    clauses, args = _filter_sql(group_id, flt)
+    if anchor is not None:
+        expires_at, user_id = anchor
+        clauses.append(f"{key} {'<' if backwards else '>'} {'(?, ?)' if by_expiry else '?'}")
+        args.extend([NO_EXPIRY if expires_at is None else _ts(expires_at), user_id] if by_expiry else [user_id])
+
+    order = "DESC" if backwards else "ASC"
+    order_by = f"{EXPIRY_KEY} {order}, user_id {order}" if by_expiry else f"user_id {order}"
+    sql = f"SELECT {ACCESS_COLUMNS} FROM access WHERE {' AND '.join(clauses)} ORDER BY {order_by} LIMIT ?"
+    args.append(limit)
+
+    async with reader() as db:
+        async with db.execute(sql, args) as cursor:
+            async for row in cursor:
+                yield _access_row(row)
+
+
+@timed_query
+async def list_deadlines() -> list[tuple[tuple[int, int], datetime]]:
+    """((group_id, user_id), срок) всех доступов со сроком — для очереди истечения."""
+    rows = await fetch_all(
+        "SELECT group_id, user_id, expires_at FROM access WHERE expires_at IS NOT NULL ORDER BY expires_at"
+    )
+    return [((group_id, user_id), _dt(expires_at)) for group_id, user_id, expires_at in rows]
+
+
+@timed_query
+async def expire_access(keys, now) -> list[tuple[int, int, Optional[str]]]:
+    """
+    Удаляет истёкшие доступы [(group_id, user_id)] одной транзакцией.
+    Повторно сверяет expires_at — на случай, если доступ успели продлить.
+    """
+    expired = []
+    async with transaction() as db:
+        for i in range(0, len(keys), 250):
+            chunk = keys[i:i + 250]
+            placeholders = ", ".join(["(?, ?)"] * len(chunk))
+            cursor = await db.execute(
+                f"DELETE FROM access WHERE (group_id, user_id) IN (VALUES {placeholders}) AND expires_at <= ? "
+                f"RETURNING group_id, user_id, username",
+                (*(value for key in chunk for value in key), _ts(now))
+            )
+            expired.extend(await cursor.fetchall())
+            await cursor.close()
+    return expired
+
+
+@timed_query
+async def grant_access(group_id, user_id, username, expires_at, max_posts):
+    """Выдаёт доступ в группе и удаляет заявку пользователя в одной транзакции."""
+    async with transaction() as db:
+        await _grant(db, group_id, user_id, username, expires_at, max_posts)
+
+
+async def _grant(db, group_id, user_id, username, expires_at, max_posts):
+    await db.execute(
+        """
+        REPLACE INTO access (group_id, user_id, username, expires_at, posts_today, last_post_date, max_posts)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (group_id, user_id, username, _ts(expires_at), 0, None, max_posts)
+    )
+    await db.execute("DELETE FROM requests WHERE user_id=?", (user_id,))
+
+
+@timed_query
+async def delete_access(group_id, user_id) -> bool:
+    return await execute("DELETE FROM access WHERE group_id=? AND user_id=?", (group_id, user_id)) > 0
+
+
+@timed_query
+async def set_expires(group_id, user_id, expires_at):
+    await execute(
+        "UPDATE access SET expires_at=? WHERE group_id=? AND user_id=?", (_ts(expires_at), group_id, user_id)
+    )
+
+
+@timed_query
+async def set_max_posts(group_id, user_id, max_posts):
+    await execute("UPDATE access SET max_posts=? WHERE group_id=? AND user_id=?", (max_posts, group_id, user_id))
+
+
+@timed_query
+async def reset_posts(group_id, user_id=None):
+    if user_id is None:
+        await execute("UPDATE access SET posts_today = 0 WHERE group_id = ?", (group_id,))
+    else:
+        await execute("UPDATE access SET posts_today = 0 WHERE group_id = ? AND user_id = ?", (group_id, user_id))
+
+
+# ------------------- МАССОВЫЕ ОПЕРАЦИИ -------------------
+# Вся пачка — одна транзакция: сначала выбираются существующие доступы группы,
+# затем изменения пишутся одним executemany. Отсутствующие ID просто не попадают в результат.
+async def _existing(db, group_id, user_ids, columns="user_id, username"):
+    rows = []
+    for i in range(0, len(user_ids), 500):
+        chunk = user_ids[i:i + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        cursor = await db.execute(
+            f"SELECT {columns} FROM access WHERE group_id = ? AND user_id IN ({placeholders})", (group_id, *chunk)
+        )
+        rows.extend(await cursor.fetchall())
+        await cursor.close()
+    return rows
+
+
+@timed_query
+async def filter_user_ids(group_id, flt) -> list[int]:
+    clauses, params = _filter_sql(group_id, flt)
+    rows = await fetch_all(f"SELECT user_id FROM access WHERE {' AND '.join(clauses)} ORDER BY user_id", params)
+    return [row[0] for row in rows]
+
+
+@timed_query
+async def extend_access_many(group_id, user_ids, days, now) -> list[tuple[int, Optional[str], datetime]]:
+    """Продлевает доступы на days дней от текущего срока (или от now, если срок уже прошёл)."""
+    extended = []
+    async with transaction() as db:
+        for user_id, username, expires_at in await _existing(db, group_id, user_ids, "user_id, username, expires_at"):
+            base = _dt(expires_at) if expires_at is not None else now
+            extended.append((user_id, username, max(base, now) + timedelta(days=days)))
+        await db.executemany(
+            "UPDATE access SET expires_at=? WHERE group_id=? AND user_id=?",
+            [(_ts(expires), group_id, user_id) for user_id, _, expires in extended]
+        )
+    return extended
+
+
+@timed_query
+async def set_max_posts_many(group_id, user_ids, max_posts) -> list[tuple[int, Optional[str]]]:
+    async with transaction() as db:
+        found = await _existing(db, group_id, user_ids)
+        await db.executemany(
+            "UPDATE access SET max_posts=? WHERE group_id=? AND user_id=?",
+            [(max_posts, group_id, user_id) for user_id, _ in found]
+        )
+    return found
+
+
+@timed_query
+async def reset_posts_many(group_id, user_ids) -> list[tuple[int, Optional[str]]]:
+    async with transaction() as db:
+        found = await _existing(db, group_id, user_ids)
+        await db.executemany(
+            "UPDATE access SET posts_today = 0 WHERE group_id = ? AND user_id = ?",
+            [(group_id, user_id) for user_id, _ in found]
+        )
+    return found
+
+
+@timed_query
+async def delete_access_many(group_id, user_ids) -> list[tuple[int, Optional[str]]]:
+    async with transaction() as db:
+        found = await _existing(db, group_id, user_ids)
+        await db.executemany(
+            "DELETE FROM access WHERE group_id=? AND user_id=?", [(group_id, user_id) for user_id, _ in found]
+        )
+    return found
+
+
+# ------------------- КВОТА ПОСТОВ -------------------
+# Смена дня, проверка лимита и увеличение счётчика — одним UPDATE.
+# Два одновременных сообщения не могут оба пройти последний свободный слот.
+# posts_today действителен только при quota_day = текущему дню, поэтому
+# ночной сброс не нужен: счётчик обнуляется при первом посте нового дня.
+_CONSUME_POST_SQL = """
+UPDATE access
+SET posts_today = CASE WHEN quota_day = :today THEN posts_today + 1 ELSE 1 END,
+    quota_day = :today,
+    last_post_date = :now,
+    username = :username
+WHERE group_id = :group_id AND user_id = :user_id
+  AND CASE WHEN quota_day = :today THEN posts_today ELSE 0 END < max_posts
+RETURNING posts_today, max_posts
+"""
+
+
+@timed_query
+async def consume_post(group_id, user_id, username, now) -> Optional[QuotaResult]:
+    """
+    Засчитывает пост в группе, если дневной лимит не исчерпан.
+    None — у пользователя нет доступа в этой группе.
+    """
+    params = {"group_id": group_id, "user_id": user_id, "username": username, "now": _ts(now), "today": day_index(now)}
+    async with transaction() as db:
+        cursor = await db.execute(_CONSUME_POST_SQL, params)
+        row = await cursor.fetchone()
+        await cursor.close()
+        if row:
+            return QuotaResult(True, row[0], row[1])
+
+        # отказ: читаем текущий счётчик в той же транзакции
+        cursor = await db.execute(
+            "SELECT posts_today, quota_day, max_posts FROM access WHERE group_id=? AND user_id=?", (group_id, user_id)
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+
+    if not row:
+        return None
+    posts_today, quota_day, max_posts = row
+    return QuotaResult(False, used_today(posts_today, quota_day, params["today"]), max_posts)
+
+
+# ------------------- ЗАЯВКИ -------------------
+# Ограничение «одна заявка в час» проверяется в памяти (services/throttle.py),
+# таблица нужна, чтобы оно переживало перезапуск.
+@timed_query
+async def list_requests_since(requested_at) -> list[tuple[int, datetime]]:
+    rows = await fetch_all("SELECT user_id, requested_at FROM requests WHERE requested_at > ?", (_ts(requested_at),))
+    return [(user_id, _dt(requested_at)) for user_id, requested_at in rows]
+
+
+@timed_query
+async def claim_request(user_id, username, now, cooldown) -> Optional[datetime]:
+    """
+    Записывает заявку, если прошлая старше cooldown секунд.
+    None — заявка принята, иначе время действующей заявки.
+    """
+    async with transaction() as db:
+        cursor = await db.execute(
+            """
+            INSERT INTO requests (user_id, username, requested_at) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, requested_at = excluded.requested_at
+            WHERE requests.requested_at <= ?
+            RETURNING user_id
+            """,
+            (user_id, username, _ts(now), _ts(now - timedelta(seconds=cooldown)))
+        )
+        claimed = await cursor.fetchone()
+        await cursor.close()
+        if claimed:
+            return None
+        cursor = await db.execute("SELECT requested_at FROM requests WHERE user_id=?", (user_id,))
+        row = await cursor.fetchone()
+        await cursor.close()
+    return _dt(row[0])
+
+
+_ADD_REQUEST = "REPLACE INTO requests (user_id, username, requested_at) VALUES (?, ?, ?)"
+
+
+@timed_query
+async def add_request(user_id, username, requested_at):
+    await execute(_ADD_REQUEST, (user_id, username, _ts(requested_at)))
+
+
+@timed_query
+async def delete_requests_before(requested_at):
+    await execute("DELETE FROM requests WHERE requested_at <= ?", (_ts(requested_at),))
+
+
+# ------------------- РЕШЕНИЯ ПО ЗАЯВКАМ -------------------
+DECISION_COLUMNS = "token, group_id, user_id, username, created_at, action, actor_id, decided_at"
+
+
+async def _load_decision(db, token) -> Optional[Decision]:
+    cursor = await db.execute(f"SELECT {DECISION_COLUMNS} FROM decisions WHERE token=?", (token,))
+    row = await cursor.fetchone()
+    await cursor.close()
+    if row is None:
+        return None
+    cursor = await db.execute("SELECT admin_id, message_id FROM decision_cards WHERE token=?", (token,))
+    cards = tuple(tuple(card) for card in await cursor.fetchall())
+    await cursor.close()
+    token, group_id, user_id, username, created_at, action, actor_id, decided_at = row
+    return Decision(token, group_id, user_id, username, _dt(created_at), action, actor_id, _dt(decided_at), cards)
+
+
+@timed_query
+async def open_decision(token, group_id, user_id, username, now):
+    """Регистрирует заявку на доступ в группе; повторная регистрация того же token ничего не меняет."""
+    await execute(
+        "INSERT OR IGNORE INTO decisions (token, group_id, user_id, username, created_at) VALUES (?, ?, ?, ?, ?)",
+        (token, group_id, user_id, username, _ts(now))
+    )
+
+
+@timed_query
+async def add_decision_cards(token, cards) -> Optional[Decision]:
+    """Запоминает карточки [(admin_id, message_id)] и возвращает заявку — вдруг её уже решили."""
+    async with transaction() as db:
+        await db.executemany(
+            "REPLACE INTO decision_cards (token, admin_id, message_id) VALUES (?, ?, ?)",
+            [(token, admin_id, message_id) for admin_id, message_id in cards]
+        )
+        return await _load_decision(db, token)
+
+
+@timed_query
+async def get_decision(token) -> Optional[Decision]:
+    async with reader() as db:
+        return await _load_decision(db, token)
+
+
+@timed_query
+async def decide(token, action, actor_id, now, expires_at=None, max_posts=None) -> tuple[Optional[Decision], bool]:
+    """
+    Применяет первое решение по заявке одной транзакцией: "approve" выдаёт
+    доступ в группе заявки до expires_at, "deny" записывает заявку (отсчёт REQUEST_COOLDOWN).
+    Возвращает (заявка, True), если решение принято этим вызовом,
+    (заявка, False), если её уже решили, и (None, False), если заявки нет.
+    """
+    async with transaction() as db:
+        cursor = await db.execute(
+            """
+            UPDATE decisions SET action = ?, actor_id = ?, decided_at = ?
+            WHERE token = ? AND action IS NULL
+            RETURNING group_id, user_id, username
+            """,
+            (action, actor_id, _ts(now), token)
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+        if row is not None:
+            group_id, user_id, username = row
+            if action == "approve":
+                await _grant(db, group_id, user_id, username, expires_at, max_posts)
+            else:
+                await db.execute(_ADD_REQUEST, (user_id, username, _ts(now)))
+        return await _load_decision(db, token), row is not None
+
+
+@timed_query
+async def delete_decisions_before(created_at):
+    async with transaction() as db:
+        await db.execute(
+            "DELETE FROM decision_cards WHERE token IN (SELECT token FROM decisions WHERE created_at < ?)",
+            (_ts(created_at),)
+        )
+        await db.execute("DELETE FROM decisions WHERE created_at < ?", (_ts(created_at),))
+
+
+# ------------------- АРЕНДЫ ФОНОВЫХ ЗАДАЧ -------------------
+@timed_query
+async def acquire_lease(name, owner, ttl) -> bool:
+    """Берёт или продлевает аренду на ttl секунд. False — она у другого экземпляра."""
+    now = time.time()
+    async with transaction() as db:
+        cursor = await db.execute(
+            """
+            INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE leases.owner = excluded.owner OR leases.expires_at <= ?
+            RETURNING owner
+            """,
+            (name, owner, now + ttl, now)
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+    return row is not None
+
+
+@timed_query
+async def release_lease(name, owner):
+    await execute("DELETE FROM leases WHERE name=? AND owner=?", (name, owner))
+
+
+# ------------------- СОСТОЯНИЕ МЕЖДУ ПЕРЕЗАПУСКАМИ -------------------
+@timed_query
+async def get_state(name) -> Optional[str]:
+    row = await fetch_one("SELECT value FROM state WHERE name=?", (name,))
+    return row[0] if row else None
+
+
+@timed_query
+async def set_state(name, value):
+    await execute("REPLACE INTO state (name, value) VALUES (?, ?)", (name, value))
+
+
+# ------------------- ОТПЕЧАТКИ ПОСТОВ -------------------
+# INTEGER в SQLite — 64 бита со знаком, хэши хранятся в дополнительном коде
+def _signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+@timed_query
+async def add_fingerprints(entries):
+    await executemany(
+        "INSERT INTO fingerprints (at, exact, simhash, user_id, chat_id, message_id) VALUES (?, ?, ?, ?, ?, ?)",
+        [(_ts(entry.at), _signed(entry.exact), _signed(entry.simhash), *entry[3:]) for entry in entries]
+    )
+
+
+@timed_query
+async def iter_fingerprints(since):
+    """Отпечатки с since (включительно) в порядке записи."""
+    async with reader() as db:
+        async with db.execute(
+            "SELECT at, exact, simhash, user_id, chat_id, message_id FROM fingerprints WHERE at >= ? ORDER BY at, id",
+            (_ts(since),)
+        ) as cursor:
+            async for at, exact, value, *rest in cursor:
+                yield Fingerprint(_dt(at), _unsigned(exact), _unsigned(value), *rest)
+
+
+@timed_query
+async def delete_fingerprints_before(before) -> int:
+    return await execute("DELETE FROM fingerprints WHERE at < ?", (_ts(before),))
+
+
+# ------------------- ЖУРНАЛ СОБЫТИЙ -------------------
+EVENT_COLUMNS = "at, kind, user_id, username, actor_id, chat_id, message_id, detail"
+
+
+@timed_query
+async def append_events(events):
+    """Пачка событий и счётчики сводки по ним — одна транзакция."""
+    async with transaction() as db:
+        await db.executemany(
+            f"INSERT INTO events ({EVENT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(_ts(event.at), *event[1:]) for event in events]
+        )
+        await _add_stats(db, events)
+
+
+@timed_query
+async def iter_events(since, until=None, user_id=None, kinds=None):
+    """События с since (включительно) по until (не включительно, None — по сей момент) в порядке записи."""
+    clauses, params = ["at >= ?"], [_ts(since)]
+    if until is not None:
+        clauses.append("at < ?")
+        params.append(_ts(until))
+    if user_id is not None:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if kinds:
+        clauses.append(f"kind IN ({', '.join('?' * len(kinds))})")
+        params.extend(kinds)
+    sql = f"SELECT {EVENT_COLUMNS} FROM events WHERE {' AND '.join(clauses)} ORDER BY at, id"
+
+    async with reader() as db:
+        async with db.execute(sql, params) as cursor:
+            async for row in cursor:
+                yield Event(_dt(row[0]), *row[1:])
+
+
+@timed_query
+async def delete_events_before(before) -> int:
+    return await execute("DELETE FROM events WHERE at < ?", (_ts(before),))
+
+
+# ------------------- СВОДКА -------------------
+# Счётчики событий журнала по группам, дням (day_index) и пользователям.
+# Пишутся вместе с пачкой событий и не удаляются с журналом (JOURNAL_RETENTION_DAYS).
+# В stats_days хранится нарастающий итог: сколько событий вида kind было
+# с начала учёта по день day включительно. Тогда сумма за любой период —
+# разность двух итогов, то есть два поиска по индексу, а не обход дней.
+def rollup(events):
+    """({(group_id, kind, день): событий}, {(group_id, user_id, kind): событий}) для пачки журнала."""
+    days, users = Counter(), Counter()
+    for event in events:
+        if event.chat_id is None:
+            continue
+        days[event.chat_id, event.kind, day_index(event.at)] += 1
+        if event.user_id is not None:
+            users[event.chat_id, event.user_id, event.kind] += 1
+    return days, users
+
+
+async def _add_stats(db, events):
+    days, users = rollup(events)
+    for (group_id, kind, day), count in days.items():
+        # итог нового дня начинается с итога предыдущего дня, где были события этого вида;
+        # событие задним числом (пачка пришла после полуночи) увеличивает и итоги следующих дней
+        await db.execute(
+            "INSERT OR IGNORE INTO stats_days (group_id, kind, day, total) VALUES (?, ?, ?, COALESCE(("
+            "SELECT total FROM stats_days WHERE group_id=? AND kind=? AND day<? ORDER BY day DESC LIMIT 1), 0))",
+            (group_id, kind, day, group_id, kind, day)
+        )
+        await db.execute(
+            "UPDATE stats_days SET total = total + ? WHERE group_id=? AND kind=? AND day>=?",
+            (count, group_id, kind, day)
+        )
+    await db.executemany(
+        "INSERT INTO stats_users (group_id, user_id, kind, total) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (group_id, user_id, kind) DO UPDATE SET total = total + excluded.total",
+        [(*key, count) for key, count in users.items()]
+    )
+
+
+_TOTAL_AT = "(SELECT total FROM stats_days WHERE group_id=? AND kind=column1 AND day<=? ORDER BY day DESC LIMIT 1)"
+
+
+@timed_query
+async def stats_totals(group_id, first_day, last_day, kinds) -> dict[str, int]:
+    """Событий каждого вида в группе с first_day по last_day включительно (номера дней — day_index)."""
+    rows = await fetch_all(
+        f"SELECT column1, COALESCE({_TOTAL_AT}, 0) - COALESCE({_TOTAL_AT}, 0) "
+        f"FROM (VALUES {', '.join(['(?)'] * len(kinds))})",
+        (group_id, last_day, group_id, first_day - 1, *kinds)
+    )
+    return dict(rows)
+
+
+@timed_query
+async def iter_stats_days(group_id, first_day, last_day, kinds):
+    """(день, {kind: событий}) по дням периода, в которые что-то было, по порядку."""
+    before = await stats_totals(group_id, 0, first_day - 1, kinds)  # итоги накануне периода
+    rows = await fetch_all(
+        f"SELECT day, kind, total FROM stats_days WHERE group_id=? AND day BETWEEN ? AND ? "
+        f"AND kind IN ({', '.join('?' * len(kinds))}) ORDER BY day",
+        (group_id, first_day, last_day, *kinds)
+    )
+    current, counts = None, {}
+    for day, kind, total in rows:
+        if day != current:
+            if current is not None:
+                yield current, counts
+            current, counts = day, dict.fromkeys(kinds, 0)
+        counts[kind] = total - before[kind]
+        before[kind] = total
+    if current is not None:
+        yield current, counts
+
+
+@timed_query
+async def user_stats(group_id, user_id) -> dict[str, int]:
+    """Событий каждого вида с пользователем в группе за всё время учёта."""
+    rows = await fetch_all("SELECT kind, total FROM stats_users WHERE group_id=? AND user_id=?", (group_id, user_id))
+    return dict(rows)
@@ -1,13 +1,170 @@
-import aiosqlite
-from datetime import datetime, timedelta, timezone
+import csv
+import html
+import io
+import logging
+from collections import deque
+from contextlib import aclosing
+from datetime import date, datetime, timedelta, timezone
 from aiogram import types
+from aiogram.exceptions import TelegramAPIError
 from aiogram.filters import Command
+from aiogram.types import BufferedInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from config import dp, bot, ADMIN_IDS, DB_PATH
+from storage import store, AccessFilter
+from config import dp, bot, ADMIN_IDS, LIST_PAGE_SIZE
+from services.access_cache import access_cache
+from services.expiry import expiry_queue
+from services.outbox import outbox
+from services.updates import scheduler
+from services.maintenance import maintenance, format_size
+from services.groups import groups, default_policy
+from services import journal as events
+from services.journal import journal
+from services.metrics import registry
+from services.quota import DAY_TZ, day_index, used_today
+
+log = logging.getLogger(__name__)
+
+
+# ------------------- ВЫБОР ГРУППЫ -------------------
+# Команды доступа действуют в одной группе. Её можно указать первым
+# аргументом — g<group_id>, например /extend g-1001234567890 42 30;
+# без него команда относится к группе по умолчанию (GROUP_ID или единственной).
+def split_group(args):
+    """(GroupPolicy или None, остальные аргументы)."""
+    if args and args[0].startswith("g"):
+        try:
+            group_id = int(args[0][1:])
+        except ValueError:
+            pass
+        else:
+            # группа, которую перестали модерировать, — её доступами всё ещё можно управлять
+            return groups.get(group_id) or default_policy(group_id), args[1:]
+    return groups.default(), args
+
+
+async def command_group(message, args):
+    """Как split_group; если группу не выбрать, админу уже отправлено пояснение."""
+    policy, rest = split_group(args)
+    if policy is None:
+        await message.answer(
+            "⚠️ Групп несколько — укажите первым аргументом g<code>group_id</code> (список — /groups).",
+            parse_mode="HTML"
+        )
+    return policy, rest
 
 
 # ------------------- КОМАНДА /list -------------------
+# Страница должна помещаться в одно сообщение (лимит Telegram — 4096 символов)
+LIST_PAGE_CHARS = 3500
+LIST_MAX_DAYS = 9999  # exp N — не больше четырёх цифр в callback_data
+DIGITS36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def parse_list_filter(args):
+    """
+    /list [exp N] [full] [@prefix] → компактная строка фильтра для callback_data,
+    например "e3,f,uivan". None — аргументы не разобраны.
+    """
+    parts = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "exp" and i + 1 < len(args) and args[i + 1].isdigit():
+            parts.append(f"e{min(int(args[i + 1]), LIST_MAX_DAYS)}")
+            i += 1
+        elif arg == "full":
+            parts.append("f")
+        elif arg.startswith("@") and len(arg) > 1:
+            # вместе с group_id и курсором строка должна уложиться в 64 байта callback_data
+            parts.append(f"u{arg[1:16]}")
+        else:
+            return None
+        i += 1
+    return ",".join(parts)
+
+
+def list_filter(spec, now):
+    expiring_days, at_limit, prefix = None, False, None
+    for part in filter(None, spec.split(",")):
+        if part[0] == "e":
+            expiring_days = int(part[1:])
+        elif part == "f":
+            at_limit = True
+        elif part[0] == "u":
+            prefix = part[1:]
+    # для «истекающих» удобнее сортировка по сроку
+    return AccessFilter(expiring_days, at_limit, prefix, now), expiring_days is not None
+
+
+def encode_anchor(row):
+    """
+    Курсор страницы для callback_data: срок и user_id крайней строки в base36,
+    "-" — бессрочный доступ. Срок берётся таким, каким строка была показана.
+    """
+    def b36(value):
+        digits = ""
+        while True:
+            value, digit = divmod(value, 36)
+            digits = DIGITS36[digit] + digits
+            if not value:
+                return digits
+
+    expires = "-" if row.expires_at is None else b36(int(row.expires_at.timestamp()))
+    return f"{expires}:{b36(row.user_id)}"
+
+
+def decode_anchor(expires, user_id):
+    expires_at = None if expires == "-" else datetime.fromtimestamp(int(expires, 36), timezone.utc)
+    return expires_at, int(user_id, 36)
+
+
+def format_access_row(row, today):
+    expires_str = row.expires_at.strftime("%d.%m.%Y %H:%M") if row.expires_at else "—"
+    return (
+        f"ID {row.user_id}, @{(row.username or '').lstrip('@') or 'без username'} — до {expires_str}, "
+        f"{used_today(row.posts_today, row.quota_day, today)}/{row.max_posts} постов сегодня\n"
+    )
+
+
+async def render_list_page(group_id, spec, anchor=None, backwards=False):
+    now = datetime.now(timezone.utc)
+    today = day_index(now)
+    flt, by_expiry = list_filter(spec, now)
+
+    rows, lines, length, has_more = [], [], 0, False
+    page = store.iter_access_page(group_id, flt, by_expiry, anchor, backwards, LIST_PAGE_SIZE + 1)
+    async with aclosing(page):
+        async for row in page:
+            line = format_access_row(row, today)
+            if len(rows) == LIST_PAGE_SIZE or length + len(line) > LIST_PAGE_CHARS:
+                has_more = True
+                break
+            rows.append(row)
+            lines.append(line)
+            length += len(line)
+
+    if not rows:
+        return f"📋 В группе «{groups.title(group_id, escape=False)}» нет активных пользователей.", None
+
+    if backwards:
+        rows.reverse()
+        lines.reverse()
+    has_prev = has_more if backwards else anchor is not None
+    has_next = True if backwards else has_more
+
+    kb = InlineKeyboardBuilder()
+    if has_prev:
+        kb.button(text="⬅️ Назад", callback_data=f"ls:{group_id}:p:{encode_anchor(rows[0])}:{spec}")
+    if has_next:
+        kb.button(text="Вперёд ➡️", callback_data=f"ls:{group_id}:n:{encode_anchor(rows[-1])}:{spec}")
+
+    title = f"📋 Активные пользователи группы «{groups.title(group_id, escape=False)}»"
+    title += (f" (фильтр: {spec})" if spec else "") + ":\n"
+    return title + "".join(lines), kb.as_markup() if has_prev or has_next else None
+
+
 @dp.message(Command("list"))
 async def list_access(message: types.Message):
     # Проверка админа
@@ -15,23 +172,175 @@ async def list_access(message: types.Message):
         await message.answer("⛔️ Команда доступна только администратору.")
         return
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(
-            "SELECT user_id, username, expires_at, posts_today, max_posts FROM access"
+    policy, args = await command_group(message, message.text.split()[1:])
+    if policy is None:
+        return
+    spec = parse_list_filter(args)
+    if spec is None:
+        await message.answer(
+            "⚠️ Использование: /list [g<code>group_id</code>] [exp <code>дней</code>] [full] [@<code>префикс</code>]",
+            parse_mode="HTML"
         )
-        rows = await cursor.fetchall()
+        return
 
-    if not rows:
-        await message.answer("📋 Нет активных пользователей.")
+    text, markup = await render_list_page(policy.group_id, spec)
+    await message.answer(text, reply_markup=markup, parse_mode=None)
+
+
+# ------------------- ЛИСТАНИЕ /list -------------------
+@dp.callback_query(lambda c: c.data.startswith("ls:"))
+async def list_page_callback(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ У вас нет прав для этой команды.", show_alert=True)
         return
 
-    text = "📋 Активные пользователи:\n"
-    for uid, username, expires, posts, max_posts in rows:
-        expires_dt = datetime.fromisoformat(expires)
-        expires_str = expires_dt.strftime("%d.%m.%Y %H:%M")
-        text += f"ID {uid}, @{username or 'без username'} — до {expires_str}, {posts}/{max_posts} постов сегодня\n"
+    try:
+        _, group_id, direction, expires, user_id, spec = callback.data.split(":", 5)
+        group_id, anchor = int(group_id), decode_anchor(expires, user_id)
+    except (ValueError, AttributeError, OverflowError):
+        await callback.answer("❌ Некорректные данные.")
+        return
+
+    text, markup = await render_list_page(group_id, spec, anchor, backwards=direction == "p")
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode=None)
+    await callback.answer()
+
+
+# ------------------- МАССОВЫЕ ОПЕРАЦИИ -------------------
+# /revoke, /reset_user, /extend и /setlimit принимают вместо одного user_id:
+#   несколько ID через пробел или запятую — /extend 1,2,3 30
+#   фильтр как у /list — /extend exp 3 30
+#   CSV-файл с ID в первой колонке, команда в подписи к файлу — /extend 30
+BULK_FILE_MAX_BYTES = 1 << 20
+BULK_SHOW_MISSING = 20  # сколько ненайденных ID перечислить в итоге
+
+
+def is_bulk(message, targets):
+    """Одиночная форма — ровно один числовой ID и никакого файла."""
+    return message.document is not None or len(targets) != 1 or not targets[0].isdigit()
 
-    await message.answer(text)
+
+async def read_csv_ids(message):
+    document = message.document
+    if document.file_size and document.file_size > BULK_FILE_MAX_BYTES:
+        await message.answer("⚠️ Файл слишком большой (не больше 1 МБ).")
+        return None
+
+    buffer = await bot.download(document)
+    text = buffer.read().decode("utf-8-sig", errors="replace")
+    delimiter = ";" if text.count(";") > text.count(",") else ","
+    # строки без числа в первой колонке (заголовок, пустые) пропускаются
+    return [int(row[0].strip()) for row in csv.reader(io.StringIO(text), delimiter=delimiter)
+            if row and row[0].strip().isdigit()]
+
+
+async def resolve_targets(message, group_id, targets):
+    """
+    Список user_id для массовой команды без повторов.
+    None — цели не разобраны, админу уже отправлено пояснение.
+    """
+    if message.document is not None:
+        user_ids = await read_csv_ids(message)
+        if user_ids is None:
+            return None
+    else:
+        tokens = " ".join(targets).replace(",", " ").split()
+        if tokens and all(token.isdigit() for token in tokens):
+            user_ids = [int(token) for token in tokens]
+        else:
+            spec = parse_list_filter(targets)
+            if not spec:
+                await message.answer(
+                    "⚠️ Укажите ID через пробел или запятую, фильтр "
+                    "(exp <code>дней</code>, full, @<code>префикс</code>) или приложите CSV-файл.",
+                    parse_mode="HTML"
+                )
+                return None
+            flt, _ = list_filter(spec, datetime.now(timezone.utc))
+            user_ids = await store.filter_user_ids(group_id, flt)
+
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        await message.answer("📋 Под условие не попал ни один пользователь.")
+        return None
+    return user_ids
+
+
+def bulk_summary(title, user_ids, done):
+    done_ids = {row[0] for row in done}
+    missing = [user_id for user_id in user_ids if user_id not in done_ids]
+    text = f"{title}: {len(done)} из {len(user_ids)}"
+    if missing:
+        shown = ", ".join(map(str, missing[:BULK_SHOW_MISSING]))
+        if len(missing) > BULK_SHOW_MISSING:
+            shown += f" и ещё {len(missing) - BULK_SHOW_MISSING}"
+        text += f"\n⚠️ Не найдены в базе ({len(missing)}): {shown}"
+    return text
+
+
+async def bulk_revoke(message, group_id, targets):
+    user_ids = await resolve_targets(message, group_id, targets)
+    if user_ids is None:
+        return
+
+    revoked = await store.delete_access_many(group_id, user_ids)
+    title = groups.title(group_id)
+    for user_id, username in revoked:
+        journal.record(events.REVOKED, user_id, username, actor_id=message.from_user.id, chat_id=group_id)
+        access_cache.remove(group_id, user_id)
+        expiry_queue.cancel((group_id, user_id))
+        outbox.send(user_id, f"⛔️ Ваш доступ в группе «{title}» был досрочно удалён администратором.")
+
+    await message.answer(bulk_summary(f"✅ Доступ в группе «{title}» удалён", user_ids, revoked))
+
+
+async def bulk_reset(message, group_id, targets):
+    user_ids = await resolve_targets(message, group_id, targets)
+    if user_ids is None:
+        return
+
+    reset = await store.reset_posts_many(group_id, user_ids)
+    for user_id, username in reset:
+        journal.record(events.POSTS_RESET, user_id, username, actor_id=message.from_user.id, chat_id=group_id)
+        access_cache.reset(group_id, user_id)
+
+    await message.answer(bulk_summary(f"✅ Счётчик в группе «{groups.title(group_id)}» сброшен", user_ids, reset))
+
+
+async def bulk_extend(message, group_id, targets, days):
+    user_ids = await resolve_targets(message, group_id, targets)
+    if user_ids is None:
+        return
+
+    extended = await store.extend_access_many(group_id, user_ids, days, datetime.now(timezone.utc))
+    title = groups.title(group_id)
+    for user_id, username, new_expires in extended:
+        journal.record(
+            events.EXTENDED, user_id, username, actor_id=message.from_user.id, chat_id=group_id,
+            detail=new_expires.isoformat()
+        )
+        access_cache.set_expires(group_id, user_id, new_expires)
+        expiry_queue.schedule((group_id, user_id), new_expires)
+        outbox.send(user_id, f"⏳ Ваш доступ в группе «{title}» был продлён до {new_expires.strftime('%d.%m.%Y %H:%M')}")
+
+    await message.answer(bulk_summary(f"✅ Доступ в группе «{title}» продлён на {days} дн.", user_ids, extended))
+
+
+async def bulk_set_limit(message, group_id, targets, new_limit):
+    user_ids = await resolve_targets(message, group_id, targets)
+    if user_ids is None:
+        return
+
+    updated = await store.set_max_posts_many(group_id, user_ids, new_limit)
+    title = groups.title(group_id)
+    for user_id, username in updated:
+        journal.record(
+            events.LIMIT_CHANGED, user_id, username, actor_id=message.from_user.id, chat_id=group_id, detail=new_limit
+        )
+        access_cache.set_limit(group_id, user_id, new_limit)
+        outbox.send(user_id, f"📢 Ваш лимит постов в группе «{title}» изменён: теперь {new_limit}.")
+
+    await message.answer(bulk_summary(f"✅ Лимит в группе «{title}» изменён на {new_limit}", user_ids, updated))
 
 
 # ------------------- КОМАНДА /revoke -------------------
@@ -42,34 +351,43 @@ async def revoke_access(message: types.Message):
         await message.answer("⛔️ Команда доступна только администратору.")
         return
 
-    args = message.text.split()
-    if len(args) < 2:
-        await message.answer("❗️ Использование: /revoke `user_id`", parse_mode="Markdown")
+    policy, args = await command_group(message, (message.text or message.caption).split()[1:])
+    if policy is None:
+        return
+    group_id = policy.group_id
+    if not args and message.document is None:
+        await message.answer("❗️ Использование: /revoke [g`group_id`] `user_id`", parse_mode="Markdown")
+        return
+
+    if is_bulk(message, args):
+        await bulk_revoke(message, group_id, args)
         return
 
     try:
-        user_id_to_revoke = int(args[1])
+        user_id_to_revoke = int(args[0])
     except ValueError:
         await message.answer("❗️ Укажите правильный ID пользователя.")
         return
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Проверяем, есть ли доступ у пользователя
-        cursor = await db.execute("SELECT username FROM access WHERE user_id=?", (user_id_to_revoke,))
-        row = await cursor.fetchone()
-
-        if not row:
-            await message.answer(f"⚠️ У пользователя с ID {user_id_to_revoke} нет активного доступа.")
-            return
+    # Проверяем, есть ли доступ у пользователя
+    row = await store.get_access(group_id, user_id_to_revoke)
+    if not row:
+        await message.answer(
+            f"⚠️ У пользователя с ID {user_id_to_revoke} нет активного доступа в группе «{groups.title(group_id)}»."
+        )
+        return
 
-        username = row[0] or f"id{user_id_to_revoke}"
-        # Удаляем доступ
-        await db.execute("DELETE FROM access WHERE user_id=?", (user_id_to_revoke,))
-        await db.commit()
+    username = row.username or f"id{user_id_to_revoke}"
+    # Удаляем доступ
+    await store.delete_access(group_id, user_id_to_revoke)
+    journal.record(events.REVOKED, user_id_to_revoke, row.username, actor_id=message.from_user.id, chat_id=group_id)
+    access_cache.remove(group_id, user_id_to_revoke)
+    expiry_queue.cancel((group_id, user_id_to_revoke))
 
     # Уведомляем пользователя и администратора
-    await bot.send_message(user_id_to_revoke, "⛔️ Ваш доступ был досрочно удалён администратором.")
-    await message.answer(f"✅ Доступ пользователя @{username} (ID {user_id_to_revoke}) был удалён.")
+    title = groups.title(group_id)
+    outbox.send(user_id_to_revoke, f"⛔️ Ваш доступ в группе «{title}» был досрочно удалён администратором.")
+    await message.answer(f"✅ Доступ пользователя @{username} (ID {user_id_to_revoke}) в группе «{title}» был удалён.")
 
 
 # ------------------- СБРОС У КОНКРЕТНОГО ПОЛЬЗОВАТЕЛЯ -------------------
@@ -79,29 +397,36 @@ async def reset_user(message: types.Message):
         await message.answer("❌ У вас нет прав для этой команды.")
         return
 
-    args = message.text.split()
-    if len(args) < 2:
+    policy, args = await command_group(message, (message.text or message.caption).split()[1:])
+    if policy is None:
+        return
+    group_id = policy.group_id
+    if not args and message.document is None:
         await message.answer(
-            "⚠️ Использование: /reset_user <code>user_id</code>",
+            "⚠️ Использование: /reset_user [g<code>group_id</code>] <code>user_id</code>",
             parse_mode="HTML"
         )
         return
 
+    if is_bulk(message, args):
+        await bulk_reset(message, group_id, args)
+        return
+
     try:
-        user_id = int(args[1])
+        user_id = int(args[0])
     except ValueError:
         await message.answer("⚠️ user_id должен быть числом.")
         return
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE access SET posts_today = 0 WHERE user_id = ?", (user_id,))
-        await db.commit()
-
-        cursor = await db.execute("SELECT user_id, username FROM access WHERE user_id = ?", (user_id,))
-        row = await cursor.fetchone()
+    await store.reset_posts(group_id, user_id)
+    access_cache.reset(group_id, user_id)
 
+    row = await store.get_access(group_id, user_id)
     if row:
-        await message.answer(f"✅ Счётчик для пользователя {row[1]} (ID: {row[0]}) сброшен.")
+        journal.record(events.POSTS_RESET, user_id, row.username, actor_id=message.from_user.id, chat_id=group_id)
+        await message.answer(
+            f"✅ Счётчик для пользователя {row.username} (ID: {row.user_id}) в группе «{groups.title(group_id)}» сброшен."
+        )
     else:
         await message.answer("⚠️ Пользователь с таким ID не найден в базе.")
 
@@ -113,18 +438,22 @@ async def reset_all(message: types.Message):
         await message.answer("❌ У вас нет прав для этой команды.")
         return
 
+    policy, _ = await command_group(message, message.text.split()[1:])
+    if policy is None:
+        return
+
     kb = InlineKeyboardBuilder()
-    kb.button(text="✅ Подтвердить сброс", callback_data="confirm_reset_all")
+    kb.button(text="✅ Подтвердить сброс", callback_data=f"confirm_reset_all:{policy.group_id}")
     kb.button(text="❌ Отменить", callback_data="cancel_reset_all")
 
     await message.answer(
-        "⚠️ Вы уверены, что хотите сбросить счётчики у всех пользователей?",
+        f"⚠️ Вы уверены, что хотите сбросить счётчики у всех пользователей группы «{groups.title(policy.group_id)}»?",
         reply_markup=kb.as_markup()
     )
 
 
 # ------------------- CALLBACK ДЛЯ ПОДТВЕРЖДЕНИЯ СБРОСА У ВСЕХ-------------------
-@dp.callback_query(lambda c: c.data in ["confirm_reset_all", "cancel_reset_all"])
+@dp.callback_query(lambda c: c.data.split(":")[0] in ["confirm_reset_all", "cancel_reset_all"])
 async def reset_all_callback(callback: types.CallbackQuery):
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ У вас нет прав для этой команды.", show_alert=True)
@@ -135,12 +464,20 @@ async def reset_all_callback(callback: types.CallbackQuery):
         await callback.answer()
         return
 
+    # кнопка без группы — отправлена до появления нескольких групп
+    _, _, group_id = callback.data.partition(":")
+    try:
+        group_id = int(group_id) if group_id else groups.default().group_id
+    except (ValueError, AttributeError):
+        await callback.answer("❌ Некорректные данные.")
+        return
+
     # выполняем сброс
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE access SET posts_today = 0")
-        await db.commit()
+    await store.reset_posts(group_id)
+    access_cache.reset_all(group_id)
+    journal.record(events.POSTS_RESET, actor_id=callback.from_user.id, chat_id=group_id, detail="all")
 
-    await callback.message.edit_text("✅ Счётчики у всех пользователей сброшены.")
+    await callback.message.edit_text(f"✅ Счётчики у всех пользователей группы «{groups.title(group_id)}» сброшены.")
     await callback.answer()
 
 
@@ -151,44 +488,57 @@ async def extend_access(message: types.Message):
         await message.answer("❌ У вас нет прав для этой команды.")
         return
 
-    args = message.text.split()
-    if len(args) < 3:
-        await message.answer("⚠️ Использование: /extend `user_id` `days`", parse_mode="Markdown")
+    policy, args = await command_group(message, (message.text or message.caption).split()[1:])
+    if policy is None:
+        return
+    group_id = policy.group_id
+    if len(args) < 2 and not (message.document is not None and len(args) == 1):
+        await message.answer("⚠️ Использование: /extend [g`group_id`] `user_id` `days`", parse_mode="Markdown")
+        return
+
+    if is_bulk(message, args[:-1]):
+        if not args[-1].isdigit() or int(args[-1]) <= 0:
+            await message.answer("❗️ days должно быть положительным числом.")
+            return
+        await bulk_extend(message, group_id, args[:-1], int(args[-1]))
         return
 
     try:
-        user_id = int(args[1])
-        days = int(args[2])
+        user_id = int(args[0])
+        days = int(args[1])
         if days <= 0:
             raise ValueError
     except ValueError:
         await message.answer("❗️ user_id и days должны быть положительными числами.")
         return
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("SELECT expires_at, username FROM access WHERE user_id=?", (user_id,))
-        row = await cursor.fetchone()
-
-        if not row:
-            await message.answer(f"⚠️ Пользователь с ID {user_id} не найден в базе.")
-            return
+    row = await store.get_access(group_id, user_id)
+    if not row:
+        await message.answer(f"⚠️ Пользователь с ID {user_id} не найден в группе «{groups.title(group_id)}».")
+        return
 
-        expires_at, username = row
-        now = datetime.now(timezone.utc)
-        if expires_at:
-            expires_dt = datetime.fromisoformat(expires_at)
-            if expires_dt < now:
-                expires_dt = now
-        else:
-            expires_dt = now
+    username = row.username
+    now = datetime.now(timezone.utc)
+    if row.expires_at and row.expires_at > now:
+        expires_dt = row.expires_at
+    else:
+        expires_dt = now
 
-        new_expires = expires_dt + timedelta(days=days)
+    new_expires = expires_dt + timedelta(days=days)
 
-        await db.execute("UPDATE access SET expires_at=? WHERE user_id=?", (new_expires.isoformat(), user_id))
-        await db.commit()
+    await store.set_expires(group_id, user_id, new_expires)
+    journal.record(
+        events.EXTENDED, user_id, username, actor_id=message.from_user.id, chat_id=group_id,
+        detail=new_expires.isoformat()
+    )
+    access_cache.set_expires(group_id, user_id, new_expires)
+    expiry_queue.schedule((group_id, user_id), new_expires)
 
-    await message.answer(f"✅ Доступ пользователя @{username or user_id} продлён до {new_expires.strftime('%d.%m.%Y %H:%M')}")
-    await bot.send_message(user_id, f"⏳ Ваш доступ был продлён до {new_expires.strftime('%d.%m.%Y %H:%M')}")
+    title = groups.title(group_id)
+    await message.answer(
+        f"✅ Доступ пользователя @{username or user_id} в группе «{title}» продлён до {new_expires.strftime('%d.%m.%Y %H:%M')}"
+    )
+    outbox.send(user_id, f"⏳ Ваш доступ в группе «{title}» был продлён до {new_expires.strftime('%d.%m.%Y %H:%M')}")
 
 
 # ------------------- Изменение лимита сообщений в день -------------------
@@ -198,32 +548,486 @@ async def set_limit(message: types.Message):
         await message.answer("❌ У вас нет прав для этой команды.")
         return
 
-    args = message.text.split()
-    if len(args) < 3:
-        await message.answer("⚠️ Использование: /setlimit `user_id` `limit`", parse_mode="Markdown")
+    policy, args = await command_group(message, (message.text or message.caption).split()[1:])
+    if policy is None:
+        return
+    group_id = policy.group_id
+    if len(args) < 2 and not (message.document is not None and len(args) == 1):
+        await message.answer("⚠️ Использование: /setlimit [g`group_id`] `user_id` `limit`", parse_mode="Markdown")
+        return
+
+    if is_bulk(message, args[:-1]):
+        if not args[-1].isdigit() or int(args[-1]) <= 0:
+            await message.answer("❗ limit должен быть положительным числом.")
+            return
+        await bulk_set_limit(message, group_id, args[:-1], int(args[-1]))
         return
 
     try:
-        user_id = int(args[1])
-        new_limit = int(args[2])
+        user_id = int(args[0])
+        new_limit = int(args[1])
         if new_limit <= 0:
             raise ValueError
     except ValueError:
         await message.answer("❗ user_id и limit должны быть положительными числами.")
         return
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("SELECT username FROM access WHERE user_id=?", (user_id,))
-        row = await cursor.fetchone()
-        if not row:
-            await message.answer(f"⚠️ Пользователь {user_id} не найден.")
+    row = await store.get_access(group_id, user_id)
+    if not row:
+        await message.answer(f"⚠️ Пользователь {user_id} не найден в группе «{groups.title(group_id)}».")
+        return
+
+    await store.set_max_posts(group_id, user_id, new_limit)
+    journal.record(
+        events.LIMIT_CHANGED, user_id, row.username, actor_id=message.from_user.id, chat_id=group_id, detail=new_limit
+    )
+    access_cache.set_limit(group_id, user_id, new_limit)
+
+    title = groups.title(group_id)
+    await message.answer(f"✅ Лимит постов для @{row.username or user_id} в группе «{title}» изменён на {new_limit}")
+    outbox.send(user_id, f"📢 Ваш лимит постов в группе «{title}» изменён: теперь {new_limit}.")
+
+
+# ------------------- Группы и их правила -------------------
+GROUP_SETTINGS = {
+    # слово в /group → (поле GroupPolicy, тип, минимальное значение)
+    "days": ("access_days", int, 1),
+    "posts": ("max_posts", int, 1),
+    "ttl": ("warning_ttl", float, 1),
+}
+
+
+def parse_group_settings(args, policy):
+    """
+    [days N] [posts N] [ttl N] [contact @user] [title Название…] → новые правила.
+    title забирает все слова до конца. None — аргументы не разобраны.
+    """
+    changes = {}
+    tokens = iter(args)
+    for token in tokens:
+        token = token.lower()
+        if token == "title":
+            changes["title"] = " ".join(tokens) or None
+        elif token == "contact":
+            changes["admin_contact"] = next(tokens, None)
+            if changes["admin_contact"] is None:
+                return None
+        elif token in GROUP_SETTINGS:
+            field, cast, minimum = GROUP_SETTINGS[token]
+            try:
+                value = cast(next(tokens, ""))
+            except ValueError:
+                return None
+            if value < minimum:
+                return None
+            changes[field] = value
+        else:
+            return None
+    return policy._replace(**changes)
+
+
+def format_policy(policy):
+    return (
+        f"«{groups.title(policy.group_id)}» (ID {policy.group_id}): доступ на {policy.access_days} дн., "
+        f"постов в день: {policy.max_posts}, предупреждение {policy.warning_ttl:g} с, "
+        f"контакт {html.escape(policy.admin_contact or '—')}"
+    )
+
+
+@dp.message(Command("groups"))
+async def list_groups(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам.")
+        return
+
+    if not len(groups):
+        await message.answer("📋 Бот не модерирует ни одной группы. Добавить — /group <code>group_id</code>")
+        return
+    default = groups.default()
+    lines = [
+        format_policy(policy) + (" — по умолчанию" if default and policy.group_id == default.group_id else "")
+        for policy in groups
+    ]
+    await message.answer("📋 Группы:\n\n" + "\n".join(lines))
+
+
+@dp.message(Command("group"))
+async def group_settings(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам.")
+        return
+
+    args = message.text.split()[1:]
+    try:
+        group_id = int(args[0])
+    except (IndexError, ValueError):
+        await message.answer(
+            "⚠️ Использование: /group <code>group_id</code> [days <code>N</code>] [posts <code>N</code>] "
+            "[ttl <code>сек</code>] [contact @<code>username</code>] [title <code>название</code>]\n"
+            "/group <code>group_id</code> off — перестать модерировать группу",
+            parse_mode="HTML"
+        )
+        return
+
+    if args[1:] == ["off"]:
+        title = groups.title(group_id)
+        if not await groups.remove(group_id):
+            await message.answer(f"⚠️ Группа {group_id} и так не модерируется.")
+            return
+        journal.record(events.GROUP_CHANGED, actor_id=message.from_user.id, chat_id=group_id, detail="off")
+        await message.answer(
+            f"✅ Группа «{title}» больше не модерируется. Выданные в ней доступы действуют до своего срока."
+        )
+        return
+
+    current = groups.get(group_id)
+    policy = parse_group_settings(args[1:], current or default_policy(group_id))
+    if policy is None:
+        await message.answer("⚠️ Не понял настройки. Пример: /group -1001234567890 days 14 posts 5 ttl 20", parse_mode=None)
+        return
+    if current is None and policy.title is None:
+        # название новой группы — из Telegram, если бот уже в ней
+        try:
+            policy = policy._replace(title=(await bot.get_chat(group_id)).title)
+        except TelegramAPIError as e:
+            log.warning("Не удалось получить название группы %s: %s", group_id, e)
+
+    await groups.save(policy)
+    journal.record(
+        events.GROUP_CHANGED, actor_id=message.from_user.id, chat_id=group_id,
+        detail=f"days={policy.access_days} posts={policy.max_posts} ttl={policy.warning_ttl:g} contact={policy.admin_contact}"
+    )
+    await message.answer(
+        ("✅ Группа добавлена: " if current is None else "✅ Правила обновлены: ") + format_policy(policy)
+        + "\n\nСрок и лимит применяются к новым заявкам, выданные доступы не меняются."
+    )
+
+
+# ------------------- Команда /stats -------------------
+STATS_SECTIONS = (
+    ("Хэндлеры", "handler_seconds", "handler"),
+    ("Запросы к БД", "db_query_seconds", "query"),
+    ("Bot API", "api_call_seconds", "method"),
+    ("Фоновые циклы", "scheduler_loop_seconds", "loop"),
+    ("Запуск", "startup_seconds", "phase"),
+)
+STATS_TOP = 8  # строк в разделе, самые нагруженные по суммарному времени
+
+
+def render_stats():
+    lines = []
+    if registry.enabled:
+        for title, name, label in STATS_SECTIONS:
+            rows = sorted(registry.histograms(name), key=lambda item: item[1].total, reverse=True)
+            if not rows:
+                continue
+            lines.append(f"<b>{title}</b>")
+            for labels, h in rows[:STATS_TOP]:
+                lines.append(
+                    f"<code>{labels.get(label, '?')}</code>: {h.count} шт., "
+                    f"ср. {h.total / h.count * 1000:.1f} мс, макс. {h.max * 1000:.1f} мс"
+                )
+            lines.append("")
+    else:
+        lines.append("ℹ️ Метрики выключены (METRICS_ENABLED=false).\n")
+
+    stats = scheduler.stats()
+    lines.append("<b>Очередь апдейтов</b>")
+    lines.append(
+        f"в очереди {stats['depth']}, в работе {stats['in_flight']}, ключей {stats['keys']}, "
+        f"обработано {stats['processed']}, ошибок {stats['failed']}, выброшено {stats['shed']}"
+    )
+    lines.append(
+        f"задержка p50 {stats['latency_p50'] * 1000:.0f} мс, p99 {stats['latency_p99'] * 1000:.0f} мс"
+    )
+    lines.append("")
+
+    stats = outbox.stats()
+    lines.append("<b>Очередь отправки</b>")
+    lines.append(
+        f"в очереди {stats['depth']}, в полёте {stats['in_flight']}, отправлено {stats['sent']}, "
+        f"ошибок {stats['failed']}, повторов {stats['retries']}, склеено {stats['coalesced']}"
+    )
+    lines.append(
+        f"задержка p50 {stats['latency_p50'] * 1000:.0f} мс, p99 {stats['latency_p99'] * 1000:.0f} мс"
+    )
+    return "\n".join(lines)
+
+
+@dp.message(Command("stats"))
+async def stats(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам.")
+        return
+
+    await message.answer(render_stats(), parse_mode="HTML")
+
+
+# ------------------- Команда /backup -------------------
+@dp.message(Command("backup"))
+async def backup(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам.")
+        return
+    if not maintenance.enabled:
+        await message.answer("ℹ️ Копии делаются только для SQLite. Данные в Redis сохраняет сам Redis (RDB/AOF).")
+        return
+
+    try:
+        result = await maintenance.backup()
+    except Exception as e:
+        log.exception("Копия базы по /backup не сделана")
+        await message.answer(f"❌ Копия не сделана: {e}", parse_mode=None)
+        return
+    await message.answer(
+        f"✅ Копия базы: <code>{html.escape(result.path)}</code>\n"
+        f"Размер: {format_size(result.size)} ({result.pages} стр.), за {result.seconds:.2f} с\n"
+        f"SHA-256: <code>{result.sha256}</code>\n"
+        f"Хранится копий: {len(maintenance.backups())} из {maintenance.keep}"
+    )
+
+
+# ------------------- Журнал событий /events -------------------
+EVENT_TITLES = {
+    events.POST_ACCEPTED: "пост принят",
+    events.POST_DELETED_NO_ACCESS: "пост удалён: нет доступа",
+    events.POST_DELETED_LIMIT: "пост удалён: лимит",
+    events.POST_DELETED_DUPLICATE: "пост удалён: повтор",
+    events.APPROVED: "заявка одобрена",
+    events.DENIED: "заявка отклонена",
+    events.EXPIRED: "доступ истёк",
+    events.REVOKED: "доступ снят",
+    events.EXTENDED: "доступ продлён",
+    events.LIMIT_CHANGED: "лимит изменён",
+    events.POSTS_RESET: "счётчик сброшен",
+    events.GROUP_CHANGED: "правила группы изменены",
+}
+EVENTS_SHOW = 20  # сколько последних событий показать текстом
+EVENTS_DEFAULT_HOURS = 24
+
+
+def parse_events_args(args, now):
+    """
+    [часов | ГГГГ-ММ-ДД [ГГГГ-ММ-ДД]] [id <user_id>] [csv | jsonl]
+    Даты — в DAY_TIMEZONE, вторая включительно. Возвращает (since, until, user_id, fmt),
+    until=None — по текущий момент, или None, если аргументы не разобраны.
+    """
+    since, until, user_id, fmt, dates = now - timedelta(hours=EVENTS_DEFAULT_HOURS), None, None, None, []
+    tokens = iter(args)
+    for token in tokens:
+        if token.lower() in ("csv", "jsonl"):
+            fmt = token.lower()
+        elif token.lower() == "id":
+            user_id = next(tokens, "")
+            if not user_id.isdigit():
+                return None
+            user_id = int(user_id)
+        elif token.isdigit():
+            since = now - timedelta(hours=int(token))
+        else:
+            try:
+                dates.append(datetime.strptime(token, "%Y-%m-%d").replace(tzinfo=DAY_TZ))
+            except ValueError:
+                return None
+    if len(dates) > 2 or dates and dates[0] > dates[-1]:
+        return None
+    if dates:
+        since = dates[0]
+        until = dates[-1] + timedelta(days=1)
+    return since, until, user_id, fmt
+
+
+async def flush_journal(message):
+    """
+    Сбрасывает буфер журнала перед выгрузкой — не больше пачек, чем в нём было:
+    события, пришедшие во время записи, ответ не задерживают.
+    False — хранилище недоступно, админу уже ответили.
+    """
+    try:
+        for _ in range(-(-len(journal) // journal.batch)):
+            await journal.flush()
+    except Exception as e:
+        log.exception("Журнал перед выгрузкой не сброшен")
+        await message.answer(f"❌ Не удалось записать журнал: {e}", parse_mode=None)
+        return False
+    return True
+
+
+def format_event(event):
+    who = f"@{(event.username or '').lstrip('@')} (ID {event.user_id})" if event.username else f"ID {event.user_id}"
+    line = f"{event.at.astimezone(DAY_TZ).strftime('%d.%m %H:%M:%S')} {EVENT_TITLES.get(event.kind, event.kind)}"
+    if event.user_id is not None:
+        line += f" — {who}"
+    if event.detail:
+        line += f" ({event.detail})"
+    if event.actor_id is not None:
+        line += f", админ {event.actor_id}"
+    return line
+
+
+@dp.message(Command("events"))
+async def events_command(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам.")
+        return
+
+    parsed = parse_events_args((message.text or message.caption).split()[1:], datetime.now(timezone.utc))
+    if parsed is None:
+        await message.answer(
+            "⚠️ Использование: /events [<code>часов</code> | <code>ГГГГ-ММ-ДД</code> [<code>ГГГГ-ММ-ДД</code>]] "
+            "[id <code>user_id</code>] [csv | jsonl]",
+            parse_mode="HTML"
+        )
+        return
+    since, until, user_id, fmt = parsed
+
+    # события, ещё не сброшенные из буфера, тоже должны попасть в ответ
+    if not await flush_journal(message):
+        return
+
+    if fmt:
+        rows = [event async for event in store.iter_events(since, until, user_id)]
+        if not rows:
+            await message.answer("📋 За этот период событий нет.")
             return
+        data = events.export_csv(rows) if fmt == "csv" else events.export_jsonl(rows)
+        until_name = (until or datetime.now(timezone.utc)).astimezone(DAY_TZ)
+        name = f"events_{since.astimezone(DAY_TZ):%Y%m%d-%H%M}_{until_name:%Y%m%d-%H%M}.{fmt}"
+        await message.answer_document(BufferedInputFile(data, filename=name), caption=f"📋 Событий: {len(rows)}")
+        return
+
+    last, total = deque(maxlen=EVENTS_SHOW), 0
+    async for event in store.iter_events(since, until, user_id):
+        total += 1
+        last.append(event)
+    if not total:
+        await message.answer("📋 За этот период событий нет.")
+        return
 
-        await db.execute("UPDATE access SET max_posts=? WHERE user_id=?", (new_limit, user_id))
-        await db.commit()
+    header = f"📋 Событий: {total}"
+    if total > EVENTS_SHOW:
+        header += f", последние {EVENTS_SHOW} (полностью — /events … csv)"
+    await message.answer(header + "\n\n" + "\n".join(format_event(event) for event in last))
+
+
+# ------------------- Сводка /report -------------------
+REPORT_DEFAULT_DAYS = 7
+REPORT_EXPIRING_DAYS = 3  # «истекают скоро» — в ближайшие столько дней
+
+
+def parse_report_args(args, today):
+    """
+    [дней | ГГГГ-ММ-ДД [ГГГГ-ММ-ДД]] [id <user_id>] [csv]
+    Дни — номера day_index, период включительно. Возвращает (first_day, last_day, user_id, csv)
+    или None, если аргументы не разобраны.
+    """
+    first_day, last_day, user_id, as_csv, dates = today - REPORT_DEFAULT_DAYS + 1, today, None, False, []
+    tokens = iter(args)
+    for token in tokens:
+        if token.lower() == "csv":
+            as_csv = True
+        elif token.lower() == "id":
+            user_id = next(tokens, "")
+            if not user_id.isdigit():
+                return None
+            user_id = int(user_id)
+        elif token.isdigit() and int(token) > 0:
+            first_day = today - int(token) + 1
+        else:
+            try:
+                dates.append(datetime.strptime(token, "%Y-%m-%d").date().toordinal())
+            except ValueError:
+                return None
+    if len(dates) > 2 or dates and dates[0] > dates[-1]:
+        return None
+    if dates:
+        first_day, last_day = dates[0], dates[-1]
+    return first_day, last_day, user_id, as_csv
+
+
+def format_period(first_day, last_day):
+    first, last = date.fromordinal(first_day), date.fromordinal(last_day)
+    if first == last:
+        return f"{first:%d.%m.%Y}"
+    return f"{first:%d.%m.%Y}–{last:%d.%m.%Y} ({last_day - first_day + 1} дн.)"
+
+
+def format_counts(counts):
+    deleted = (
+        counts.get(events.POST_DELETED_NO_ACCESS, 0) + counts.get(events.POST_DELETED_LIMIT, 0)
+        + counts.get(events.POST_DELETED_DUPLICATE, 0)
+    )
+    approved, denied = counts.get(events.APPROVED, 0), counts.get(events.DENIED, 0)
+    decided = approved + denied
+    return [
+        f"Посты: принято {counts.get(events.POST_ACCEPTED, 0)}, удалено {deleted} "
+        f"(нет доступа {counts.get(events.POST_DELETED_NO_ACCESS, 0)}, "
+        f"лимит {counts.get(events.POST_DELETED_LIMIT, 0)}, повтор {counts.get(events.POST_DELETED_DUPLICATE, 0)})",
+        f"Заявки: одобрено {approved}, отклонено {denied}"
+        + (f" — одобряется {approved * 100 / decided:.0f}%" if decided else ""),
+        f"Доступы: истекло {counts.get(events.EXPIRED, 0)}, снято {counts.get(events.REVOKED, 0)}, "
+        f"продлено {counts.get(events.EXTENDED, 0)}",
+    ]
+
+
+@dp.message(Command("report"))
+async def report(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам.")
+        return
+
+    policy, args = await command_group(message, message.text.split()[1:])
+    if policy is None:
+        return
+    now = datetime.now(timezone.utc)
+    parsed = parse_report_args(args, day_index(now))
+    if parsed is None:
+        await message.answer(
+            "⚠️ Использование: /report [g<code>group_id</code>] [<code>дней</code> | <code>ГГГГ-ММ-ДД</code> "
+            "[<code>ГГГГ-ММ-ДД</code>]] [id <code>user_id</code>] [csv]",
+            parse_mode="HTML"
+        )
+        return
+    first_day, last_day, user_id, as_csv = parsed
+    group_id, title = policy.group_id, groups.title(policy.group_id)
+
+    # счётчики пишутся вместе с журналом — сначала сбрасываем его буфер
+    if not await flush_journal(message):
+        return
+
+    if user_id is not None:
+        lines = [f"📊 Пользователь {user_id} в группе «{title}», за всё время:"]
+        lines += format_counts(await store.user_stats(group_id, user_id))
+        entry = access_cache.get(group_id, user_id)
+        if entry and (entry.expires_at is None or entry.expires_at > now):
+            until = entry.expires_at.astimezone(DAY_TZ).strftime("%d.%m.%Y %H:%M") if entry.expires_at else "бессрочно"
+            lines.append(f"Доступ: до {until}")
+        else:
+            lines.append("Доступа сейчас нет")
+        await message.answer("\n".join(lines))
+        return
+
+    if as_csv:
+        days = [row async for row in store.iter_stats_days(group_id, first_day, last_day, events.REPORT_KINDS)]
+        if not days:
+            await message.answer("📊 За этот период событий нет.")
+            return
+        name = f"report_{group_id}_{date.fromordinal(first_day):%Y%m%d}_{date.fromordinal(last_day):%Y%m%d}.csv"
+        await message.answer_document(
+            BufferedInputFile(events.export_days_csv(days), filename=name),
+            caption=f"📊 Дней с событиями: {len(days)}"
+        )
+        return
 
-    await message.answer(f"✅ Лимит постов для @{row[0] or user_id} изменён на {new_limit}")
-    await bot.send_message(user_id, f"📢 Ваш лимит постов изменён: теперь {new_limit}.")
+    counts = await store.stats_totals(group_id, first_day, last_day, events.REPORT_KINDS)
+    active, expiring = access_cache.count(group_id, now, now + timedelta(days=REPORT_EXPIRING_DAYS))
+    lines = [f"📊 Сводка по группе «{title}» за {format_period(first_day, last_day)}", ""]
+    lines += format_counts(counts)
+    lines.append(f"Сейчас: подписчиков {active}, истекают в ближайшие {REPORT_EXPIRING_DAYS} дн. — {expiring}")
+    if store.SHARED:
+        # кэш доступов пополняют записи этого экземпляра, выданное другими он видит, когда человек пишет в группу
+        lines[-1] += " (по кэшу этого экземпляра)"
+    await message.answer("\n".join(lines))
 
 
 # ------------------- Информационная команда для админов -------------------
@@ -235,12 +1039,29 @@ async def help_admin(message: types.Message):
 
     help_text = (
         "📌 Доступные админские команды:\n\n"
-        "/list — Показать всех активных пользователей и их лимиты\n"
+        "/groups — Модерируемые группы и их правила\n"
+        "/group <code>group_id</code> [days <code>N</code>] [posts <code>N</code>] [ttl <code>сек</code>] "
+        "[contact @<code>username</code>] [title <code>название</code>] — Добавить группу или изменить её правила "
+        "(срок доступа по заявке, постов в день, сколько висит предупреждение, контакт в нём); "
+        "<code>off</code> — перестать модерировать\n"
+        "/list [exp <code>N</code>] [full] [@<code>префикс</code>] — Активные пользователи по страницам "
+        "(истекающие за N дней, исчерпавшие лимит, по началу username)\n"
         "/revoke <code>user_id</code> — Лишить пользователя доступа\n"
         "/reset_user <code>user_id</code> — Сбросить дневной лимит постов конкретного пользователя\n"
         "/reset_all — Сбросить дневной лимит постов у всех пользователей\n"
         "/extend <code>user_id</code> <code>days</code> — Продлить доступ пользователю на указанное количество дней\n"
         "/setlimit <code>user_id</code> <code>limit</code> — Изменить максимальный лимит постов пользователя\n"
+        "/stats — Задержки хэндлеров, БД и Bot API, очереди апдейтов и отправки\n"
+        "/backup — Сделать копию базы сейчас: размер, время и контрольная сумма\n"
+        "/events [<code>часов</code> | <code>ГГГГ-ММ-ДД</code> [<code>ГГГГ-ММ-ДД</code>]] [id <code>user_id</code>] "
+        "[csv | jsonl] — Журнал: посты, заявки, снятия и продления доступа (по умолчанию за сутки)\n"
+        "/report [<code>дней</code> | <code>ГГГГ-ММ-ДД</code> [<code>ГГГГ-ММ-ДД</code>]] [id <code>user_id</code>] [csv] — "
+        "Сводка: посты, заявки и доступы за период (по умолчанию за неделю), по пользователю или по дням файлом\n"
+        "\nВместо одного <code>user_id</code> в /revoke, /reset_user, /extend и /setlimit можно указать "
+        "несколько ID через пробел или запятую, фильтр как у /list (<code>exp 3</code>, <code>full</code>, "
+        "<code>@префикс</code>) или приложить CSV-файл с ID в первой колонке и командой в подписи.\n"
+        "\nКоманды доступа действуют в группе по умолчанию. Другую группу указывают первым аргументом: "
+        "<code>/extend g-1001234567890 42 30</code>.\n"
         "\nИспользуйте команды внимательно!"
     )
 
@@ -1,21 +1,32 @@
 from aiogram import types
-import asyncio
-import aiosqlite
-from datetime import datetime, timezone
-from config import dp, ADMIN_IDS, GROUP_ID, DB_PATH, BOT_START_TIME
-
-
-ADMIN_CONTACT = "@hrd_timur"  # username администратора
+from datetime import datetime, timedelta, timezone
+from storage import store, GroupPolicy
+from config import dp, ADMIN_IDS, BACKLOG_MAX_AGE
+from services.access_cache import access_cache
+from services.quota import day_index
+from services.deleter import deleter
+from services.warner import warner
+from services.albums import albums
+from services.groups import groups
+from services.duplicates import duplicates, make_entry
+from services.journal import (
+    journal, POST_ACCEPTED, POST_DELETED_NO_ACCESS, POST_DELETED_LIMIT, POST_DELETED_DUPLICATE
+)
 
 
 # ------------------- ОТСЛЕЖИВАНИЕ СООБЩЕНИЙ -------------------
 @dp.message()
-async def group_message(message: types.Message):
-    if message.chat.id != GROUP_ID:
+async def group_message(message: types.Message, backlog: bool = False):
+    # правила группы — из словаря в памяти; чаты, которых там нет, бот не модерирует
+    if groups.stale():
+        await groups.refresh()
+    policy = groups.get(message.chat.id)
+    if policy is None:
         return
 
-    # ⛔ Пропускаем, если сообщение отправлено до запуска бота
-    if message.date.replace(tzinfo=timezone.utc) < BOT_START_TIME:
+    # ⛔ Пропускаем слишком старые сообщения — их уже видели все, кто мог
+    sent_at = message.date.replace(tzinfo=timezone.utc)
+    if datetime.now(timezone.utc) - sent_at > timedelta(seconds=BACKLOG_MAX_AGE):
         return
 
     # ⛔ Пропускаем, если сообщение от имени канала
@@ -26,47 +37,74 @@ async def group_message(message: types.Message):
     if user_id in ADMIN_IDS:
         return  # админа не ограничиваем
 
+    # пропущенное за время простоя считаем по времени отправки: день квоты и срок доступа — на тот момент
+    now = sent_at if backlog else datetime.now(timezone.utc)
+
+    # альбом — один пост: решение принимается, когда соберутся все его сообщения
+    if message.media_group_id:
+        albums.add(message, lambda messages: moderate(messages, now, policy))
+        return
+    await moderate([message], now, policy)
+
+
+async def moderate(messages: list[types.Message], now: datetime, policy: GroupPolicy):
+    """Проверка одного поста — сообщения или целого альбома — по правилам его группы."""
+    first = messages[0]
+    chat_id, user_id = first.chat.id, first.from_user.id
     # username или "неизвестный"
-    username = f"@{message.from_user.username}" if message.from_user.username else "неизвестный"
-    now = datetime.now(timezone.utc)
+    username = f"@{first.from_user.username}" if first.from_user.username else "неизвестный"
+    today = day_index(now)
+    detail = f"альбом из {len(messages)}" if len(messages) > 1 else None
 
-    async def warn_and_delete(reason: str):
-        """Удаляем сообщение и показываем предупреждение на 20 секунд"""
-        await message.delete()
-        warn_msg = await message.answer(
-            f"❌ Публикация от {username} была удалена.\n"
+    def render_warning(reason, count):
+        deleted = f" (удалено сообщений: {count})" if count > 1 else ""
+        return (
+            f"❌ Публикация от {username} была удалена{deleted}.\n"
             f"{reason}\n\n"
             f"📢 Разместить вакансию можно на правах рекламы.\n"
-            f"Свяжитесь с администратором: {ADMIN_CONTACT}"
+            f"Свяжитесь с администратором: {policy.admin_contact}"
         )
-        await asyncio.sleep(12)
-        try:
-            await warn_msg.delete()
-        except:
-            pass  # если сообщение уже удалено вручную/ботом
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(
-            "SELECT expires_at, posts_today, last_post_date, max_posts FROM access WHERE user_id=?",
-            (user_id,)
+    def warn_and_delete(kind: str, reason: str, note: str = None):
+        """Удаление, предупреждение и запись в журнал уходят в фоновые очереди — хэндлер сразу завершается"""
+        # сообщения альбома попадают в одно окно удалений и уходят одним deleteMessages
+        for message in messages:
+            deleter.delete_now(chat_id, message.message_id)
+        journal.record(
+            kind, user_id, username, chat_id=chat_id, message_id=first.message_id,
+            detail=", ".join(filter(None, (detail, note))) or None
         )
-        row = await cursor.fetchone()
+        warner.warn(chat_id, user_id, render_warning, reason, count=len(messages), ttl=policy.warning_ttl)
 
-        if not row:
-            await warn_and_delete("У пользователя нет активной подписки.")
-            return
+    # отказ по кэшу обходится без обращения к БД
+    if access_cache.stale(chat_id, user_id):
+        await access_cache.refresh(chat_id, user_id)
+    allowed = access_cache.may_post(chat_id, user_id, today, now)
 
-        expires_at, posts_today, last_post_date, max_posts = row
+    # повтор недавней вакансии (в том числе чужой) удаляется, не расходуя квоту
+    entry = None
+    if allowed and duplicates.enabled:
+        text = "\n".join(filter(None, (message.text or message.caption for message in messages)))
+        entry = make_entry(text, user_id, chat_id, first.message_id, now)
+        original = duplicates.claim(entry, now) if entry else None
+        if original:
+            warn_and_delete(
+                POST_DELETED_DUPLICATE, "Такая вакансия уже публиковалась недавно.",
+                f"повтор сообщения {original.message_id} от ID {original.user_id}"
+            )
+            return
 
-        today = now.date()
-        if not last_post_date or datetime.fromisoformat(last_post_date).date() != today:
-            posts_today = 0
+    if allowed:
+        # смена дня, проверка лимита и +1 к счётчику — одним атомарным UPDATE
+        result = await store.consume_post(chat_id, user_id, username, now)
+        access_cache.record(chat_id, user_id, username, result, today)
+        allowed = result.allowed if result else None
+        if not allowed and entry:
+            duplicates.release(entry)
 
-        if posts_today >= max_posts:
-            await warn_and_delete("Превышен дневной лимит публикаций.")
-        else:
-            await db.execute(
-                "UPDATE access SET posts_today=?, last_post_date=?, username=? WHERE user_id=?",
-                (posts_today + 1, now.isoformat(), username, user_id)
-            )
-            await db.commit()
+    if allowed is None:
+        warn_and_delete(POST_DELETED_NO_ACCESS, "У пользователя нет активной подписки.")
+    elif not allowed:
+        warn_and_delete(POST_DELETED_LIMIT, "Превышен дневной лимит публикаций.")
+    else:
+        journal.record(POST_ACCEPTED, user_id, username, chat_id=chat_id, message_id=first.message_id, detail=detail)
@@ -1,9 +1,17 @@
 from aiogram import types
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-import aiosqlite
 from datetime import datetime, timedelta, timezone
-from config import dp, bot, ADMIN_IDS, DB_PATH
+from storage import store
+from config import dp, ADMIN_IDS, REQUEST_COOLDOWN
+from services.access_cache import access_cache
+from services.expiry import expiry_queue
+from services.outbox import outbox
+from services.quota import day_index
+from services.throttle import request_cooldown
+from services.groups import groups
+from services.journal import journal, APPROVED, DENIED
+from services import decisions
 
 
 # ------------------- ЗАПРОС ДОСТУПА -------------------
@@ -16,128 +24,156 @@ async def request_access(message: types.Message):
     """
     Обработка команды /request:
     - Админ всегда имеет доступ.
-    - Если у пользователя активный доступ → показываем статус.
+    - Если групп несколько → предлагаем выбрать группу кнопками.
+    - Если у пользователя активный доступ в группе → показываем статус.
     - Если заявка уже отправлена < часа назад → стопаем.
     - Если нет заявки → создаём новую и уведомляем админа.
     """
     user_id = message.from_user.id
     username = message.from_user.username or "неизвестный"
-    now = datetime.now(timezone.utc)
 
     if user_id in ADMIN_IDS:
         # доступ без ограничений
         await message.answer("✅ Ты админ, у тебя всегда есть доступ без ограничений.")
         return
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        # 🔹 Проверяем активный доступ
-        cursor = await db.execute(
-            "SELECT expires_at, posts_today, last_post_date, max_posts FROM access WHERE user_id=?",
-            (user_id,)
-        )
-        access_row = await cursor.fetchone()
-
-        if access_row:
-            expires_at, posts_today, last_post_date, max_posts = access_row
-            if expires_at and datetime.fromisoformat(expires_at) > now:
-                days_left = (datetime.fromisoformat(expires_at).date() - now.date()).days
-                used_posts = 0
-                if last_post_date and datetime.fromisoformat(last_post_date).date() == now.date():
-                    used_posts = posts_today
-                await message.answer(
-                    f"⚠️ У тебя уже есть доступ.\n"
-                    f"Осталось {days_left} дн.\n"
-                    f"Сегодня {used_posts}/{max_posts} постов."
-                )
-                return
-
-        # 🔹 Проверяем последнюю заявку пользователя
-        cursor = await db.execute(
-            "SELECT requested_at FROM requests WHERE user_id=?",
-            (user_id,)
-        )
-        row = await cursor.fetchone()
-
-        if row:
-            last_request = datetime.fromisoformat(row[0])
-            if (now - last_request) < timedelta(hours=1):
-                minutes_left = int((timedelta(hours=1) - (now - last_request)).total_seconds() // 60)
-                await message.answer(
-                    f"⏳ Ты можешь отправлять заявку только раз в час. Подожди {minutes_left} мин."
-                )
-                return
-        else:
-            # вставляем новую заявку, если её нет
-            await db.execute(
-                "INSERT INTO requests (user_id, username, requested_at) VALUES (?, ?, ?)",
-                (user_id, username, now.isoformat())
-            )
-            await db.commit()
-
-    # 🔹 Уведомление администратору
+    if not len(groups):
+        await message.answer("⚠️ Бот пока не модерирует ни одной группы.")
+        return
+    if len(groups) == 1:
+        await request_group(message, user_id, username, next(iter(groups)))
+        return
+
     kb = InlineKeyboardBuilder()
-    kb.button(text="✅ Одобрить", callback_data=f"approve_{user_id}_{username}")
-    kb.button(text="❌ Отказать", callback_data=f"deny_{user_id}_{username}")
-
-    for admin_id in ADMIN_IDS:
-        await bot.send_message(
-            admin_id,
-            f"🔔 Новый запрос от @{username} (ID {user_id})",
-            reply_markup=kb.as_markup()
+    for policy in groups:
+        kb.button(text=groups.title(policy.group_id, escape=False), callback_data=f"rq:{policy.group_id}")
+    kb.adjust(1)
+    await message.answer("👥 Выбери группу, в которой хочешь публиковать:", reply_markup=kb.as_markup())
+
+
+@dp.callback_query(lambda c: c.data.startswith("rq:"))
+async def request_group_callback(callback: types.CallbackQuery):
+    try:
+        policy = groups.get(int(callback.data.split(":", 1)[1]))
+    except ValueError:
+        policy = None
+    if policy is None:
+        await callback.answer("❌ Эта группа больше не модерируется.")
+        return
+
+    await callback.answer()
+    await request_group(
+        callback.message, callback.from_user.id, callback.from_user.username or "неизвестный", policy
+    )
+
+
+async def request_group(message: types.Message, user_id, username, policy):
+    """Заявка на доступ в одну группу; ответ — в чат message."""
+    group_id = policy.group_id
+    now = datetime.now(timezone.utc)
+
+    # 🔹 Проверяем активный доступ (по кэшу — там актуальные счётчики)
+    if access_cache.stale(group_id, user_id):
+        await access_cache.refresh(group_id, user_id)
+    entry = access_cache.get(group_id, user_id)
+    if entry and entry.expires_at and entry.expires_at > now:
+        days_left = (entry.expires_at.date() - now.date()).days
+        used_posts = entry.used_today(day_index(now))
+        await message.answer(
+            f"⚠️ У тебя уже есть доступ в группе «{groups.title(group_id)}».\n"
+            f"Осталось {days_left} дн.\n"
+            f"Сегодня {used_posts}/{entry.max_posts} постов."
         )
+        return
+
+    # 🔹 Проверяем последнюю заявку пользователя (сначала в памяти, без запроса к БД)
+    remaining = request_cooldown.remaining(user_id, now)
+    if remaining is None:
+        # отмечаем заявку до await, чтобы параллельный /request её уже видел
+        request_cooldown.add(user_id, now)
+        # заявку могли подать и через другой экземпляр бота — хранилище проверяет атомарно
+        requested_at = await store.claim_request(user_id, username, now, REQUEST_COOLDOWN)
+        if requested_at is not None:
+            request_cooldown.add(user_id, requested_at)
+            remaining = request_cooldown.remaining(user_id, now)
+
+    if remaining is not None:
+        minutes_left = int(remaining.total_seconds() // 60)
+        await message.answer(
+            f"⏳ Ты можешь отправлять заявку только раз в час. Подожди {minutes_left} мин."
+        )
+        return
+
+    # 🔹 Карточка заявки всем администраторам
+    await decisions.open_request(group_id, user_id, username)
 
     await message.answer("📩 Заявка отправлена администратору. Ожидайте решения.")
 
 
 # ------------------- РЕШЕНИЕ АДМИНА -------------------
-@dp.callback_query(lambda c: c.data.startswith("approve_") or c.data.startswith("deny_"))
+@dp.callback_query(lambda c: c.data.startswith(decisions.APPROVE) or c.data.startswith(decisions.DENY))
 async def decision(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ У вас нет прав для этой команды.", show_alert=True)
+        return
+
     # разбор callback_data
-    try:
-        action, user_id_str, username = callback.data.split("_", 2)
-        user_id = int(user_id_str)
-    except ValueError:
+    parsed = decisions.parse_callback(callback.data)
+    if parsed is None:
         await callback.answer("❌ Некорректные данные.")
         return
+    action, token = parsed
+
+    now = datetime.now(timezone.utc)
+    # срок и лимит — по правилам группы заявки; решённую заявку видно уже здесь, без записи
+    clicked = (callback.message.chat.id, callback.message.message_id)
+    pending = await store.get_decision(token)
+    if pending is None:
+        await callback.answer("❌ Заявка не найдена или устарела.")
+        return
+    if pending.action:
+        await already_decided(callback, pending, clicked)
+        return
+    policy = groups.get(pending.group_id)
+    if policy is None and action == decisions.APPROVE:
+        await callback.answer("❌ Группа заявки больше не модерируется.", show_alert=True)
+        return
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        if action == "approve":
-            # выдаём доступ на 7 дней, 3 поста в день
-            expires = datetime.now(timezone.utc) + timedelta(days=7)
-
-            # обновляем таблицу access
-            await db.execute(
-                """
-                REPLACE INTO access (user_id, username, expires_at, posts_today, last_post_date, max_posts)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (user_id, username, expires.isoformat(), 0, None, 3)
-            )
-
-            # удаляем заявку из requests (она больше не нужна)
-            await db.execute("DELETE FROM requests WHERE user_id=?", (user_id,))
-            await db.commit()
-
-            await bot.send_message(
-                user_id,
-                "✅ Вам выдан доступ писать в группе на 7 дней (3 поста в день)."
-            )
-            await callback.message.edit_text(f"Одобрено ✅ (ID {user_id}, @{username})")
-
-        elif action == "deny":
-            # проверяем, есть ли запись
-            cursor = await db.execute("SELECT user_id FROM requests WHERE user_id=?", (user_id,))
-            row = await cursor.fetchone()
-
-            if not row:
-                # создаём запись, если её нет
-                await db.execute(
-                    "INSERT INTO requests (user_id, username, requested_at) VALUES (?, ?, ?)",
-                    (user_id, username, datetime.now(timezone.utc).isoformat())
-                )
-                await db.commit()
-
-            await bot.send_message(user_id, "❌ Ваша заявка отклонена.")
-            await callback.message.edit_text(f"Отклонено ❌ (ID {user_id}, @{username})")
+    # из одновременных нажатий (у этого или другого админа) решение примет одно
+    expires = now + timedelta(days=policy.access_days) if policy else None
+    max_posts = policy.max_posts if policy else None
+    result, applied = await store.decide(token, action, callback.from_user.id, now, expires, max_posts)
+    if result is None:
+        await callback.answer("❌ Заявка не найдена или устарела.")
+        return
+    if not applied:
+        await already_decided(callback, result, clicked)
+        return
 
+    group_id, user_id, username = result.group_id, result.user_id, result.username
+    title = groups.title(group_id)
+    if action == decisions.APPROVE:
+        journal.record(
+            APPROVED, user_id, username, actor_id=callback.from_user.id, chat_id=group_id, detail=expires.isoformat()
+        )
+        request_cooldown.discard(user_id)
+        access_cache.put(group_id, user_id, username, expires, max_posts=max_posts)
+        expiry_queue.schedule((group_id, user_id), expires)
+        outbox.send(
+            user_id,
+            f"✅ Вам выдан доступ писать в группе «{title}» на {policy.access_days} дн., постов в день: {max_posts}."
+        )
+    else:
+        # после отказа новую заявку можно подать только через час
+        request_cooldown.add(user_id, now)
+        journal.record(DENIED, user_id, username, actor_id=callback.from_user.id, chat_id=group_id)
+        outbox.send(user_id, f"❌ Ваша заявка в группу «{title}» отклонена.")
+
+    # карточка, по которой нажали, могла ещё не попасть в список
+    await decisions.edit_cards(result, {*result.cards, clicked})
     await callback.answer()
+
+
+async def already_decided(callback, result, clicked):
+    await callback.answer("ℹ️ По этой заявке уже принято решение.")
+    await decisions.edit_cards(result, [clicked])
@@ -15,12 +15,13 @@ async def start_command(message: types.Message):
 
     text = (
         f"Привет, @{username}! 👋\n\n"
-        "Я бот для контроля доступа в группу.\n"
+        "Я бот для контроля доступа в группы.\n"
         "Чтобы получить доступ к отправке сообщений в группе, "
         "введи команду /request.\n\n"
         "После отправки заявки администратор рассмотрит её и либо "
         "одобрит, либо отклонит. Когда доступ будет предоставлен, "
-        "ты сможешь писать до 3 сообщений в день.\n\n"
+        "ты сможешь писать несколько сообщений в день — срок и лимит "
+        "у каждой группы свои, бот сообщит их вместе с одобрением.\n\n"
         "Если у тебя уже есть доступ, бот покажет твой текущий статус."
     )
 
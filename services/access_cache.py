@@ -0,0 +1,148 @@
+import time
+from collections import OrderedDict
+from config import ACCESS_CACHE_TTL
+from storage import store
+from services.quota import used_today
+
+
+# ------------------- ЗАПИСЬ О ДОСТУПЕ -------------------
+class AccessEntry:
+    __slots__ = ("username", "expires_at", "posts_today", "quota_day", "max_posts")
+
+    def __init__(self, username, expires_at, posts_today=0, quota_day=None, max_posts=3):
+        self.username = username
+        self.expires_at = expires_at
+        self.posts_today = posts_today or 0
+        self.quota_day = quota_day
+        self.max_posts = max_posts
+
+    def used_today(self, today):
+        return used_today(self.posts_today, self.quota_day, today)
+
+
+# ------------------- КЭШ ДОСТУПОВ -------------------
+class AccessCache:
+    """
+    Копия таблицы access в памяти, ключ — (group_id, user_id).
+    Отказы в группе (нет подписки, лимит исчерпан) решаются без обращения к БД,
+    а засчитывает пост атомарный store.consume_post.
+    """
+
+    def __init__(self, ttl=ACCESS_CACHE_TTL):
+        self._entries = {}
+        self.ttl = ttl
+        self._checked = OrderedDict()  # (group_id, user_id) -> когда запись сверяли с хранилищем (monotonic)
+
+    async def load(self):
+        rows = await store.list_access()
+        self._entries = {
+            (row.group_id, row.user_id): AccessEntry(
+                row.username, row.expires_at, row.posts_today,
+                row.quota_day, row.max_posts
+            )
+            for row in rows
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, group_id, user_id):
+        return self._entries.get((group_id, user_id))
+
+    # ------------------- ОБЩЕЕ ХРАНИЛИЩЕ -------------------
+    def stale(self, group_id, user_id):
+        """
+        На общем хранилище доступ могли выдать или изменить через другой экземпляр.
+        Тогда запись сверяется с хранилищем не реже раза в ttl секунд.
+        """
+        if not self.ttl:
+            return False
+        checked = self._checked.get((group_id, user_id))
+        return checked is None or time.monotonic() - checked >= self.ttl
+
+    async def refresh(self, group_id, user_id):
+        row = await store.get_access(group_id, user_id)
+        if row:
+            self.put(group_id, user_id, row.username, row.expires_at, row.posts_today, row.quota_day, row.max_posts)
+        else:
+            self.remove(group_id, user_id)
+
+        now = time.monotonic()
+        key = (group_id, user_id)
+        self._checked[key] = now
+        self._checked.move_to_end(key)
+        # отметки старше ttl ничего не дают — снимаем их с начала
+        while self._checked:
+            first, checked = next(iter(self._checked.items()))
+            if now - checked < self.ttl:
+                break
+            del self._checked[first]
+
+    # ------------------- ГОРЯЧИЙ ПУТЬ -------------------
+    def may_post(self, group_id, user_id, today, now=None):
+        """
+        None — доступа в группе нет, False — лимит исчерпан, True — нужно списать пост в БД.
+        now — время сообщения: доступ, срок которого к этому моменту истёк,
+        не действует, даже если цикл check_expired ещё не успел его снять.
+        """
+        entry = self._entries.get((group_id, user_id))
+        if entry is None:
+            return None
+        if now is not None and entry.expires_at is not None and entry.expires_at <= now:
+            return None
+        return entry.used_today(today) < entry.max_posts
+
+    def record(self, group_id, user_id, username, result, today):
+        """Переносит в кэш счётчик, который вернул store.consume_post."""
+        if result is None:
+            self._entries.pop((group_id, user_id), None)
+            return
+
+        entry = self._entries.get((group_id, user_id))
+        if entry:
+            entry.posts_today = result.posts_today
+            entry.max_posts = result.max_posts
+            entry.quota_day = today
+            if result.allowed:
+                entry.username = username
+
+    # ------------------- СИНХРОНИЗАЦИЯ С АДМИНСКИМИ КОМАНДАМИ -------------------
+    def put(self, group_id, user_id, username, expires_at, posts_today=0, quota_day=None, max_posts=3):
+        self._entries[(group_id, user_id)] = AccessEntry(username, expires_at, posts_today, quota_day, max_posts)
+
+    def remove(self, group_id, user_id):
+        self._entries.pop((group_id, user_id), None)
+
+    def set_expires(self, group_id, user_id, expires_at):
+        entry = self._entries.get((group_id, user_id))
+        if entry:
+            entry.expires_at = expires_at
+
+    def set_limit(self, group_id, user_id, max_posts):
+        entry = self._entries.get((group_id, user_id))
+        if entry:
+            entry.max_posts = max_posts
+
+    def reset(self, group_id, user_id):
+        entry = self._entries.get((group_id, user_id))
+        if entry:
+            entry.posts_today = 0
+
+    def reset_all(self, group_id):
+        for (entry_group, _), entry in self._entries.items():
+            if entry_group == group_id:
+                entry.posts_today = 0
+
+    # ------------------- СВОДКА -------------------
+    def count(self, group_id, now, soon):
+        """(действующих доступов в группе, из них истекают до soon) — по памяти, без запроса к хранилищу."""
+        active = expiring = 0
+        for (entry_group, _), entry in self._entries.items():
+            if entry_group != group_id or entry.expires_at is not None and entry.expires_at <= now:
+                continue
+            active += 1
+            expiring += entry.expires_at is not None and entry.expires_at <= soon
+        return active, expiring
+
+
+access_cache = AccessCache()
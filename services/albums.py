@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from config import ALBUM_WINDOW
+
+log = logging.getLogger(__name__)
+
+# в альбоме Telegram не больше 10 фото или видео
+MAX_ALBUM_SIZE = 10
+
+
+# ------------------- АЛЬБОМЫ -------------------
+class AlbumCollector:
+    """
+    Альбом приходит отдельными сообщениями с общим media_group_id.
+    Первое сообщение открывает окно в ALBUM_WINDOW секунд, остальные
+    добавляются в него, затем on_ready(messages) вызывается один раз на весь
+    альбом — как на один пост. add() ничего не ждёт: апдейты одного
+    пользователя разбираются по очереди (services/updates.py),
+    и ожидание в хэндлере не дало бы прийти остальным частям.
+    """
+
+    def __init__(self, window=ALBUM_WINDOW):
+        self.window = window
+        self._albums = {}  # (chat_id, media_group_id) -> (on_ready, [Message])
+        self._timers = {}
+        self._tasks = set()
+
+    def __len__(self):
+        return len(self._albums)
+
+    def add(self, message, on_ready):
+        key = (message.chat.id, message.media_group_id)
+        album = self._albums.get(key)
+        if album is None:
+            album = self._albums[key] = (on_ready, [])
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._release, key)
+        album[1].append(message)
+        if len(album[1]) >= MAX_ALBUM_SIZE:
+            self._release(key)
+
+    def _release(self, key):
+        self._timers.pop(key).cancel()
+        on_ready, messages = self._albums.pop(key)
+        messages.sort(key=lambda message: message.message_id)
+        task = asyncio.create_task(self._run(on_ready, messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    async def _run(on_ready, messages):
+        try:
+            await on_ready(messages)
+        except Exception:
+            # контекст записи (чат, пользователь) — от апдейта, открывшего альбом
+            log.exception("Альбом %s не обработан", messages[0].media_group_id)
+
+    async def stop(self):
+        """Не дожидаясь окна, проверяет собранные альбомы."""
+        for key in list(self._albums):
+            self._release(key)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+albums = AlbumCollector()
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import secrets
+from datetime import datetime, timedelta, timezone
+from aiogram.exceptions import TelegramAPIError
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from config import bot, ADMIN_IDS, DECISION_TTL_DAYS
+from storage import store
+from services.outbox import outbox
+from services.groups import groups
+
+log = logging.getLogger(__name__)
+
+APPROVE = "approve"
+DENY = "deny"
+
+
+# ------------------- КАРТОЧКИ ЗАЯВОК -------------------
+# Заявка рассылается всем админам, и решить её может любой из них.
+# В callback_data — короткий token заявки ("approve:Xy3_k9Qa"): username
+# может содержать "_" и не влезать в лимит Telegram в 64 байта.
+# Решение применяется один раз (store.decide), после чего правятся
+# карточки у всех админов, чтобы по ней нельзя было нажать ещё раз.
+_tasks = set()
+
+
+def new_token():
+    return secrets.token_urlsafe(6)
+
+
+def parse_callback(data):
+    """
+    (действие, token) или None. У карточек, разосланных до появления token
+    ("approve_<id>_<username>"), token — "u<id>": такие решаются, только если
+    заявка с этим token уже есть, username из callback_data не используется.
+    """
+    action, sep, token = data.partition(":")
+    if not sep:
+        action, _, rest = data.partition("_")
+        user_id = rest.split("_", 1)[0]
+        token = f"u{user_id}" if user_id.isdigit() else ""
+    return (action, token) if action in (APPROVE, DENY) and token else None
+
+
+def render_result(decision):
+    title = "Одобрено ✅" if decision.action == APPROVE else "Отклонено ❌"
+    return (
+        f"{title} (ID {decision.user_id}, @{decision.username})\n"
+        f"Группа: {groups.title(decision.group_id)}\nРешил админ ID {decision.actor_id}"
+    )
+
+
+async def open_request(group_id, user_id, username):
+    """Регистрирует заявку на доступ в группе и рассылает карточку админам, не дожидаясь отправки."""
+    token = new_token()
+    await store.open_decision(token, group_id, user_id, username, datetime.now(timezone.utc))
+
+    kb = InlineKeyboardBuilder()
+    kb.button(text="✅ Одобрить", callback_data=f"{APPROVE}:{token}")
+    kb.button(text="❌ Отказать", callback_data=f"{DENY}:{token}")
+    # очередь отправляет разным админам параллельно
+    futures = outbox.send_many(
+        ADMIN_IDS,
+        f"🔔 Новый запрос от @{username} (ID {user_id})\nГруппа: {groups.title(group_id)}",
+        reply_markup=kb.as_markup()
+    )
+
+    task = asyncio.create_task(_register_cards(token, futures))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return token
+
+
+async def _register_cards(token, futures):
+    messages = await asyncio.gather(*futures)
+    cards = [(admin_id, message.message_id) for admin_id, message in zip(ADMIN_IDS, messages) if message]
+    try:
+        decision = await store.add_decision_cards(token, cards)
+    except Exception as e:
+        log.warning("Не удалось сохранить карточки заявки %s: %s", token, e)
+        return
+    if decision and decision.action:
+        # заявку решили раньше, чем до кого-то дошла карточка
+        await edit_cards(decision, cards)
+
+
+async def edit_cards(decision, cards):
+    """Правит все карточки заявки разом."""
+    text = render_result(decision)
+
+    async def edit(chat_id, message_id):
+        try:
+            await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        except TelegramAPIError as e:
+            # карточку уже поправили или удалили
+            log.warning("Не удалось обновить карточку %s: %s", message_id, e, extra={"chat_id": chat_id})
+
+    await asyncio.gather(*(edit(chat_id, message_id) for chat_id, message_id in cards))
+
+
+async def prune():
+    await store.delete_decisions_before(datetime.now(timezone.utc) - timedelta(days=DECISION_TTL_DAYS))
+
+
+async def stop(timeout=10.0):
+    """Дожидается записи карточек (не дольше timeout), пока хранилище ещё открыто."""
+    try:
+        await asyncio.wait_for(asyncio.gather(*_tasks, return_exceptions=True), timeout)
+    except asyncio.TimeoutError:
+        log.warning("Не дождались записи карточек заявок: %s", len(_tasks))
@@ -0,0 +1,113 @@
+import asyncio
+import heapq
+import logging
+import time
+from aiogram.exceptions import TelegramAPIError
+from config import bot, DELETE_BATCH_DELAY
+
+log = logging.getLogger(__name__)
+
+# deleteMessages принимает не больше 100 id за раз
+MAX_BULK_DELETE = 100
+
+
+# ------------------- ОТЛОЖЕННОЕ УДАЛЕНИЕ СООБЩЕНИЙ -------------------
+class DeletionScheduler:
+    """
+    Один таймер на все сообщения, которые бот должен удалить.
+    Сообщения одного чата, у которых подошёл срок, удаляются одним deleteMessages.
+    """
+
+    def __init__(self):
+        self._heap = []          # (monotonic срок, chat_id, message_id)
+        self._deadlines = {}     # (chat_id, message_id) -> актуальный срок
+        self._wakeup = asyncio.Event()
+        self._runner = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, chat_id, message_id, delay):
+        """Удалить сообщение через delay секунд (повторный вызов переносит срок)."""
+        deadline = time.monotonic() + delay
+        self._deadlines[(chat_id, message_id)] = deadline
+        heapq.heappush(self._heap, (deadline, chat_id, message_id))
+        if self._heap[0][0] == deadline:
+            self._wakeup.set()
+
+    def delete_now(self, chat_id, message_id):
+        # небольшая задержка, чтобы собрать соседние удаления в одну пачку
+        self.schedule(chat_id, message_id, DELETE_BATCH_DELAY)
+
+    def cancel(self, chat_id, message_id):
+        self._deadlines.pop((chat_id, message_id), None)
+
+    # ------------------- СНИМОК ДЛЯ ПЕРЕЗАПУСКА -------------------
+    def snapshot(self):
+        """[(chat_id, message_id, срок по time.time())] — monotonic не переживает перезапуск."""
+        offset = time.time() - time.monotonic()
+        return [(chat_id, message_id, deadline + offset) for (chat_id, message_id), deadline in self._deadlines.items()]
+
+    def restore(self, items):
+        now = time.time()
+        for chat_id, message_id, deadline in items:
+            self.schedule(chat_id, message_id, max(deadline - now, 0))
+
+    def _pop_due(self, now):
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            deadline, chat_id, message_id = heapq.heappop(self._heap)
+            if self._deadlines.get((chat_id, message_id)) != deadline:
+                continue  # срок перенесён или удаление отменено
+            del self._deadlines[(chat_id, message_id)]
+            due.setdefault(chat_id, []).append(message_id)
+        return due
+
+    def _next_delay(self):
+        while self._heap:
+            deadline, chat_id, message_id = self._heap[0]
+            if self._deadlines.get((chat_id, message_id)) == deadline:
+                return max(deadline - time.monotonic(), 0)
+            heapq.heappop(self._heap)
+        return None
+
+    # ------------------- ЦИКЛ УДАЛЕНИЯ -------------------
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Удаляет всё, что стоит в очереди, и останавливает таймер."""
+        if self._runner:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        await self._delete(self._pop_due(float("inf")))
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_delay())
+            except asyncio.TimeoutError:
+                pass
+
+            due = self._pop_due(time.monotonic())
+            if due:
+                await self._delete(due)
+
+    async def _delete(self, due):
+        for chat_id, message_ids in due.items():
+            for i in range(0, len(message_ids), MAX_BULK_DELETE):
+                chunk = message_ids[i:i + MAX_BULK_DELETE]
+                try:
+                    if len(chunk) == 1:
+                        await bot.delete_message(chat_id, chunk[0])
+                    else:
+                        await bot.delete_messages(chat_id, chunk)
+                except TelegramAPIError as e:
+                    # сообщение уже удалено вручную или слишком старое
+                    log.warning("Не удалось удалить сообщения %s: %s", chunk, e, extra={"chat_id": chat_id})
+
+
+deleter = DeletionScheduler()
@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from storage import store, Fingerprint
+from config import DUPLICATE_WINDOW_HOURS, DUPLICATE_MAX_DISTANCE, DUPLICATE_MAX_ENTRIES
+
+log = logging.getLogger(__name__)
+
+MIN_WORDS = 8        # короче — «спасибо», «+» и т.п., такие повторы не считаем
+BITS = 64
+FLUSH_INTERVAL = 5   # как часто записывать новые отпечатки в хранилище (сек)
+PRUNE_INTERVAL = 3600
+
+_WORD = re.compile(r"\w+")
+
+
+# ------------------- ОТПЕЧАТОК ТЕКСТА -------------------
+def normalize(text):
+    """Слова текста без регистра, пунктуации и эмодзи; ё = е."""
+    return _WORD.findall(text.lower().replace("ё", "е"))
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(words):
+    """
+    64-битный SimHash по словам: у похожих текстов отличается несколько бит.
+    Каждый бит — большинство по этому биту среди хэшей слов; столбцы
+    считаются через zip строк "0101…", чтобы цикл по битам шёл в C.
+    """
+    rows = [format(_hash64(word), "064b") for word in words]
+    half = len(rows) / 2
+    value = 0
+    for column in zip(*rows):
+        value = (value << 1) | (column.count("1") > half)
+    return value
+
+
+def fingerprint(text):
+    """(точный хэш, SimHash) или None, если текст слишком короткий."""
+    words = normalize(text or "")
+    if len(words) < MIN_WORDS:
+        return None
+    return _hash64(" ".join(words)), simhash(words)
+
+
+# ------------------- ИНДЕКС НЕДАВНИХ ПОСТОВ -------------------
+class DuplicateIndex:
+    """
+    Отпечатки постов за DUPLICATE_WINDOW_HOURS часов, не больше
+    DUPLICATE_MAX_ENTRIES. Повтором считается пост в той же группе (chat_id):
+    одну вакансию можно разместить в нескольких группах. Точные копии ищутся
+    по хэшу, похожие — по SimHash с расстоянием Хэмминга не больше
+    max_distance: 64 бита делятся на max_distance + 1 полос, и у близкого
+    отпечатка хотя бы одна полоса совпадает целиком. Поэтому поиск — несколько обращений к таблицам и
+    проверка немногих кандидатов, а не перебор всего индекса.
+
+    Память ограничена заранее: отпечатки лежат в кольце из capacity слотов
+    (массивы array, ~70 байт на пост вместо сотен у кортежей и словарей),
+    таблицы — цепочки номеров слотов: голова на корзину и «следующий» на слот.
+    Новый пост занимает слот самого старого, истёкшие освобождаются с начала кольца.
+    Новые отпечатки пишутся в хранилище пачками раз в FLUSH_INTERVAL секунд
+    и загружаются оттуда при запуске.
+    """
+
+    def __init__(self, window=timedelta(hours=DUPLICATE_WINDOW_HOURS),
+                 max_distance=DUPLICATE_MAX_DISTANCE, capacity=DUPLICATE_MAX_ENTRIES):
+        self.window = window
+        self.max_distance = max_distance
+        self.capacity = max(capacity, 1)
+        bands = max_distance + 1
+        step = BITS / bands
+        self._shifts = [(round(i * step), round((i + 1) * step) - round(i * step)) for i in range(bands)]
+
+        # таблица 0 — точный хэш, 1… — полосы SimHash; корзин примерно столько, сколько слотов
+        table_bits = min(max(self.capacity.bit_length(), 4), 20)
+        self._masks = [(1 << min(table_bits, width)) - 1 for width in (BITS, *(w for _, w in self._shifts))]
+        self._heads = [array("i", [-1]) * (mask + 1) for mask in self._masks]
+        self._next = [array("i") for _ in self._masks]
+
+        # слоты; at = 0 — слот свободен
+        self._at = array("q")
+        self._exact = array("Q")
+        self._simhash = array("Q")
+        self._user_id = array("q")
+        self._chat_id = array("q")
+        self._message_id = array("q")
+        self._start = 0  # самый старый слот кольца
+        self._used = 0   # занятых подряд слотов от _start (включая освобождённые release)
+        self._live = 0
+
+        self._unsaved = []
+        self._loaded_until = None  # до какого момента прочитаны чужие отпечатки (общее хранилище)
+        self._runner = None
+        self._pruned_at = float("-inf")
+
+    @property
+    def enabled(self):
+        return self.window > timedelta(0)
+
+    def __len__(self):
+        return self._live
+
+    def _keys(self, exact, value):
+        keys = [exact & self._masks[0]]
+        for (shift, width), mask in zip(self._shifts, self._masks[1:]):
+            keys.append((value >> shift) & mask)
+        return keys
+
+    def _entry(self, slot):
+        return Fingerprint(
+            datetime.fromtimestamp(self._at[slot], timezone.utc), self._exact[slot], self._simhash[slot],
+            self._user_id[slot] or None, self._chat_id[slot] or None, self._message_id[slot] or None
+        )
+
+    def _exact_slot(self, exact, chat_id):
+        slot = self._heads[0][exact & self._masks[0]]
+        while slot >= 0 and (self._exact[slot] != exact or self._chat_id[slot] != chat_id):
+            slot = self._next[0][slot]
+        return slot
+
+    def _find_slot(self, exact, value, chat_id, oldest):
+        # кольцо упорядочено по времени добавления, а не поста: отпечаток из пропущенных
+        # апдейтов или общего хранилища мог встать после более новых, и _evict до него
+        # ещё не дошёл — поэтому время каждого кандидата сверяется с окном
+        slot, chain = self._heads[0][exact & self._masks[0]], self._next[0]
+        while slot >= 0:
+            if self._exact[slot] == exact and self._chat_id[slot] == chat_id and self._at[slot] > oldest:
+                return slot
+            slot = chain[slot]
+        keys = self._keys(exact, value)
+        for table in range(1, len(keys)):
+            slot, chain = self._heads[table][keys[table]], self._next[table]
+            while slot >= 0:
+                if (self._chat_id[slot] == chat_id and self._at[slot] > oldest
+                        and bin(self._simhash[slot] ^ value).count("1") <= self.max_distance):
+                    return slot
+                slot = chain[slot]
+        return -1
+
+    # ------------------- ПОИСК -------------------
+    def find(self, exact, value, chat_id, now):
+        """Недавний пост в группе с тем же текстом или SimHash не дальше max_distance; None — такого нет."""
+        self._evict(now)
+        slot = self._find_slot(exact, value, chat_id or 0, (now - self.window).timestamp())
+        return self._entry(slot) if slot >= 0 else None
+
+    def claim(self, entry, now):
+        """Проверка и добавление без await между ними: из двух одновременных копий пройдёт одна."""
+        match = self.find(entry.exact, entry.simhash, entry.chat_id, now)
+        if match is None:
+            self.add(entry)
+            self._unsaved.append(entry)
+        return match
+
+    def release(self, entry):
+        """Пост всё-таки не опубликован (например, упёрся в лимит) — отпечаток больше не нужен."""
+        slot = self._exact_slot(entry.exact, entry.chat_id or 0)
+        if slot >= 0:
+            self._free(slot)
+        if entry in self._unsaved:
+            self._unsaved.remove(entry)
+
+    # ------------------- СОДЕРЖИМОЕ -------------------
+    def add(self, entry, now=None):
+        slot = self._exact_slot(entry.exact, entry.chat_id or 0)
+        if slot >= 0:
+            if self._at[slot] >= int(entry.at.timestamp()):
+                return  # уже есть, например свой же отпечаток из общего хранилища
+            self._free(slot)  # старый отпечаток того же текста — его место занимает новый
+        keys = self._keys(entry.exact, entry.simhash)
+        if now is not None:
+            self._evict(now)
+        if self._used == self.capacity:
+            self._pop_oldest()
+
+        slot = (self._start + self._used) % self.capacity
+        values = (int(entry.at.timestamp()), entry.exact, entry.simhash,
+                  entry.user_id or 0, entry.chat_id or 0, entry.message_id or 0)
+        columns = (self._at, self._exact, self._simhash, self._user_id, self._chat_id, self._message_id)
+        if slot == len(self._at):
+            for column, value in zip(columns, values):
+                column.append(value)
+            for chain in self._next:
+                chain.append(-1)
+        else:
+            for column, value in zip(columns, values):
+                column[slot] = value
+        for table, key in enumerate(keys):
+            self._next[table][slot] = self._heads[table][key]
+            self._heads[table][key] = slot
+        self._used += 1
+        self._live += 1
+
+    def _free(self, slot):
+        keys = self._keys(self._exact[slot], self._simhash[slot])
+        for table, key in enumerate(keys):
+            heads, chain = self._heads[table], self._next[table]
+            if heads[key] == slot:
+                heads[key] = chain[slot]
+                continue
+            prev = heads[key]
+            while chain[prev] != slot:
+                prev = chain[prev]
+            chain[prev] = chain[slot]
+        self._at[slot] = 0
+        self._live -= 1
+
+    def _pop_oldest(self):
+        if self._at[self._start]:
+            self._free(self._start)
+        self._start = (self._start + 1) % self.capacity
+        self._used -= 1
+
+    def _evict(self, now):
+        oldest = (now - self.window).timestamp()
+        while self._used and self._at[self._start] <= oldest:
+            self._pop_oldest()
+
+    def clear(self):
+        while self._used:
+            self._pop_oldest()
+        self._unsaved.clear()
+
+    # ------------------- ХРАНИЛИЩЕ -------------------
+    async def load(self):
+        if not self.enabled:
+            return
+        self._loaded_until = datetime.now(timezone.utc)
+        await self._load_since(self._loaded_until - self.window)
+
+    async def _load_since(self, since):
+        async for entry in store.iter_fingerprints(since):
+            self.add(entry)
+        self._evict(datetime.now(timezone.utc))
+
+    def start(self):
+        if self.enabled and self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        try:
+            await self.flush()
+        except Exception as e:
+            log.warning("Не записано отпечатков постов: %s: %s", len(self._unsaved), e)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+                # на общем хранилище посты публикуют и через другие экземпляры; они пишут
+                # с задержкой до FLUSH_INTERVAL, поэтому окно берётся с запасом (повторы add() пропускает)
+                if store.SHARED:
+                    since, self._loaded_until = self._loaded_until, datetime.now(timezone.utc)
+                    await self._load_since(since - timedelta(seconds=2 * FLUSH_INTERVAL))
+                if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+                    self._pruned_at = time.monotonic()
+                    await store.delete_fingerprints_before(datetime.now(timezone.utc) - self.window)
+            except Exception as e:
+                log.warning("Отпечатки постов: ошибка записи: %s", e)
+
+    async def flush(self):
+        if not self._unsaved:
+            return
+        entries, self._unsaved = self._unsaved, []
+        try:
+            await store.add_fingerprints(entries)
+        except BaseException:
+            self._unsaved[:0] = entries
+            raise
+
+
+duplicates = DuplicateIndex()
+
+
+def make_entry(text, user_id, chat_id, message_id, now):
+    """Fingerprint поста или None, если текст слишком короткий для сравнения."""
+    hashes = fingerprint(text)
+    if hashes is None:
+        return None
+    return Fingerprint(now, *hashes, user_id, chat_id, message_id)
@@ -0,0 +1,80 @@
+import asyncio
+import heapq
+from datetime import datetime, timezone
+
+
+# ------------------- ОЧЕРЕДЬ СРОКОВ ДОСТУПА -------------------
+class ExpiryQueue:
+    """
+    Min-heap ближайших сроков окончания доступа, ключ — (group_id, user_id).
+    Устаревшие записи (после /extend или /revoke) не удаляются из кучи сразу,
+    а пропускаются при извлечении — актуальный срок хранится в _deadlines.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def load(self, rows):
+        """rows: ((group_id, user_id), expires_at datetime) из store.list_deadlines()"""
+        self._deadlines = dict(rows)
+        self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def schedule(self, key, expires_at):
+        head = self.next_deadline()
+        self._deadlines[key] = expires_at
+        heapq.heappush(self._heap, (expires_at, key))
+        self._compact()
+        # будим цикл, только если новый срок раньше текущего ближайшего
+        if head is None or expires_at < head:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        self._deadlines.pop(key, None)
+
+    def next_deadline(self):
+        while self._heap:
+            deadline, key = self._heap[0]
+            if self._deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now):
+        due = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                return due
+            _, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            due.append(key)
+
+    async def wait(self, max_timeout=None):
+        """Спит до ближайшего срока, до перепланирования или не дольше max_timeout секунд."""
+        deadline = self.next_deadline()
+        timeout = max_timeout
+        if deadline is not None:
+            timeout = max((deadline - datetime.now(timezone.utc)).total_seconds(), 0)
+            if max_timeout is not None:
+                timeout = min(timeout, max_timeout)
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def _compact(self):
+        # после множества продлений в куче копятся устаревшие записи
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+
+expiry_queue = ExpiryQueue()
@@ -0,0 +1,80 @@
+import html
+import time
+from storage import store, GroupPolicy
+from config import GROUP_ID, ACCESS_DAYS, MAX_POSTS, ADMIN_CONTACT, WARNING_TTL, ACCESS_CACHE_TTL
+
+
+def default_policy(group_id, title=None):
+    """Правила новой группы — из настроек .env."""
+    return GroupPolicy(group_id, title, ACCESS_DAYS, MAX_POSTS, ADMIN_CONTACT, WARNING_TTL)
+
+
+# ------------------- ГРУППЫ И ИХ ПРАВИЛА -------------------
+class GroupRegistry:
+    """
+    Правила всех модерируемых групп в памяти: group_id → GroupPolicy.
+    Хэндлер группы находит правила по chat.id одним обращением к словарю,
+    сколько бы групп ни обслуживал бот; чат, которого нет в словаре, не модерируется.
+    Правила хранятся в store и меняются командой /group. Группа GROUP_ID
+    добавляется с правилами по умолчанию при запуске, если её ещё нет.
+    """
+
+    def __init__(self, ttl=ACCESS_CACHE_TTL):
+        self._policies = {}
+        self.ttl = ttl
+        self._loaded_at = float("-inf")
+
+    async def load(self):
+        policies = {policy.group_id: policy for policy in await store.list_groups()}
+        if GROUP_ID and GROUP_ID not in policies:
+            policies[GROUP_ID] = default_policy(GROUP_ID)
+            await store.save_group(policies[GROUP_ID])
+        self._policies = policies
+        self._loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._policies)
+
+    def __iter__(self):
+        return iter(sorted(self._policies.values()))
+
+    def get(self, group_id):
+        return self._policies.get(group_id)
+
+    def default(self):
+        """Группа команд без g<group_id>: GROUP_ID или единственная. None — групп несколько и выбрать нельзя."""
+        if GROUP_ID in self._policies:
+            return self._policies[GROUP_ID]
+        if len(self._policies) == 1:
+            return next(iter(self._policies.values()))
+        return None
+
+    def title(self, group_id, escape=True):
+        """Название группы для текста сообщения; escape — для разметки HTML, в которой бот пишет по умолчанию."""
+        policy = self._policies.get(group_id)
+        if not policy or not policy.title:
+            return f"ID {group_id}"
+        return html.escape(policy.title) if escape else policy.title
+
+    # ------------------- ОБЩЕЕ ХРАНИЛИЩЕ -------------------
+    def stale(self):
+        """На общем хранилище группу могли добавить или изменить через другой экземпляр."""
+        return bool(self.ttl) and time.monotonic() - self._loaded_at >= self.ttl
+
+    async def refresh(self):
+        # отметка до await: пока правила читаются, остальные сообщения не запускают ещё одну загрузку
+        self._loaded_at = time.monotonic()
+        self._policies = {policy.group_id: policy for policy in await store.list_groups()}
+
+    # ------------------- ИЗМЕНЕНИЕ -------------------
+    async def save(self, policy):
+        await store.save_group(policy)
+        self._policies[policy.group_id] = policy
+
+    async def remove(self, group_id):
+        removed = await store.delete_group(group_id)
+        self._policies.pop(group_id, None)
+        return removed
+
+
+groups = GroupRegistry()
@@ -0,0 +1,161 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from storage import store, Event
+from config import JOURNAL_BUFFER, JOURNAL_BATCH, JOURNAL_FLUSH_INTERVAL, JOURNAL_RETENTION_DAYS
+from services.metrics import registry
+
+log = logging.getLogger(__name__)
+
+# Виды событий
+POST_ACCEPTED = "post_accepted"
+POST_DELETED_NO_ACCESS = "post_deleted_no_access"
+POST_DELETED_LIMIT = "post_deleted_limit"
+POST_DELETED_DUPLICATE = "post_deleted_duplicate"
+APPROVED = "approved"
+DENIED = "denied"
+EXPIRED = "expired"
+REVOKED = "revoked"
+EXTENDED = "extended"
+LIMIT_CHANGED = "limit_changed"
+POSTS_RESET = "posts_reset"
+GROUP_CHANGED = "group_changed"
+
+# Виды событий в сводке /report — и колонки её выгрузки по дням
+REPORT_KINDS = (
+    POST_ACCEPTED, POST_DELETED_NO_ACCESS, POST_DELETED_LIMIT, POST_DELETED_DUPLICATE,
+    APPROVED, DENIED, EXPIRED, REVOKED, EXTENDED,
+)
+
+PRUNE_INTERVAL = 3600  # как часто удалять события старше JOURNAL_RETENTION_DAYS (сек)
+
+
+# ------------------- ЖУРНАЛ СОБЫТИЙ -------------------
+class Journal:
+    """
+    Журнал модерации с отложенной записью. record() только кладёт событие
+    в кольцевой буфер — хэндлер не ждёт хранилища. Фоновая задача раз в
+    JOURNAL_FLUSH_INTERVAL секунд (или как только набралась пачка) пишет
+    события пачками по JOURNAL_BATCH одной транзакцией вместе со счётчиками
+    сводки (/report) и удаляет старые события; счётчики остаются.
+    Если хранилище недоступно дольше, чем помещается в буфер, теряются
+    самые старые события — их число видно в метрике journal_dropped_total.
+    """
+
+    def __init__(self, capacity=JOURNAL_BUFFER, batch=JOURNAL_BATCH, interval=JOURNAL_FLUSH_INTERVAL):
+        self._buffer = deque(maxlen=capacity)
+        self.batch = batch
+        self.interval = interval
+        self._wakeup = asyncio.Event()
+        self._runner = None
+        self._pruned_at = float("-inf")
+
+        self.written = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    # ------------------- ЗАПИСЬ -------------------
+    def record(self, kind, user_id=None, username=None, actor_id=None, chat_id=None, message_id=None, detail=None):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+            registry.inc("journal_dropped_total")
+        self._buffer.append(Event(
+            datetime.now(timezone.utc), kind, user_id, username, actor_id, chat_id, message_id,
+            None if detail is None else str(detail)
+        ))
+        if len(self._buffer) >= self.batch:
+            self._wakeup.set()
+
+    # ------------------- ФОНОВАЯ ЗАПИСЬ -------------------
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу и записывает то, что осталось в буфере."""
+        if self._runner:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        try:
+            while self._buffer:
+                await self.flush()
+        except Exception as e:
+            log.warning("Журнал: не записано %s событий: %s", len(self._buffer), e)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                while self._buffer:
+                    await self.flush()
+                if JOURNAL_RETENTION_DAYS and time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+                    self._pruned_at = time.monotonic()
+                    await store.delete_events_before(
+                        datetime.now(timezone.utc) - timedelta(days=JOURNAL_RETENTION_DAYS)
+                    )
+            except Exception as e:
+                # события остались в буфере, попробуем в следующий раз
+                log.warning("Журнал: ошибка записи: %s", e)
+
+    async def flush(self):
+        """Одна пачка из начала буфера; при ошибке она возвращается на место."""
+        events = [self._buffer.popleft() for _ in range(min(self.batch, len(self._buffer)))]
+        if not events:
+            return
+        try:
+            await store.append_events(events)
+        except BaseException:
+            # пока шла запись, буфер мог заполниться — тогда вытесняются вернувшиеся старые
+            for event in reversed(events):
+                if len(self._buffer) == self._buffer.maxlen:
+                    self.dropped += 1
+                    registry.inc("journal_dropped_total")
+                    continue
+                self._buffer.appendleft(event)
+            raise
+        self.written += len(events)
+
+
+journal = Journal()
+
+
+# ------------------- ВЫГРУЗКА -------------------
+def _row(event):
+    return {**event._asdict(), "at": event.at.isoformat()}
+
+
+def export_csv(events) -> bytes:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=Event._fields)
+    writer.writeheader()
+    for event in events:
+        writer.writerow(_row(event))
+    # BOM — чтобы Excel открыл кириллицу без мастера импорта
+    return out.getvalue().encode("utf-8-sig")
+
+
+def export_jsonl(events) -> bytes:
+    return "".join(json.dumps(_row(event), ensure_ascii=False) + "\n" for event in events).encode()
+
+
+def export_days_csv(days) -> bytes:
+    """[(номер дня, {вид: событий})] → CSV: дата и по колонке на каждый вид REPORT_KINDS."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(("day", *REPORT_KINDS))
+    for day, counts in days:
+        writer.writerow((date.fromordinal(day).isoformat(), *(counts.get(kind, 0) for kind in REPORT_KINDS)))
+    return out.getvalue().encode("utf-8-sig")
@@ -0,0 +1,220 @@
+import contextvars
+import copy
+import json
+import logging
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from aiogram import BaseMiddleware
+from config import (
+    LOG_LEVEL,
+    LOG_LEVELS,
+    LOG_FORMAT,
+    LOG_FILE,
+    LOG_MAX_BYTES,
+    LOG_BACKUPS,
+    LOG_RATE_LIMIT,
+    LOG_RATE_INTERVAL,
+    LOG_SLOW_HANDLER,
+)
+
+QUEUE_SIZE = 10000  # записей ждут потока записи; сверх — теряются, а не блокируют цикл событий
+FIELDS = ("update_id", "user_id", "chat_id", "handler", "latency_ms", "suppressed")
+
+log = logging.getLogger(__name__)
+_context = contextvars.ContextVar("log_context", default=None)
+
+
+# ------------------- КОНТЕКСТ ЗАПИСЕЙ -------------------
+def scope(**fields):
+    """Новый контекст (апдейт в обработчике планировщика). Вернуть — reset(token)."""
+    return _context.set(dict(fields))
+
+
+def bind(**fields):
+    """Дополняет текущий контекст; если его нет — создаёт, тогда вернёт токен для reset()."""
+    context = _context.get()
+    if context is None:
+        return scope(**fields)
+    context.update(fields)
+    return None
+
+
+def reset(token):
+    if token is not None:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет в запись поля контекста: user_id, chat_id, хэндлер и т.д."""
+
+    def filter(self, record):
+        context = _context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Не больше limit предупреждений и ошибок из одного места кода за interval
+    секунд. Сколько подавлено, пишется в поле suppressed первой записи
+    следующего окна. INFO и DEBUG не ограничиваются.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, interval=LOG_RATE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}  # (файл, строка) -> [начало окна, записано, подавлено]
+
+    def filter(self, record):
+        if not self.limit or record.levelno < logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            if window and window[2]:
+                record.suppressed = window[2]
+            self._windows[key] = [now, 1, 0]
+            return True
+        if window[1] < self.limit:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+# ------------------- ФОРМАТ -------------------
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Для чтения глазами: поля контекста — в конце строки."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = [f"{field}={getattr(record, field)}" for field in FIELDS if getattr(record, field, None) is not None]
+        if not fields:
+            return line
+        head, sep, tail = line.partition("\n")  # traceback остаётся ниже
+        return f"{head} [{' '.join(fields)}]{sep}{tail}"
+
+
+# ------------------- ОЧЕРЕДЬ ЗАПИСЕЙ -------------------
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    В цикле событий запись только ставится в очередь: JSON, traceback и запись
+    в файл — в потоке QueueListener. Переполненная очередь не ждёт, запись теряется.
+    """
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # аргументы подставляются сразу: объекты могут измениться, пока запись ждёт потока
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+
+
+def start():
+    """Весь вывод — через очередь и фоновый поток; вызывается до запуска бота."""
+    global _listener
+    if _listener is not None:
+        return
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+    outputs = [logging.StreamHandler(sys.stdout)]
+    if LOG_FILE:
+        outputs.append(RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"))
+    for output in outputs:
+        output.setFormatter(formatter)
+
+    records = queue.Queue(QUEUE_SIZE)
+    handler = _NonBlockingQueueHandler(records)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = QueueListener(records, *outputs)
+    _listener.start()
+
+
+def stop():
+    """Дописывает очередь и останавливает поток записи."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for output in _listener.handlers:
+        output.close()
+    _listener = None
+
+
+# ------------------- ХЭНДЛЕРЫ -------------------
+class HandlerLogMiddleware(BaseMiddleware):
+    """
+    Кладёт в контекст имя хэндлера, чтобы оно попало во все записи апдейта,
+    и пишет время обработки: медленнее LOG_SLOW_HANDLER секунд — предупреждение.
+    """
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        user = getattr(event, "from_user", None)
+        chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+        token = bind(handler=name, user_id=user.id if user else None, chat_id=chat.id if chat else None)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            if latency_ms >= LOG_SLOW_HANDLER * 1000:
+                log.warning("Медленный хэндлер %s", name, extra={"latency_ms": latency_ms})
+            else:
+                log.debug("Хэндлер %s", name, extra={"latency_ms": latency_ms})
+            reset(token)
+
+
+def setup(dp):
+    middleware = HandlerLogMiddleware()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
@@ -0,0 +1,174 @@
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+import database
+from config import (
+    STORAGE_BACKEND,
+    DB_PATH,
+    BACKUP_DIR,
+    BACKUP_INTERVAL_HOURS,
+    BACKUP_KEEP,
+    BACKUP_STEP_PAGES,
+    BACKUP_STEP_DELAY,
+    MAINTENANCE_INTERVAL,
+    MAINTENANCE_IDLE_RATE,
+    VACUUM_STEP_PAGES,
+)
+from services.metrics import registry
+from services.updates import scheduler
+
+log = logging.getLogger(__name__)
+
+CHUNK = 1024 * 1024  # чтение файла для контрольной суммы
+
+
+class Backup(NamedTuple):
+    path: str
+    size: int
+    pages: int
+    seconds: float
+    sha256: str
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def format_size(size):
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "Б" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+# ------------------- ОБСЛУЖИВАНИЕ БАЗЫ -------------------
+class Maintenance:
+    """
+    Обслуживание файла SQLite; на STORAGE_BACKEND=redis ничего не делает.
+    - Раз в BACKUP_INTERVAL_HOURS и по /backup — копия через online backup API
+      (database.backup_to) в BACKUP_DIR: в отдельном потоке, по BACKUP_STEP_PAGES
+      страниц, поэтому запись из группы не ждёт. Рядом — файл .sha256 в формате
+      sha256sum, хранятся BACKUP_KEEP последних копий.
+    - Когда трафик низкий (меньше MAINTENANCE_IDLE_RATE апдейтов в секунду
+      и пустая очередь) — incremental vacuum шагами по VACUUM_STEP_PAGES страниц
+      и checkpoint WAL с обрезкой файла -wal.
+    """
+
+    def __init__(self, directory=BACKUP_DIR, keep=BACKUP_KEEP):
+        self.directory = directory
+        self.keep = max(keep, 1)
+        self._stem = os.path.splitext(os.path.basename(DB_PATH))[0]
+        self._lock = asyncio.Lock()  # одна копия за раз
+        self._cancel = threading.Event()
+        self._runner = None
+        self._seen = (time.monotonic(), 0)  # (когда, scheduler.processed) на прошлой проверке
+
+    @property
+    def enabled(self):
+        return STORAGE_BACKEND == "sqlite"
+
+    def backups(self):
+        """Пути копий, от старых к новым (в имени — время UTC)."""
+        return sorted(glob.glob(os.path.join(self.directory, f"{self._stem}-*.db")))
+
+    # ------------------- КОПИЯ -------------------
+    async def backup(self) -> Backup:
+        async with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"{self._stem}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.db"
+            path = os.path.join(self.directory, name)
+            part = path + ".part"
+            started = time.monotonic()
+            try:
+                pages = await asyncio.to_thread(
+                    database.backup_to, part, BACKUP_STEP_PAGES, BACKUP_STEP_DELAY, self._cancel.is_set
+                )
+                checksum = await asyncio.to_thread(_sha256, part)
+            except BaseException:
+                if os.path.exists(part):
+                    os.remove(part)
+                raise
+            os.replace(part, path)
+            with open(path + ".sha256", "w", encoding="utf-8") as f:
+                f.write(f"{checksum}  {name}\n")
+            result = Backup(path, os.path.getsize(path), pages, time.monotonic() - started, checksum)
+
+        self._rotate()
+        registry.observe("backup_seconds", result.seconds)
+        log.info("Копия базы %s: %s, %.2f с", name, format_size(result.size), result.seconds)
+        return result
+
+    def _rotate(self):
+        for path in self.backups()[:-self.keep]:
+            for stale in (path, path + ".sha256"):
+                if os.path.exists(stale):
+                    os.remove(stale)
+
+    def _backup_due(self):
+        if not BACKUP_INTERVAL_HOURS:
+            return False
+        backups = self.backups()
+        return not backups or time.time() - os.path.getmtime(backups[-1]) >= BACKUP_INTERVAL_HOURS * 3600
+
+    # ------------------- СЖАТИЕ -------------------
+    def _quiet(self):
+        """Трафик с прошлой проверки ниже MAINTENANCE_IDLE_RATE и очередь апдейтов пуста."""
+        now, processed = time.monotonic(), scheduler.processed
+        (since, before), self._seen = self._seen, (now, processed)
+        return not scheduler.depth and processed - before <= MAINTENANCE_IDLE_RATE * (now - since)
+
+    async def compact(self):
+        """Incremental vacuum, пока есть свободные страницы и очередь апдейтов пуста, затем checkpoint."""
+        freed = 0
+        while True:
+            released, left = await database.incremental_vacuum(VACUUM_STEP_PAGES)
+            freed += released
+            if not left or not released or scheduler.depth:
+                break
+            await asyncio.sleep(0)  # между шагами успевают записи из группы
+        busy, wal_pages, _ = await database.checkpoint(truncate=True)
+        if freed or wal_pages:
+            log.info("База сжата: освобождено страниц %s, WAL %s страниц%s",
+                     freed, wal_pages, " (не до конца: были читатели)" if busy else "")
+
+    # ------------------- ФОНОВЫЙ ЦИКЛ -------------------
+    def start(self):
+        if self.enabled and self._runner is None:
+            self._cancel.clear()
+            self._seen = (time.monotonic(), scheduler.processed)
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Прерывает копию, если она идёт, и останавливает цикл."""
+        self._cancel.set()
+        if self._runner:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+            started = time.perf_counter()
+            try:
+                if self._backup_due():
+                    await self.backup()
+                if self._quiet():
+                    await self.compact()
+            except Exception:
+                log.exception("Обслуживание базы не выполнено")
+            registry.observe("scheduler_loop_seconds", time.perf_counter() - started, loop="maintenance")
+
+
+maintenance = Maintenance()
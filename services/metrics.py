@@ -0,0 +1,236 @@
+import functools
+import inspect
+import time
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+PREFIX = "tgbot_"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+# ------------------- РЕЕСТР МЕТРИК -------------------
+class Registry:
+    """
+    Счётчики, гистограммы и gauge-функции в формате Prometheus.
+    При METRICS_ENABLED=false все записи — одна проверка флага.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self._counters = {}    # (name, labels) -> число
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._gauges = {}      # name -> функция без аргументов
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, fn):
+        self._gauges[name] = fn
+
+    def histograms(self, name):
+        """[(labels, Histogram)] для /stats"""
+        return [(dict(labels), h) for (n, labels), h in self._histograms.items() if n == name]
+
+    # ------------------- ЭКСПОРТ -------------------
+    def render(self):
+        lines = []
+
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {PREFIX}{name} {self._help[name]}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        for name in sorted({n for n, _ in self._counters}):
+            header(name, "counter")
+            for (n, labels), value in self._counters.items():
+                if n == name:
+                    lines.append(f"{PREFIX}{name}{fmt(labels)} {value}")
+
+        for name in sorted({n for n, _ in self._histograms}):
+            header(name, "histogram")
+            for (n, labels), h in self._histograms.items():
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{PREFIX}{name}_bucket{fmt(labels, [('le', '+Inf')])} {h.count}")
+                lines.append(f"{PREFIX}{name}_sum{fmt(labels)} {h.total}")
+                lines.append(f"{PREFIX}{name}_count{fmt(labels)} {h.count}")
+
+        for name, fn in sorted(self._gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{PREFIX}{name} {fn()}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry(METRICS_ENABLED)
+registry.describe("handler_seconds", "Время работы хэндлера")
+registry.describe("handler_errors_total", "Исключения в хэндлерах")
+registry.describe("db_query_seconds", "Время запроса к хранилищу")
+registry.describe("api_call_seconds", "Время вызова Bot API")
+registry.describe("api_errors_total", "Ошибки вызовов Bot API")
+registry.describe("scheduler_loop_seconds", "Длительность итерации фонового цикла")
+registry.describe("throttled_total", "Апдейты, отброшенные анти-флудом")
+registry.describe("journal_dropped_total", "События журнала, вытесненные из переполненного буфера")
+registry.describe("startup_seconds", "Длительность этапа запуска")
+registry.describe("backup_seconds", "Длительность копии базы")
+registry.describe("update_wait_seconds", "Ожидание апдейта в очереди планировщика")
+registry.describe("updates_shed_total", "Апдейты, выброшенные при перегрузке")
+
+
+# ------------------- ЗАПРОСЫ К ХРАНИЛИЩУ -------------------
+def timed_query(func):
+    """Декоратор для функций хранилища (database.py, services/redis_store.py). Без метрик возвращает функцию как есть."""
+    if not METRICS_ENABLED:
+        return func
+
+    name = func.__name__
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def gen_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                async for item in func(*args, **kwargs):
+                    yield item
+            finally:
+                registry.observe("db_query_seconds", time.perf_counter() - started, query=name)
+        return gen_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            registry.observe("db_query_seconds", time.perf_counter() - started, query=name)
+    return wrapper
+
+
+# ------------------- ХЭНДЛЕРЫ -------------------
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            registry.inc("handler_errors_total", handler=name)
+            raise
+        finally:
+            registry.observe("handler_seconds", time.perf_counter() - started, handler=name)
+
+
+# ------------------- BOT API -------------------
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            registry.inc("api_errors_total", method=name)
+            raise
+        finally:
+            registry.observe("api_call_seconds", time.perf_counter() - started, method=name)
+
+
+def setup(dp, bot):
+    if not METRICS_ENABLED:
+        return
+    middleware = HandlerMetricsMiddleware()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+    bot.session.middleware(ApiMetricsMiddleware())
+
+    from services.access_cache import access_cache
+    from services.albums import albums
+    from services.deleter import deleter
+    from services.duplicates import duplicates
+    from services.expiry import expiry_queue
+    from services.journal import journal
+    from services.outbox import outbox
+    from services.updates import scheduler
+    registry.gauge("updates_pending", lambda: scheduler.depth)
+    registry.gauge("updates_in_flight", lambda: scheduler.in_flight)
+    registry.gauge("updates_keys", lambda: scheduler.keys)
+    registry.gauge("outbox_depth", lambda: outbox.depth)
+    registry.gauge("outbox_latency_p99_seconds", lambda: outbox.stats()["latency_p99"])
+    registry.gauge("deleter_pending", lambda: len(deleter))
+    registry.gauge("expiry_pending", lambda: len(expiry_queue))
+    registry.gauge("access_cache_entries", lambda: len(access_cache))
+    registry.gauge("journal_pending", lambda: len(journal))
+    registry.gauge("albums_pending", lambda: len(albums))
+    registry.gauge("fingerprints", lambda: len(duplicates))
+
+
+# ------------------- HTTP-ЭНДПОИНТ -------------------
+async def metrics_view(request: web.Request):
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+_runner = None
+
+
+async def start_server():
+    global _runner
+    if not METRICS_ENABLED or not METRICS_PORT:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, METRICS_HOST, METRICS_PORT).start()
+
+
+async def stop_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,249 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections import deque
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from config import (
+    bot,
+    OUTBOX_RATE,
+    OUTBOX_CHAT_INTERVAL,
+    OUTBOX_GROUP_INTERVAL,
+    OUTBOX_CONCURRENCY,
+    OUTBOX_MAX_RETRIES,
+)
+
+log = logging.getLogger(__name__)
+
+MAX_TEXT_LENGTH = 4096
+
+
+class _Item:
+    __slots__ = ("text", "kwargs", "coalesce", "future", "enqueued_at")
+
+    def __init__(self, text, kwargs, coalesce, future):
+        self.text = text
+        self.kwargs = kwargs
+        self.coalesce = coalesce and not kwargs
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+# ------------------- ОЧЕРЕДЬ ИСХОДЯЩИХ СООБЩЕНИЙ -------------------
+class Outbox:
+    """
+    Все уведомления отправляются через эту очередь:
+    - общий лимит сообщений в секунду и отдельный интервал на каждый чат;
+    - разные получатели обслуживаются параллельно, сообщения одному чату — по порядку;
+    - TelegramRetryAfter ставит отправку на паузу, сетевые ошибки повторяются с backoff;
+    - несколько текстов без клавиатуры одному чату склеиваются в одно сообщение.
+    """
+
+    def __init__(self):
+        self._pending = {}       # chat_id -> deque[_Item]
+        self._schedule = []      # heap (когда можно отправлять, chat_id)
+        self._scheduled = set()
+        self._in_flight = set()
+        self._next_at = {}       # chat_id -> monotonic время следующей отправки
+        self._paused_until = 0.0
+        self._tokens = float(OUTBOX_RATE)
+        self._tokens_at = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+        self._tasks = set()
+        self._runner = None
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.coalesced = 0
+        self._latencies = deque(maxlen=1000)
+
+    # ------------------- ПОСТАНОВКА В ОЧЕРЕДЬ -------------------
+    def send(self, chat_id, text, coalesce=True, **kwargs):
+        """
+        Ставит сообщение в очередь и сразу возвращает Future.
+        Результат — отправленный Message или None, если отправить не удалось.
+        coalesce=False — сообщение нельзя склеивать с соседними (его будут править/удалять).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(chat_id, deque()).append(_Item(text, kwargs, coalesce, future))
+        self._arm(chat_id)
+        return future
+
+    def send_many(self, chat_ids, text, **kwargs):
+        return [self.send(chat_id, text, **kwargs) for chat_id in chat_ids]
+
+    def _arm(self, chat_id):
+        if chat_id in self._scheduled or chat_id in self._in_flight or not self._pending.get(chat_id):
+            return
+        ready_at = max(self._next_at.get(chat_id, 0.0), time.monotonic())
+        heapq.heappush(self._schedule, (ready_at, chat_id))
+        self._scheduled.add(chat_id)
+        self._wakeup.set()
+
+    # ------------------- МЕТРИКИ -------------------
+    @property
+    def depth(self):
+        return sum(len(items) for items in self._pending.values())
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return {
+            "depth": self.depth,
+            "in_flight": len(self._in_flight),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "latency_p50": percentile(0.5),
+            "latency_p99": percentile(0.99),
+        }
+
+    # ------------------- ЦИКЛ ОТПРАВКИ -------------------
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=10.0):
+        """Дожидается отправки очереди (не дольше timeout) и останавливает цикл."""
+        deadline = time.monotonic() + timeout
+        while (self.depth or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self._runner:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        # не успели за timeout — эти сообщения не уйдут; кто ждёт их Future, получает None
+        dropped = 0
+        for items in self._pending.values():
+            dropped += len(items)
+            for item in items:
+                if not item.future.done():
+                    item.future.set_result(None)
+        self._pending.clear()
+        self._schedule.clear()
+        self._scheduled.clear()
+        if dropped:
+            log.warning("Очередь отправки остановлена, не отправлено сообщений: %s", dropped)
+
+    async def _run(self):
+        while True:
+            await self._semaphore.acquire()
+            try:
+                chat_id = await self._next_ready()
+                await self._take_token()
+            except BaseException:
+                self._semaphore.release()
+                raise
+
+            task = asyncio.create_task(self._deliver(chat_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _next_ready(self):
+        while True:
+            if not self._schedule:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            ready_at, chat_id = self._schedule[0]
+            delay = max(ready_at, self._paused_until) - time.monotonic()
+            if delay <= 0:
+                heapq.heappop(self._schedule)
+                self._scheduled.discard(chat_id)
+                self._in_flight.add(chat_id)
+                return chat_id
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _take_token(self):
+        # token bucket на все исходящие сообщения бота
+        while True:
+            now = time.monotonic()
+            self._tokens = min(float(OUTBOX_RATE), self._tokens + (now - self._tokens_at) * OUTBOX_RATE)
+            self._tokens_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / OUTBOX_RATE)
+
+    def _take_batch(self, chat_id):
+        items = self._pending[chat_id]
+        batch = [items.popleft()]
+        if not batch[0].coalesce:
+            return batch
+
+        # склеиваем подряд идущие простые тексты одному получателю
+        length = len(batch[0].text)
+        while items and items[0].coalesce and length + 2 + len(items[0].text) <= MAX_TEXT_LENGTH:
+            length += 2 + len(items[0].text)
+            batch.append(items.popleft())
+        self.coalesced += len(batch) - 1
+        return batch
+
+    async def _deliver(self, chat_id):
+        batch = self._take_batch(chat_id)
+        text = "\n\n".join(item.text for item in batch)
+        result = None
+        try:
+            for attempt in range(OUTBOX_MAX_RETRIES + 1):
+                try:
+                    result = await bot.send_message(chat_id, text, **batch[0].kwargs)
+                    self.sent += 1
+                    break
+                except TelegramRetryAfter as e:
+                    # флуд-контроль: пауза для всей очереди
+                    self.retries += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                    await asyncio.sleep(e.retry_after)
+                except (TelegramNetworkError, TelegramServerError):
+                    self.retries += 1
+                    if attempt == OUTBOX_MAX_RETRIES:
+                        raise
+                    await asyncio.sleep(min(2 ** attempt, 30))
+            else:
+                self.failed += 1
+        except Exception as e:
+            self.failed += 1
+            log.warning("Не удалось отправить сообщение: %s", e, extra={"chat_id": chat_id})
+        finally:
+            self._semaphore.release()
+            now = time.monotonic()
+            for item in batch:
+                self._latencies.append(now - item.enqueued_at)
+                if not item.future.done():
+                    item.future.set_result(result)
+
+            interval = OUTBOX_GROUP_INTERVAL if chat_id < 0 else OUTBOX_CHAT_INTERVAL
+            self._next_at[chat_id] = now + interval
+            self._in_flight.discard(chat_id)
+            if self._pending.get(chat_id):
+                self._arm(chat_id)
+            else:
+                self._pending.pop(chat_id, None)
+                self._forget_idle_chats(now)
+
+    def _forget_idle_chats(self, now):
+        # интервалы чатов, которым давно ничего не отправляли, больше не нужны
+        if len(self._next_at) > 10000:
+            self._next_at = {chat_id: at for chat_id, at in self._next_at.items() if at > now}
+
+
+outbox = Outbox()
@@ -0,0 +1,18 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from config import DAY_TIMEZONE
+
+# Граница суток для дневного лимита — одна на весь бот
+DAY_TZ = ZoneInfo(DAY_TIMEZONE)
+
+
+# ------------------- НОМЕР ДНЯ -------------------
+def day_index(now=None) -> int:
+    """Порядковый номер текущих суток в часовом поясе DAY_TIMEZONE."""
+    now = now or datetime.now(timezone.utc)
+    return now.astimezone(DAY_TZ).date().toordinal()
+
+
+def used_today(posts_today, quota_day, today) -> int:
+    """Счётчик действителен только для того дня, в который был записан."""
+    return posts_today if quota_day == today else 0
@@ -0,0 +1,846 @@
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from config import REDIS_URL, REDIS_PREFIX, REDIS_POOL, REQUEST_COOLDOWN, DECISION_TTL_DAYS, GROUP_ID
+from database import AccessRow, QuotaResult, Event, Decision, Fingerprint, GroupPolicy, NO_EXPIRY, rollup
+from services.metrics import timed_query
+from services.quota import day_index, used_today
+from services.resp import RespClient, RespError
+
+log = logging.getLogger(__name__)
+
+# Бэкенд хранилища на сервере с протоколом Redis (STORAGE_BACKEND=redis).
+# Состояние общее, поэтому с одним REDIS_URL могут работать несколько экземпляров бота.
+#
+#   groups                       хэш: group_id → правила группы (JSON)
+#   access:<группа>:<id>         хэш: username, expires_at, last_post_date (секунды Unix), max_posts
+#   access                       zset: "<группа>:<id>" → срок доступа (epoch), он же список всех доступов
+#   access_expiry:<группа>       zset доступов группы для /list по сроку: "<срок>:<id>" с одинаковым score,
+#                                числа дополнены нулями до 20 цифр — порядок строк совпадает с (срок, id)
+#   access_users:<группа>        zset доступов группы: id → id, для /list по id и массовых команд
+#   quota:<группа>:<id>:<день>   счётчик постов за день, живёт двое суток
+#   request:<id>                 время последней заявки (секунды Unix), живёт REQUEST_COOLDOWN
+#   requests                     zset: user_id → время заявки, для загрузки при старте
+#   lease:<имя>                  владелец аренды фоновой задачи
+#   decision:<token>             хэш заявки: group_id, user_id, username, created_at, action, actor_id, decided_at
+#   decision:<token>:cards       хэш карточек заявки: admin_id → message_id; оба живут DECISION_TTL_DAYS
+#   state:<имя>                  состояние бота между перезапусками (JSON)
+#   fingerprints                 zset: отпечаток поста в JSON → время (epoch)
+#   events                       zset: событие журнала в JSON → время (epoch)
+#   events:seq                   счётчик номеров событий — одинаковые события остаются разными элементами
+#   stats:<группа>:<вид>         хэш: дерево Фенвика по номерам дней — итог событий вида с начала учёта
+#   stats:<группа>:day:<день>    хэш: вид события → сколько их было за день, для выгрузки по дням
+#   stats:<группа>:user:<id>     хэш: вид события → сколько их было с пользователем
+#   stats:seq                    номер последнего события журнала, учтённого при первом заполнении сводки
+_client: Optional[RespClient] = None
+
+SHARED = True
+
+ACCESS_FIELDS = ("max_posts", "username", "expires_at", "last_post_date")
+QUOTA_TTL = 2 * 24 * 3600
+WATCH_RETRIES = 5
+QUOTA_RETRIES = 50  # посты одного пользователя могут идти пачкой — конфликтов WATCH больше
+
+
+def _key(*parts):
+    return REDIS_PREFIX + ":".join(str(part) for part in parts)
+
+
+GROUPS = _key("groups")
+ACCESS_INDEX = _key("access")
+ACCESS_INDEXED = _key("access_indexed")
+ACCESS_SCAN_CHUNK = 200  # ключей индекса группы за один запрос, когда страницу отбирает фильтр
+REQUESTS_INDEX = _key("requests")
+FINGERPRINTS = _key("fingerprints")
+EVENTS = _key("events")
+EVENTS_SEQ = _key("events", "seq")
+EVENTS_WINDOW = 24 * 3600  # выгрузка журнала читается окнами по столько секунд
+STATS_SEQ = _key("stats", "seq")
+STATS_TREE_SIZE = 1 << 20  # номера дней (date.toordinal) до 2870 года
+STATS_DAYS_CHUNK = 100  # дней в одном конвейере выгрузки по дням
+
+
+# время — целые секунды Unix, как в SQLite; наружу — datetime
+def _ts(value):
+    return int(value.timestamp())
+
+
+def _dt(value):
+    return datetime.fromtimestamp(int(value), timezone.utc) if value is not None else None
+
+
+# ------------------- ПОДКЛЮЧЕНИЕ -------------------
+async def connect():
+    global _client
+    if _client is not None:
+        return
+    _client = RespClient(REDIS_URL, REDIS_POOL)
+    await _client.connect()
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def init_db():
+    """Схемы нет — ключи создаются при первой записи; переносятся доступы без группы и заполняется сводка."""
+    await _migrate_groups()
+    await _migrate_group_indexes()
+    await _migrate_stats()
+
+
+async def _migrate_groups():
+    """
+    До появления нескольких групп доступы хранились как access:<id> и quota:<id>:<день>.
+    Они переносятся в группу GROUP_ID одним MULTI/EXEC под WATCH на индекс доступов:
+    если параллельно запущенный экземпляр успел первым, попытка повторяется и уже ничего не находит.
+    """
+    for _ in range(WATCH_RETRIES):
+        async with _client.connection() as conn:
+            await conn.execute("WATCH", ACCESS_INDEX)
+            reply = await conn.execute("ZRANGE", ACCESS_INDEX, 0, -1, "WITHSCORES")
+            legacy = [(reply[i], reply[i + 1]) for i in range(0, len(reply), 2) if ":" not in reply[i]]
+            if not legacy:
+                await conn.execute("UNWATCH")
+                return
+            if not GROUP_ID:
+                await conn.execute("UNWATCH")
+                raise RuntimeError("Доступы в Redis пока без группы — укажите в GROUP_ID, к какой они относятся")
+
+            today = day_index(datetime.now(timezone.utc))
+            replies = await conn.pipeline([
+                command for user_id, _ in legacy
+                for command in (["HGETALL", _key("access", user_id)], ["GET", _key("quota", user_id, today)])
+            ])
+            commands = []
+            for i, (user_id, score) in enumerate(legacy):
+                fields, posts = replies[2 * i], replies[2 * i + 1]
+                if fields:
+                    commands.append(["HSET", _key("access", GROUP_ID, user_id), *fields])
+                if posts:
+                    commands.append(["SET", _key("quota", GROUP_ID, user_id, today), posts, "EX", QUOTA_TTL])
+                expires_at = None if float(score) == float("inf") else int(float(score))
+                commands += [
+                    ["DEL", _key("access", user_id), _key("quota", user_id, today)],
+                    ["ZREM", ACCESS_INDEX, user_id],
+                    *_index_commands(GROUP_ID, int(user_id), None, expires_at),
+                ]
+            result = await conn.pipeline([["MULTI"], *commands, ["EXEC"]])
+            if result[-1] is not None:
+                log.info("Доступы без группы перенесены в группу %s: %s", GROUP_ID, len(legacy))
+                return
+    raise RespError("не удалось перенести доступы: индекс постоянно меняется")
+
+
+async def _migrate_group_indexes():
+    """
+    Индексы доступов по группам строятся один раз из общего индекса (отметка — access_indexed),
+    дальше их ведут все изменения доступов. WATCH — как у переноса доступов без группы.
+    """
+    for _ in range(WATCH_RETRIES):
+        async with _client.connection() as conn:
+            await conn.execute("WATCH", ACCESS_INDEX, ACCESS_INDEXED)
+            if await conn.execute("EXISTS", ACCESS_INDEXED):
+                await conn.execute("UNWATCH")
+                return
+            reply = await conn.execute("ZRANGE", ACCESS_INDEX, 0, -1, "WITHSCORES")
+            commands = []
+            for i in range(0, len(reply), 2):
+                group_id, user_id = _parse_member(reply[i])
+                expires_at = None if float(reply[i + 1]) == float("inf") else int(float(reply[i + 1]))
+                commands += _index_commands(group_id, user_id, None, expires_at)
+            result = await conn.pipeline([["MULTI"], *commands, ["SET", ACCESS_INDEXED, 1], ["EXEC"]])
+            if result[-1] is not None:
+                if commands:
+                    log.info("Построены индексы доступов по группам: доступов %s", len(reply) // 2)
+                return
+    raise RespError("не удалось построить индексы доступов: индекс постоянно меняется")
+
+
+async def _migrate_stats():
+    """
+    Сводка по журналу, записанному до её появления. Под WATCH на номер событий:
+    если другой экземпляр за это время записал события или заполнил сводку сам,
+    попытка повторяется. Дальше сводку пополняет append_events.
+    """
+    for _ in range(WATCH_RETRIES):
+        async with _client.connection() as conn:
+            await conn.execute("WATCH", EVENTS_SEQ, STATS_SEQ)
+            done, last_id = await conn.pipeline([["EXISTS", STATS_SEQ], ["GET", EVENTS_SEQ]])
+            if done:
+                await conn.execute("UNWATCH")
+                return
+            events = []
+            for member in await conn.execute("ZRANGE", EVENTS, 0, -1):
+                record = json.loads(member)
+                record.pop("id")
+                record["at"] = _dt(record["at"])
+                events.append(Event(**record))
+            result = await conn.pipeline([["MULTI"], *_stats_commands(events), ["SET", STATS_SEQ, last_id or 0], ["EXEC"]])
+            if result[-1] is not None:
+                if events:
+                    log.info("Сводка заполнена по журналу: событий %s", len(events))
+                return
+    raise RespError("не удалось заполнить сводку: журнал постоянно меняется")
+
+
+# ------------------- ГРУППЫ -------------------
+@timed_query
+async def list_groups() -> list[GroupPolicy]:
+    reply = await _client.execute("HGETALL", GROUPS)
+    return sorted(GroupPolicy(*json.loads(value)) for value in _pairs(reply).values())
+
+
+@timed_query
+async def save_group(policy):
+    await _client.execute("HSET", GROUPS, policy.group_id, json.dumps(policy, ensure_ascii=False))
+
+
+@timed_query
+async def delete_group(group_id) -> bool:
+    """Группа больше не модерируется; доступы в ней остаются до своего срока."""
+    return bool(await _client.execute("HDEL", GROUPS, group_id))
+
+
+# ------------------- ЧТЕНИЕ ДОСТУПОВ -------------------
+# Доступ выдаётся в конкретной группе: ключ записи — (group_id, user_id),
+# в индексе доступов — строка "<group_id>:<user_id>".
+def _member(group_id, user_id):
+    return f"{group_id}:{user_id}"
+
+
+def _parse_member(member):
+    group_id, user_id = member.split(":")
+    return int(group_id), int(user_id)
+
+
+def _by_expiry(group_id):
+    return _key("access_expiry", group_id)
+
+
+def _by_user(group_id):
+    return _key("access_users", group_id)
+
+
+def _expiry_member(expires_at, user_id):
+    """Элемент access_expiry:<группа>; expires_at — секунды Unix (число или строка из хэша) или None."""
+    return f"{NO_EXPIRY if expires_at is None else int(expires_at):020d}:{user_id:020d}"
+
+
+def _index_commands(group_id, user_id, previous, expires_at):
+    """
+    Команды, ставящие доступ в индексы со сроком expires_at (секунды Unix или None).
+    previous — прежний срок из хэша: его элемент убирается из индекса по сроку.
+    """
+    return [
+        ["ZADD", ACCESS_INDEX, "+inf" if expires_at is None else expires_at, _member(group_id, user_id)],
+        ["ZREM", _by_expiry(group_id), _expiry_member(previous, user_id)],
+        ["ZADD", _by_expiry(group_id), 0, _expiry_member(expires_at, user_id)],
+        ["ZADD", _by_user(group_id), user_id, user_id],
+    ]
+
+
+def _unindex_commands(group_id, user_id, previous):
+    return [
+        ["ZREM", ACCESS_INDEX, _member(group_id, user_id)],
+        ["ZREM", _by_expiry(group_id), _expiry_member(previous, user_id)],
+        ["ZREM", _by_user(group_id), user_id],
+    ]
+
+
+async def _load_rows(keys, today) -> list[AccessRow]:
+    commands = []
+    for group_id, user_id in keys:
+        commands.append(["HMGET", _key("access", group_id, user_id), *ACCESS_FIELDS])
+        commands.append(["GET", _key("quota", group_id, user_id, today)])
+    replies = await _client.pipeline(commands)
+
+    rows = []
+    for i, (group_id, user_id) in enumerate(keys):
+        (max_posts, username, expires_at, last_post_date), posts = replies[2 * i], replies[2 * i + 1]
+        if max_posts is None:
+            continue
+        posts = int(posts or 0)
+        rows.append(AccessRow(
+            int(group_id), int(user_id), username, _dt(expires_at), posts, _dt(last_post_date), int(max_posts),
+            today if posts else None
+        ))
+    return rows
+
+
+def _matches(row, flt):
+    if flt is None:
+        return True
+    if flt.expiring_days is not None:
+        if not row.expires_at or row.expires_at > flt.now + timedelta(days=flt.expiring_days):
+            return False
+    if flt.at_limit and used_today(row.posts_today, row.quota_day, day_index(flt.now)) < row.max_posts:
+        return False
+    if flt.username_prefix:
+        if not (row.username or "").lstrip("@").lower().startswith(flt.username_prefix.lower()):
+            return False
+    return True
+
+
+def _expiring_bound(flt):
+    """Верхняя граница ZRANGEBYLEX для фильтра «истекают за N дней» или None."""
+    if flt is None or flt.expiring_days is None:
+        return None
+    return f"({_ts(flt.now + timedelta(days=flt.expiring_days)) + 1:020d}"
+
+
+@timed_query
+async def get_access(group_id, user_id) -> Optional[AccessRow]:
+    rows = await _load_rows([(group_id, user_id)], day_index(datetime.now(timezone.utc)))
+    return rows[0] if rows else None
+
+
+@timed_query
+async def list_access() -> list[AccessRow]:
+    """Доступы во всех группах."""
+    keys = [_parse_member(member) for member in await _client.execute("ZRANGE", ACCESS_INDEX, 0, -1)]
+    return await _load_rows(keys, day_index(datetime.now(timezone.utc)))
+
+
+@timed_query
+async def iter_access_page(group_id, flt=None, by_expiry=False, anchor=None, backwards=False, limit=25):
+    """
+    Тот же порядок и якоря, что у SQLite. Ключи читаются из индекса группы сразу
+    от якоря (ZRANGEBYLEX / ZRANGEBYSCORE … LIMIT), записи — только для них.
+    С фильтром индекс читается кусками, пока страница не наберётся.
+    """
+    today = day_index(datetime.now(timezone.utc))
+    if by_expiry:
+        key, command = _by_expiry(group_id), "ZREVRANGEBYLEX" if backwards else "ZRANGEBYLEX"
+        bound = _expiring_bound(flt) or "+"
+        if anchor is None:
+            start, end = (bound, "-") if backwards else ("-", bound)
+        else:
+            start = "(" + _expiry_member(_ts(anchor[0]) if anchor[0] else None, anchor[1])
+            end = "-" if backwards else bound
+    else:
+        key, command = _by_user(group_id), "ZREVRANGEBYSCORE" if backwards else "ZRANGEBYSCORE"
+        start = ("+inf" if backwards else "-inf") if anchor is None else f"({anchor[1]}"
+        end = "-inf" if backwards else "+inf"
+
+    chunk = limit if flt is None else max(limit, ACCESS_SCAN_CHUNK)
+    while limit > 0:
+        members = await _client.execute(command, key, start, end, "LIMIT", 0, chunk)
+        user_ids = [int(member.split(":")[1]) if by_expiry else int(member) for member in members]
+        for row in await _load_rows([(group_id, user_id) for user_id in user_ids], today):
+            if _matches(row, flt):
+                yield row
+                limit -= 1
+                if not limit:
+                    return
+        if len(members) < chunk:
+            return
+        start = f"({members[-1]}"
+
+
+@timed_query
+async def filter_user_ids(group_id, flt) -> list[int]:
+    """Доступы группы под фильтр; записи читаются, только если фильтр смотрит на них."""
+    bound = _expiring_bound(flt)
+    if bound is not None:
+        members = await _client.execute("ZRANGEBYLEX", _by_expiry(group_id), "-", bound)
+        user_ids = [int(member.split(":")[1]) for member in members]
+    else:
+        user_ids = [int(member) for member in await _client.execute("ZRANGE", _by_user(group_id), 0, -1)]
+    if flt is not None and (flt.at_limit or flt.username_prefix):
+        rows = await _load_rows([(group_id, user_id) for user_id in user_ids], day_index(datetime.now(timezone.utc)))
+        user_ids = [row.user_id for row in rows if _matches(row, flt)]
+    return sorted(user_ids)
+
+
+@timed_query
+async def list_deadlines() -> list[tuple[tuple[int, int], datetime]]:
+    """((group_id, user_id), срок) всех доступов со сроком — для очереди истечения."""
+    reply = await _client.execute("ZRANGEBYSCORE", ACCESS_INDEX, "-inf", "(+inf", "WITHSCORES")
+    return [(_parse_member(reply[i]), _dt(float(reply[i + 1]))) for i in range(0, len(reply), 2)]
+
+
+# ------------------- ИЗМЕНЕНИЕ ДОСТУПОВ -------------------
+async def _update_existing(keys, build):
+    """
+    WATCH на записи доступа, чтение полей, затем MULTI/EXEC с командами build(group_id, user_id, fields).
+    Если запись параллельно изменили, EXEC не выполнится и попытка повторяется.
+    Возвращает [(group_id, user_id, username, результат build)] для найденных записей.
+    """
+    if not keys:
+        return []
+    redis_keys = [_key("access", group_id, user_id) for group_id, user_id in keys]
+    for _ in range(WATCH_RETRIES):
+        async with _client.connection() as conn:
+            await conn.execute("WATCH", *redis_keys)
+            replies = await conn.pipeline([["HMGET", key, *ACCESS_FIELDS] for key in redis_keys])
+            found, commands = [], []
+            for (group_id, user_id), fields in zip(keys, replies):
+                if fields[0] is None:
+                    continue
+                fields = dict(zip(ACCESS_FIELDS, fields))
+                extra, batch = build(group_id, user_id, fields)
+                found.append((group_id, user_id, fields["username"], extra))
+                commands.extend(batch)
+            result = await conn.pipeline([["MULTI"], *commands, ["EXEC"]])
+            if result[-1] is not None:
+                return found
+    raise RespError("не удалось применить изменения: записи постоянно меняются")
+
+
+async def _update_group(group_id, user_ids, build):
+    """_update_existing для пользователей одной группы: [(user_id, username, результат build)]."""
+    found = await _update_existing([(group_id, user_id) for user_id in user_ids], build)
+    return [(user_id, username, extra) for _, user_id, username, extra in found]
+
+
+@timed_query
+async def expire_access(keys, now) -> list[tuple[int, int, Optional[str]]]:
+    """Снимает доступы, срок которых всё ещё <= now — как и в SQLite, продлённые не трогает."""
+    def build(group_id, user_id, fields):
+        if not fields["expires_at"] or _dt(fields["expires_at"]) > now:
+            return False, []
+        return True, [
+            ["DEL", _key("access", group_id, user_id)], *_unindex_commands(group_id, user_id, fields["expires_at"])
+        ]
+
+    found = await _update_existing(keys, build)
+    return [(group_id, user_id, username) for group_id, user_id, username, expired in found if expired]
+
+
+@timed_query
+async def grant_access(group_id, user_id, username, expires_at, max_posts):
+    """
+    Выдаёт доступ в группе и удаляет заявку пользователя одной транзакцией.
+    WATCH на запись доступа — прежний срок нужен, чтобы убрать его из индекса группы.
+    """
+    key = _key("access", group_id, user_id)
+    for _ in range(WATCH_RETRIES):
+        async with _client.connection() as conn:
+            await conn.execute("WATCH", key)
+            previous = await conn.execute("HGET", key, "expires_at")
+            result = await conn.pipeline([
+                ["MULTI"], *_grant_commands(group_id, user_id, username, expires_at, max_posts, previous), ["EXEC"]
+            ])
+            if result[-1] is not None:
+                return
+    raise RespError("не удалось выдать доступ: запись постоянно меняется")
+
+
+def _grant_commands(group_id, user_id, username, expires_at, max_posts, previous):
+    """previous — срок из прежней записи доступа (поле хэша), её элемент убирается из индекса по сроку."""
+    key = _key("access", group_id, user_id)
+    today = day_index(datetime.now(timezone.utc))
+    fields = ["max_posts", max_posts]
+    if expires_at is not None:  # бессрочный доступ — без поля, как NULL в SQLite
+        fields += ["expires_at", _ts(expires_at)]
+    if username is not None:
+        fields += ["username", username]
+    return [
+        ["DEL", key, _key("quota", group_id, user_id, today), _key("request", user_id)],
+        ["HSET", key, *fields],
+        *_index_commands(group_id, user_id, previous, None if expires_at is None else _ts(expires_at)),
+        ["ZREM", REQUESTS_INDEX, user_id],
+    ]
+
+
+@timed_query
+async def delete_access(group_id, user_id) -> bool:
+    return bool(await delete_access_many(group_id, [user_id]))
+
+
+@timed_query
+async def set_expires(group_id, user_id, expires_at):
+    await _update_group(group_id, [user_id], lambda gid, uid, fields: (None, [
+        ["HSET", _key("access", gid, uid), "expires_at", _ts(expires_at)],
+        *_index_commands(gid, uid, fields["expires_at"], _ts(expires_at)),
+    ]))
+
+
+@timed_query
+async def set_max_posts(group_id, user_id, max_posts):
+    await set_max_posts_many(group_id, [user_id], max_posts)
+
+
+@timed_query
+async def reset_posts(group_id, user_id=None):
+    if user_id is None:
+        user_ids = [int(member) for member in await _client.execute("ZRANGE", _by_user(group_id), 0, -1)]
+    else:
+        user_ids = [user_id]
+    if user_ids:
+        await reset_posts_many(group_id, user_ids)
+
+
+# ------------------- МАССОВЫЕ ОПЕРАЦИИ -------------------
+@timed_query
+async def extend_access_many(group_id, user_ids, days, now) -> list[tuple[int, Optional[str], datetime]]:
+    def build(gid, uid, fields):
+        base = _dt(fields["expires_at"]) if fields["expires_at"] else now
+        new_expires = max(base, now) + timedelta(days=days)
+        return new_expires, [
+            ["HSET", _key("access", gid, uid), "expires_at", _ts(new_expires)],
+            *_index_commands(gid, uid, fields["expires_at"], _ts(new_expires)),
+        ]
+
+    return await _update_group(group_id, user_ids, build)
+
+
+@timed_query
+async def set_max_posts_many(group_id, user_ids, max_posts) -> list[tuple[int, Optional[str]]]:
+    found = await _update_group(
+        group_id, user_ids,
+        lambda gid, uid, fields: (None, [["HSET", _key("access", gid, uid), "max_posts", max_posts]])
+    )
+    return [(user_id, username) for user_id, username, _ in found]
+
+
+@timed_query
+async def reset_posts_many(group_id, user_ids) -> list[tuple[int, Optional[str]]]:
+    today = day_index(datetime.now(timezone.utc))
+    found = await _update_group(
+        group_id, user_ids, lambda gid, uid, fields: (None, [["DEL", _key("quota", gid, uid, today)]])
+    )
+    return [(user_id, username) for user_id, username, _ in found]
+
+
+@timed_query
+async def delete_access_many(group_id, user_ids) -> list[tuple[int, Optional[str]]]:
+    found = await _update_group(group_id, user_ids, lambda gid, uid, fields: (None, [
+        ["DEL", _key("access", gid, uid)],
+        *_unindex_commands(gid, uid, fields["expires_at"]),
+    ]))
+    return [(user_id, username) for user_id, username, _ in found]
+
+
+# ------------------- КВОТА ПОСТОВ -------------------
+# Счётчик на день — отдельный ключ. Проверка и +1 идут одним MULTI/EXEC под WATCH
+# на счётчик и запись доступа: из одновременных постов пройти могут ровно max_posts,
+# а запись, снятую между чтением и EXEC, транзакция не создаст заново.
+@timed_query
+async def consume_post(group_id, user_id, username, now) -> Optional[QuotaResult]:
+    """
+    Засчитывает пост в группе, если дневной лимит не исчерпан.
+    None — у пользователя нет доступа в этой группе.
+    """
+    key, quota_key = _key("access", group_id, user_id), _key("quota", group_id, user_id, day_index(now))
+    for _ in range(QUOTA_RETRIES):
+        async with _client.connection() as conn:
+            await conn.execute("WATCH", key, quota_key)
+            max_posts, count = await conn.pipeline([["HGET", key, "max_posts"], ["GET", quota_key]])
+            if max_posts is None:
+                await conn.execute("UNWATCH")
+                return None
+            max_posts, count = int(max_posts), int(count or 0)
+            if count >= max_posts:
+                await conn.execute("UNWATCH")
+                return QuotaResult(False, count, max_posts)
+            fields = ["last_post_date", _ts(now)] + (["username", username] if username is not None else [])
+            result = await conn.pipeline([
+                ["MULTI"], ["INCR", quota_key], ["EXPIRE", quota_key, QUOTA_TTL], ["HSET", key, *fields], ["EXEC"]
+            ])
+            if result[-1] is not None:
+                return QuotaResult(True, result[-1][0], max_posts)
+    raise RespError("не удалось засчитать пост: счётчик постоянно меняется")
+
+
+# ------------------- ЗАЯВКИ -------------------
+@timed_query
+async def list_requests_since(requested_at) -> list[tuple[int, datetime]]:
+    reply = await _client.execute(
+        "ZRANGEBYSCORE", REQUESTS_INDEX, f"({_ts(requested_at)}", "+inf", "WITHSCORES"
+    )
+    return [(int(reply[i]), _dt(float(reply[i + 1]))) for i in range(0, len(reply), 2)]
+
+
+@timed_query
+async def claim_request(user_id, username, now, cooldown) -> Optional[datetime]:
+    """
+    Записывает заявку, если прошлая старше cooldown секунд (SET NX с TTL).
+    None — заявка принята, иначе время действующей заявки.
+    """
+    key = _key("request", user_id)
+    if await _client.execute("SET", key, _ts(now), "NX", "PX", int(cooldown * 1000)) == "OK":
+        await _client.execute("ZADD", REQUESTS_INDEX, _ts(now), user_id)
+        return None
+    requested_at = await _client.execute("GET", key)
+    # ключ мог истечь между SET и GET — тогда считаем, что заявка только что подана
+    return _dt(requested_at) if requested_at else now
+
+
+@timed_query
+async def add_request(user_id, username, requested_at):
+    await _client.pipeline(_request_commands(user_id, requested_at))
+
+
+def _request_commands(user_id, requested_at):
+    return [
+        ["SET", _key("request", user_id), _ts(requested_at), "PX", REQUEST_COOLDOWN * 1000],
+        ["ZADD", REQUESTS_INDEX, _ts(requested_at), user_id],
+    ]
+
+
+@timed_query
+async def delete_requests_before(requested_at):
+    await _client.execute("ZREMRANGEBYSCORE", REQUESTS_INDEX, "-inf", _ts(requested_at))
+
+
+# ------------------- РЕШЕНИЯ ПО ЗАЯВКАМ -------------------
+DECISION_TTL = DECISION_TTL_DAYS * 24 * 3600
+
+
+def _pairs(reply):
+    """Ответ HGETALL [поле, значение, ...] → dict"""
+    return dict(zip(reply[::2], reply[1::2]))
+
+
+def _decision(token, fields, cards) -> Optional[Decision]:
+    if not fields:
+        return None
+    fields, cards = _pairs(fields), _pairs(cards)
+    # заявки, разосланные до появления нескольких групп, относятся к GROUP_ID
+    return Decision(
+        token, int(fields.get("group_id", GROUP_ID)), int(fields["user_id"]), fields.get("username"), _dt(fields["created_at"]),
+        fields.get("action"), int(fields["actor_id"]) if "actor_id" in fields else None,
+        _dt(fields.get("decided_at")),
+        tuple((int(admin_id), int(message_id)) for admin_id, message_id in cards.items()),
+    )
+
+
+@timed_query
+async def open_decision(token, group_id, user_id, username, now):
+    """Регистрирует заявку на доступ в группе; повторная регистрация того же token ничего не меняет."""
+    key = _key("decision", token)
+    if await _client.execute("EXISTS", key):
+        return
+    fields = ["group_id", group_id, "user_id", user_id, "created_at", _ts(now)]
+    if username is not None:
+        fields += ["username", username]
+    await _client.pipeline([["HSET", key, *fields], ["EXPIRE", key, DECISION_TTL]])
+
+
+@timed_query
+async def add_decision_cards(token, cards) -> Optional[Decision]:
+    """Запоминает карточки [(admin_id, message_id)] и возвращает заявку — вдруг её уже решили."""
+    key = _key("decision", token, "cards")
+    if cards:
+        pairs = [value for card in cards for value in card]
+        await _client.pipeline([["HSET", key, *pairs], ["EXPIRE", key, DECISION_TTL]])
+    return await get_decision(token)
+
+
+@timed_query
+async def get_decision(token) -> Optional[Decision]:
+    fields, cards = await _client.pipeline([
+        ["HGETALL", _key("decision", token)],
+        ["HGETALL", _key("decision", token, "cards")],
+    ])
+    return _decision(token, fields, cards)
+
+
+@timed_query
+async def decide(token, action, actor_id, now, expires_at=None, max_posts=None) -> tuple[Optional[Decision], bool]:
+    """
+    Применяет первое решение по заявке: WATCH на заявку, затем одним MULTI/EXEC
+    отметка решения и выдача доступа ("approve") или запись заявки ("deny").
+    Возвращает (заявка, True), если решение принято этим вызовом,
+    (заявка, False), если её уже решили, и (None, False), если заявки нет.
+    """
+    key = _key("decision", token)
+    for _ in range(WATCH_RETRIES):
+        async with _client.connection() as conn:
+            await conn.execute("WATCH", key)
+            fields = _pairs(await conn.execute("HGETALL", key))
+            if not fields or "action" in fields:
+                await conn.execute("UNWATCH")
+                break
+            user_id, username = int(fields["user_id"]), fields.get("username")
+            if action == "approve":
+                group_id = int(fields.get("group_id", GROUP_ID))
+                access_key = _key("access", group_id, user_id)
+                await conn.execute("WATCH", access_key)
+                previous = await conn.execute("HGET", access_key, "expires_at")
+                commands = _grant_commands(group_id, user_id, username, expires_at, max_posts, previous)
+            else:
+                commands = _request_commands(user_id, now)
+            result = await conn.pipeline([
+                ["MULTI"],
+                ["HSET", key, "action", action, "actor_id", actor_id, "decided_at", _ts(now)],
+                *commands,
+                ["EXEC"],
+            ])
+            if result[-1] is not None:
+                return await get_decision(token), True
+    else:
+        raise RespError("не удалось принять решение: заявка постоянно меняется")
+    return await get_decision(token), False
+
+
+@timed_query
+async def delete_decisions_before(created_at):
+    # ключи заявок удаляются сами по TTL
+    pass
+
+
+# ------------------- АРЕНДЫ ФОНОВЫХ ЗАДАЧ -------------------
+async def _if_owner(name, owner, command):
+    key = _key("lease", name)
+    async with _client.connection() as conn:
+        await conn.execute("WATCH", key)
+        if await conn.execute("GET", key) != owner:
+            await conn.execute("UNWATCH")
+            return False
+        result = await conn.pipeline([["MULTI"], [command[0], key, *command[1:]], ["EXEC"]])
+        return result[-1] is not None
+
+
+@timed_query
+async def acquire_lease(name, owner, ttl) -> bool:
+    """Берёт или продлевает аренду на ttl секунд. False — она у другого экземпляра."""
+    if await _client.execute("SET", _key("lease", name), owner, "NX", "PX", int(ttl * 1000)) == "OK":
+        return True
+    return await _if_owner(name, owner, ["PEXPIRE", int(ttl * 1000)])
+
+
+@timed_query
+async def release_lease(name, owner):
+    await _if_owner(name, owner, ["DEL"])
+
+
+# ------------------- СОСТОЯНИЕ МЕЖДУ ПЕРЕЗАПУСКАМИ -------------------
+@timed_query
+async def get_state(name) -> Optional[str]:
+    return await _client.execute("GET", _key("state", name))
+
+
+@timed_query
+async def set_state(name, value):
+    await _client.execute("SET", _key("state", name), value)
+
+
+# ------------------- ОТПЕЧАТКИ ПОСТОВ -------------------
+@timed_query
+async def add_fingerprints(entries):
+    args = []
+    for entry in entries:
+        record = [_ts(entry.at), *entry[1:]]
+        args += [record[0], json.dumps(record, separators=(",", ":"))]
+    await _client.execute("ZADD", FINGERPRINTS, *args)
+
+
+@timed_query
+async def iter_fingerprints(since):
+    """Отпечатки с since (включительно) в порядке записи."""
+    start = _ts(since)
+    end = _ts(datetime.now(timezone.utc)) + 1
+    while start < end:
+        stop = min(start + EVENTS_WINDOW, end)
+        for member in await _client.execute("ZRANGEBYSCORE", FINGERPRINTS, start, f"({stop}"):
+            at, *rest = json.loads(member)
+            yield Fingerprint(_dt(at), *rest)
+        start = stop
+
+
+@timed_query
+async def delete_fingerprints_before(before) -> int:
+    return await _client.execute("ZREMRANGEBYSCORE", FINGERPRINTS, "-inf", f"({_ts(before)}")
+
+
+# ------------------- ЖУРНАЛ СОБЫТИЙ -------------------
+@timed_query
+async def append_events(events):
+    last_id = await _client.execute("INCRBY", EVENTS_SEQ, len(events))
+    args = []
+    for seq, event in enumerate(events, start=last_id - len(events) + 1):
+        record = {"id": seq, **event._asdict(), "at": _ts(event.at)}
+        args += [record["at"], json.dumps(record, ensure_ascii=False, separators=(",", ":"))]
+    await _client.pipeline([["MULTI"], ["ZADD", EVENTS, *args], *_stats_commands(events), ["EXEC"]])
+
+
+@timed_query
+async def iter_events(since, until=None, user_id=None, kinds=None):
+    """События с since (включительно) по until (не включительно, None — по сей момент) в порядке записи."""
+    start = _ts(since)
+    end = _ts(until) if until is not None else _ts(datetime.now(timezone.utc)) + 1
+    while start < end:
+        stop = min(start + EVENTS_WINDOW, end)
+        members = await _client.execute("ZRANGEBYSCORE", EVENTS, start, f"({stop}")
+        records = sorted((json.loads(member) for member in members), key=lambda r: (r["at"], r["id"]))
+        for record in records:
+            if user_id is not None and record["user_id"] != user_id:
+                continue
+            if kinds and record["kind"] not in kinds:
+                continue
+            record.pop("id")
+            record["at"] = _dt(record["at"])
+            yield Event(**record)
+        start = stop
+
+
+@timed_query
+async def delete_events_before(before) -> int:
+    return await _client.execute("ZREMRANGEBYSCORE", EVENTS, "-inf", f"({_ts(before)}")
+
+
+# ------------------- СВОДКА -------------------
+# Итог событий за период — разность двух нарастающих итогов по дням. Итоги
+# лежат в дереве Фенвика (хэш stats:<группа>:<вид>): событие дня d увеличивает
+# не больше 20 полей, итог по день d складывается из не больше 20 полей.
+# HINCRBY не требует WATCH, поэтому экземпляры пишут в сводку одновременно.
+def _stats_commands(events):
+    days, users = rollup(events)
+    commands = []
+    for (group_id, kind, day), count in days.items():
+        tree = _key("stats", group_id, kind)
+        node = day
+        while node <= STATS_TREE_SIZE:
+            commands.append(["HINCRBY", tree, node, count])
+            node += node & -node
+        commands.append(["HINCRBY", _key("stats", group_id, "day", day), kind, count])
+    for (group_id, user_id, kind), count in users.items():
+        commands.append(["HINCRBY", _key("stats", group_id, "user", user_id), kind, count])
+    return commands
+
+
+def _prefix_nodes(day):
+    nodes = []
+    while day > 0:
+        nodes.append(day)
+        day -= day & -day
+    return nodes
+
+
+@timed_query
+async def stats_totals(group_id, first_day, last_day, kinds) -> dict[str, int]:
+    """Событий каждого вида в группе с first_day по last_day включительно (номера дней — day_index)."""
+    last, before = _prefix_nodes(last_day), _prefix_nodes(first_day - 1)
+    replies = await _client.pipeline([
+        ["HMGET", _key("stats", group_id, kind), *last, *before] for kind in kinds
+    ])
+    totals = dict.fromkeys(kinds, 0)
+    for kind, values in zip(kinds, replies):
+        values = [int(value or 0) for value in values]
+        totals[kind] = sum(values[:len(last)]) - sum(values[len(last):])
+    return totals
+
+
+@timed_query
+async def iter_stats_days(group_id, first_day, last_day, kinds):
+    """(день, {kind: событий}) по дням периода, в которые что-то было, по порядку."""
+    for start in range(first_day, last_day + 1, STATS_DAYS_CHUNK):
+        days = range(start, min(start + STATS_DAYS_CHUNK, last_day + 1))
+        replies = await _client.pipeline([["HMGET", _key("stats", group_id, "day", day), *kinds] for day in days])
+        for day, values in zip(days, replies):
+            if any(values):
+                yield day, {kind: int(value or 0) for kind, value in zip(kinds, values)}
+
+
+@timed_query
+async def user_stats(group_id, user_id) -> dict[str, int]:
+    """Событий каждого вида с пользователем в группе за всё время учёта."""
+    reply = await _client.execute("HGETALL", _key("stats", group_id, "user", user_id))
+    return {kind: int(total) for kind, total in _pairs(reply).items()}
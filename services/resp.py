@@ -0,0 +1,160 @@
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    """Ошибка, которую вернул сервер (-ERR ...)."""
+
+
+# ------------------- ПРОТОКОЛ -------------------
+def encode(*args):
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        elif isinstance(arg, float):
+            data = repr(arg).encode()
+        else:
+            data = str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+async def read_reply(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("соединение закрыто сервером")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        size = int(body)
+        if size < 0:
+            return None
+        data = await reader.readexactly(size + 2)
+        return data[:-2].decode()
+    if kind == b"*":
+        size = int(body)
+        if size < 0:
+            return None
+        return [await read_reply(reader) for _ in range(size)]
+    raise ConnectionError(f"непонятный ответ: {line!r}")
+
+
+def _check(reply):
+    if isinstance(reply, RespError):
+        raise reply
+    if isinstance(reply, list):
+        for item in reply:
+            if isinstance(item, RespError):
+                raise item
+    return reply
+
+
+# ------------------- СОЕДИНЕНИЕ -------------------
+class Connection:
+    def __init__(self, reader, writer, client):
+        self.reader = reader
+        self.writer = writer
+        self.client = client
+
+    async def execute(self, *args):
+        if self.client.trace:
+            self.client.trace(args[0])
+        self.writer.write(encode(*args))
+        await self.writer.drain()
+        return _check(await read_reply(self.reader))
+
+    async def pipeline(self, commands):
+        """Все команды уходят одним пакетом, ответы читаются по порядку."""
+        if self.client.trace:
+            for command in commands:
+                self.client.trace(command[0])
+        self.writer.write(b"".join(encode(*command) for command in commands))
+        await self.writer.drain()
+        # сначала дочитываем все ответы, чтобы ошибка не оставила их в сокете
+        replies = [await read_reply(self.reader) for _ in commands]
+        return [_check(reply) for reply in replies]
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+# ------------------- ПУЛ -------------------
+class RespClient:
+    """
+    Минимальный асинхронный клиент протокола Redis: пул соединений,
+    конвейер команд и выделенное соединение для WATCH/MULTI/EXEC.
+    Ответы — строки, числа, списки и None, как их прислал сервер.
+    """
+
+    def __init__(self, url, size=4):
+        self.url = urlparse(url)
+        self.size = size
+        self.trace = None  # функция (команда) — для бенчмарка, как set_trace_callback у SQLite
+        self._pool = None
+        self._conns = set()
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.url.hostname or "127.0.0.1", self.url.port or 6379)
+        conn = Connection(reader, writer, self)
+        if self.url.password:
+            await conn.execute("AUTH", self.url.password)
+        db = self.url.path.lstrip("/")
+        if db:
+            await conn.execute("SELECT", int(db))
+        return conn
+
+    async def connect(self):
+        self._pool = asyncio.Queue()
+        for _ in range(self.size):
+            self._pool.put_nowait(None)
+        # первое соединение сразу — чтобы неверный REDIS_URL был виден при запуске
+        async with self.connection() as conn:
+            await conn.execute("PING")
+
+    async def close(self):
+        for conn in list(self._conns):
+            await conn.close()
+        self._conns.clear()
+        self._pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Соединение из пула. Пустые слоты открываются по требованию; после любой
+        ошибки соединение закрывается — в нём могли остаться ответы или WATCH.
+        """
+        conn = await self._pool.get()
+        try:
+            if conn is None:
+                conn = await self._open()
+                self._conns.add(conn)
+            yield conn
+        except BaseException:
+            if conn is not None:
+                self._conns.discard(conn)
+                await conn.close()
+                conn = None
+            raise
+        finally:
+            self._pool.put_nowait(conn)
+
+    async def execute(self, *args):
+        async with self.connection() as conn:
+            return await conn.execute(*args)
+
+    async def pipeline(self, commands):
+        if not commands:
+            return []
+        async with self.connection() as conn:
+            return await conn.pipeline(commands)
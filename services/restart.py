@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import time
+from aiogram import BaseMiddleware
+from config import dp, bot, INSTANCE_ID, SNAPSHOT_INTERVAL, BACKLOG_MAX_UPDATES
+from storage import store
+from services.deleter import deleter
+from services.metrics import registry
+from services.updates import scheduler
+
+log = logging.getLogger(__name__)
+
+GET_UPDATES_LIMIT = 100  # больше getUpdates за раз не отдаёт
+# после недели без апдейтов Telegram может начать нумерацию заново — старый номер ничего не значит
+SNAPSHOT_MAX_AGE = 6 * 24 * 3600
+
+
+# ------------------- ОБРАБОТАННЫЕ АПДЕЙТЫ -------------------
+class UpdateTracker(BaseMiddleware):
+    """
+    Внешний middleware на все апдейты. Помнит границу, до которой всё
+    обработано: апдейты выполняются параллельно, поэтому это не самый
+    большой update_id, а тот, что меньше самого старого ещё не завершённого
+    или ждущего в очереди планировщика.
+    Апдейты не дальше границы из снимка пропускаются — Telegram присылает
+    их повторно, если бот упал до подтверждения.
+    """
+
+    def __init__(self):
+        self.restored = None  # граница из снимка прошлого запуска
+        self._done = None
+        self._in_flight = set()
+
+    def watermark(self):
+        waiting = scheduler.oldest_waiting()
+        unfinished = [*self._in_flight, *([waiting] if waiting is not None else [])]
+        if unfinished:
+            return min(unfinished) - 1
+        return self._done if self._done is not None else self.restored
+
+    async def __call__(self, handler, event, data):
+        update_id = event.update_id
+        if self.restored is not None and update_id <= self.restored:
+            return None
+        self._in_flight.add(update_id)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(update_id)
+            if self._done is None or update_id > self._done:
+                self._done = update_id
+
+
+tracker = UpdateTracker()
+
+
+def setup(dp):
+    dp.update.outer_middleware(tracker)
+
+
+# ------------------- СНИМОК СОСТОЯНИЯ -------------------
+# То, чего нет в хранилище: граница обработанных апдейтов и сообщения,
+# которые бот обещал удалить (предупреждения в группе). Снимок пишется
+# раз в SNAPSHOT_INTERVAL секунд и при остановке, поэтому переживает и падение.
+def _state_name():
+    # на общем хранилище у каждого экземпляра свой снимок
+    return f"snapshot:{INSTANCE_ID}" if store.SHARED else "snapshot"
+
+
+def _collect():
+    return {"update_id": tracker.watermark(), "deletions": deleter.snapshot()}
+
+
+async def save_snapshot(state=None):
+    state = state or _collect()
+    await store.set_state(_state_name(), json.dumps({**state, "saved_at": time.time()}))
+
+
+async def load_snapshot():
+    raw = await store.get_state(_state_name())
+    if not raw:
+        return
+    state = json.loads(raw)
+    if state.get("update_id") is not None and time.time() - state["saved_at"] < SNAPSHOT_MAX_AGE:
+        tracker.restored = state["update_id"]
+    deleter.restore(state.get("deletions", []))
+
+
+async def keep_snapshot():
+    saved = None
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        state = _collect()
+        if state == saved:
+            continue
+        try:
+            await save_snapshot(state)
+            saved = state
+        except Exception as e:
+            log.warning("Не удалось сохранить снимок состояния: %s", e)
+
+
+# ------------------- ПРОПУЩЕННЫЕ АПДЕЙТЫ -------------------
+async def drain_backlog():
+    """
+    Только для polling: до запуска обычного опроса забирает апдейты,
+    накопившиеся за время простоя, пачками по 100 и разбирает их
+    через планировщик (services/updates.py): параллельно, но по порядку
+    для каждого пользователя. Не больше BACKLOG_MAX_UPDATES — остальное
+    догонит обычный опрос. Возвращает число разобранных апдейтов.
+    """
+    offset = tracker.restored + 1 if tracker.restored is not None else None
+    allowed_updates = dp.resolve_used_update_types()
+    total = 0
+    while True:
+        # запрос со следующим offset заодно подтверждает уже разобранную пачку
+        updates = await bot.get_updates(
+            offset=offset, limit=GET_UPDATES_LIMIT, timeout=0, allowed_updates=allowed_updates
+        )
+        if not updates or total >= BACKLOG_MAX_UPDATES:
+            return total
+        updates = updates[:BACKLOG_MAX_UPDATES - total]
+        for update in updates:
+            # backlog=True — хэндлер считает квоту по времени сообщения, а не по текущему
+            await dp.feed_update(bot, update, backlog=True)
+        await scheduler.join()
+        total += len(updates)
+        offset = updates[-1].update_id + 1
+
+
+# ------------------- ВРЕМЯ ЗАПУСКА -------------------
+class StartupTimer:
+    def __init__(self):
+        self.phases = []
+        self._started = self._last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        registry.observe("startup_seconds", now - self._last, phase=phase)
+        self._last = now
+
+    def summary(self):
+        parts = ", ".join(f"{phase} {seconds:.2f}" for phase, seconds in self.phases)
+        return f"Запуск за {self._last - self._started:.2f} с ({parts})"
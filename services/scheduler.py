@@ -1,68 +1,92 @@
 import asyncio
-import aiosqlite
-from datetime import datetime, timedelta, timezone
-from config import bot, ADMIN_IDS, DB_PATH
-from aiogram.exceptions import TelegramBadRequest
+import logging
+import time
+from datetime import datetime, timezone
+from storage import store
+from config import ADMIN_IDS, INSTANCE_ID, LEASE_TTL
+from services.access_cache import access_cache
+from services.expiry import expiry_queue
+from services.groups import groups
+from services.outbox import outbox
+from services.journal import journal, EXPIRED
+from services.metrics import registry
 
-# ------------------- СБРОС ЛИМИТОВ -------------------
-async def reset_daily():
-    while True:
-        now = datetime.now()
-        tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
-        seconds_until_midnight = (tomorrow - now).total_seconds()
-        await asyncio.sleep(seconds_until_midnight)
-        try:
-            async with aiosqlite.connect(DB_PATH) as db:
-                await db.execute("UPDATE access SET posts_today=0")
-                await db.commit()
-            print("✅ Сброс дневных лимитов выполнен")
-        except Exception as e:
-            print(f"Ошибка при сбросе лимитов: {e}")
+log = logging.getLogger(__name__)
 
 
 # ------------------- ПРОВЕРКА ИСТЕКШИХ ДОСТУПОВ -------------------
 async def check_expired():
-    while True:
-        now = datetime.now(timezone.utc)
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute(
-                "SELECT user_id, username, expires_at FROM access WHERE expires_at IS NOT NULL"
-            )
-            rows = await cursor.fetchall()
+    """
+    Снимает истёкшие доступы. Работает только у экземпляра, который держит
+    аренду "expiry": при нескольких ботах на общем хранилище цикл не дублируется,
+    а если держатель упал, аренду через LEASE_TTL подхватит другой.
+    """
+    renew_every = LEASE_TTL / 3
+    leader, renewed_at, loaded_at = False, float("-inf"), float("-inf")
+    try:
+        while True:
+            if time.monotonic() - renewed_at >= renew_every:
+                was_leader = leader
+                try:
+                    leader = await store.acquire_lease("expiry", INSTANCE_ID, LEASE_TTL)
+                except Exception as e:
+                    log.warning("Не удалось продлить аренду expiry: %s", e)
+                    leader = False
+                renewed_at = time.monotonic()
+                # сроки загружаются при получении аренды, дальше очередь перепланируют
+                # одобрение заявки, /extend и /revoke; на общем хранилище их меняют
+                # и другие экземпляры, поэтому там сроки перечитываются при каждом продлении
+                if leader and (not was_leader or store.SHARED and renewed_at - loaded_at >= renew_every):
+                    expiry_queue.load(await store.list_deadlines())
+                    loaded_at = renewed_at
 
-            for user_id, username, expires in rows:
-                if expires and now > datetime.fromisoformat(expires):
-                    # пробуем уведомить пользователя
-                    try:
-                        await bot.send_message(user_id, "⛔ Срок вашего доступа истёк.")
-                    except TelegramBadRequest:
-                        print(f"[WARN] Не удалось отправить сообщение пользователю {user_id}")
+            until_renew = max(renew_every - (time.monotonic() - renewed_at), 0)
+            if leader:
+                await expire_due()
+                await expiry_queue.wait(until_renew)
+            else:
+                await asyncio.sleep(until_renew)
+    finally:
+        # отдаём аренду сразу, чтобы другой экземпляр не ждал LEASE_TTL
+        if leader:
+            try:
+                await store.release_lease("expiry", INSTANCE_ID)
+            except Exception as e:
+                log.warning("Не удалось освободить аренду expiry: %s", e)
 
-                    # удаляем доступ
-                    await db.execute("DELETE FROM access WHERE user_id=?", (user_id,))
-                    await db.commit()
 
-                    # уведомляем админов
-                    for admin_id in ADMIN_IDS:
-                        try:
-                            await bot.send_message(
-                                admin_id,
-                                f"⛔️ Доступ пользователя @{username or user_id} закончился и был снят."
-                            )
-                        except TelegramBadRequest:
-                            print(f"[WARN] Не удалось отправить сообщение админу {admin_id}")
+async def expire_due():
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    due = expiry_queue.pop_due(now)
+    if not due:
+        return
 
-        await asyncio.sleep(60)
+    # удаляем все истёкшие доступы одной транзакцией
+    try:
+        expired = await store.expire_access(due, now)
+    except Exception:
+        log.exception("Ошибка при снятии истёкших доступов")
+        # сроки из очереди уже вынуты — перечитываем их; если хранилище всё ещё недоступно,
+        # вернём вынутые и попробуем на следующем проходе цикла
+        try:
+            expiry_queue.load(await store.list_deadlines())
+        except Exception:
+            log.exception("Не удалось перечитать сроки доступов")
+            for key in due:
+                expiry_queue.schedule(key, now)
+        await asyncio.sleep(5)
+        return
 
+    for group_id, user_id, username in expired:
+        access_cache.remove(group_id, user_id)
+        journal.record(EXPIRED, user_id, username, chat_id=group_id)
 
-# ------------------- УДАЛЕНИЯ ЗАЯВОК ЧЕРЕЗ ЧАС -------------------
-async def cleanup_requests():
-    while True:
-        now = datetime.now(timezone.utc)
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute(
-                "DELETE FROM requests WHERE requested_at <= ?",
-                ((now - timedelta(hours=1)).isoformat(),)
-            )
-            await db.commit()
-        await asyncio.sleep(60)  # проверяем каждую минуту
\ No newline at end of file
+    # уведомления — уже после коммита; админам очередь склеит их в одно сообщение
+    for group_id, user_id, username in expired:
+        title = groups.title(group_id)
+        outbox.send(user_id, f"⛔ Срок вашего доступа в группе «{title}» истёк.")
+        outbox.send_many(
+            ADMIN_IDS, f"⛔️ Доступ пользователя @{username or user_id} в группе «{title}» закончился и был снят."
+        )
+    registry.observe("scheduler_loop_seconds", time.perf_counter() - started, loop="check_expired")
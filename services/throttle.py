@@ -0,0 +1,199 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from aiogram import BaseMiddleware, types
+from storage import store
+from config import (
+    ADMIN_IDS,
+    THROTTLE_RATE,
+    THROTTLE_BURST,
+    THROTTLE_MAX_KEYS,
+    THROTTLE_IDLE_TTL,
+    REQUEST_COOLDOWN,
+)
+from services.metrics import registry
+from services.outbox import outbox
+
+# Команды, которым нужен свой темп: (токенов в секунду, ёмкость ведра).
+# /request и так ограничен часом, поэтому повторы режутся уже на входе.
+COMMAND_LIMITS = {
+    "request": (1 / 30, 2),
+}
+
+
+# ------------------- TOKEN BUCKET -------------------
+class _Bucket:
+    __slots__ = ("tokens", "updated", "notified")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.notified = False
+
+
+class TokenBuckets:
+    """
+    Вёдра на ключ (user_id, команда). Память ограничена: ведро, к которому
+    не обращались THROTTLE_IDLE_TTL секунд, уже полное и просто забывается,
+    а при переполнении вытесняется самое давнее (LRU).
+    """
+
+    def __init__(self, max_keys=THROTTLE_MAX_KEYS, idle_ttl=THROTTLE_IDLE_TTL):
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self._buckets = OrderedDict()  # ключ -> _Bucket, от давних к свежим
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def clear(self):
+        self._buckets.clear()
+
+    def _evict(self, now):
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_keys and now - bucket.updated < self.idle_ttl:
+                break
+            del self._buckets[key]
+
+    def take(self, key, rate, burst, now=None):
+        """
+        Списывает токен. Возвращает (True, 0) или (False, секунд до следующего токена).
+        """
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(burst, now)
+            self._evict(now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.notified = False
+            return True, 0
+        return False, (1 - bucket.tokens) / rate
+
+    def first_rejection(self, key):
+        """True только для первого отказа подряд — чтобы предупредить один раз."""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.notified:
+            return False
+        bucket.notified = True
+        return True
+
+
+buckets = TokenBuckets()
+
+
+# ------------------- MIDDLEWARE -------------------
+def _throttle_key(event):
+    if isinstance(event, types.CallbackQuery):
+        data = event.data or ""
+        return "cb:" + data.split(":", 1)[0].split("_", 1)[0]
+    text = event.text or event.caption or ""
+    if text.startswith("/"):
+        return text.split()[0][1:].split("@", 1)[0].lower()
+    return "text"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware: срабатывает до фильтров и хэндлеров, поэтому
+    флуд в личку и по кнопкам отсекается без обращения к БД.
+    Сообщения в группе не трогает — там их удаляет group_message.
+    """
+
+    async def __call__(self, handler, event, data):
+        if isinstance(event, types.Message) and event.chat.type != "private":
+            return await handler(event, data)
+        user = event.from_user
+        if user is None or user.id in ADMIN_IDS:
+            return await handler(event, data)
+
+        command = _throttle_key(event)
+        rate, burst = COMMAND_LIMITS.get(command, (THROTTLE_RATE, THROTTLE_BURST))
+        key = (user.id, command)
+        allowed, retry_after = buckets.take(key, rate, burst)
+        if allowed:
+            return await handler(event, data)
+
+        registry.inc("throttled_total", command=command)
+        if buckets.first_rejection(key):
+            text = f"⏳ Слишком часто. Попробуй через {int(retry_after) + 1} сек."
+            if isinstance(event, types.CallbackQuery):
+                await event.answer(text)
+            else:
+                outbox.send(event.chat.id, text)
+        return None
+
+
+def setup(dp):
+    middleware = ThrottlingMiddleware()
+    dp.message.outer_middleware(middleware)
+    dp.callback_query.outer_middleware(middleware)
+
+
+# ------------------- ЗАЯВКА РАЗ В ЧАС -------------------
+class RequestCooldown:
+    """
+    Время последней заявки пользователя с фиксированным TTL.
+    Записи упорядочены по времени добавления, поэтому истёкшие
+    снимаются с начала без полного обхода.
+    """
+
+    def __init__(self, ttl=REQUEST_COOLDOWN):
+        self.ttl = timedelta(seconds=ttl)
+        self._entries = OrderedDict()  # user_id -> datetime заявки
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expire(self, now):
+        while self._entries:
+            user_id, requested_at = next(iter(self._entries.items()))
+            if now - requested_at < self.ttl:
+                break
+            del self._entries[user_id]
+
+    def remaining(self, user_id, now):
+        """Сколько ещё ждать до следующей заявки; None — можно подавать."""
+        self._expire(now)
+        requested_at = self._entries.get(user_id)
+        if requested_at is None:
+            return None
+        left = self.ttl - (now - requested_at)
+        return left if left > timedelta(0) else None
+
+    def add(self, user_id, requested_at):
+        self._entries.pop(user_id, None)
+        self._entries[user_id] = requested_at
+        # заявка задним числом (из пропущенных апдейтов) — более новые переставляются
+        # за неё, чтобы _expire по-прежнему снимал записи с начала
+        newer = []
+        for other in reversed(self._entries):
+            if other == user_id:
+                continue
+            if self._entries[other] <= requested_at:
+                break
+            newer.append(other)
+        for other in reversed(newer):
+            self._entries.move_to_end(other)
+
+    def discard(self, user_id):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def load(self):
+        since = datetime.now(timezone.utc) - self.ttl
+        # старые заявки больше ничего не ограничивают
+        await store.delete_requests_before(since)
+        rows = await store.list_requests_since(since)
+        self._entries = OrderedDict(sorted(rows, key=lambda row: row[1]))
+
+
+request_cooldown = RequestCooldown()
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from aiogram import BaseMiddleware
+from config import ADMIN_IDS, UPDATE_CONCURRENCY, UPDATE_MAX_PENDING, UPDATE_SHED_PENDING
+from services.metrics import registry
+from services import logs
+
+log = logging.getLogger(__name__)
+
+KEY_SHED_PENDING = 20  # личных сообщений одного пользователя в очереди, сверх — выбрасываются
+
+
+def order_key(update):
+    """
+    Апдейты с одним ключом выполняются строго по порядку: (чат, пользователь).
+    Посты одного человека в группе проверяются по лимиту в порядке отправки,
+    а разные люди и разные группы разбираются параллельно.
+    """
+    event = update.event
+    user = getattr(event, "from_user", None)
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if user is None and chat is None:
+        return ("update", update.update_id)
+    return (chat.id if chat else None, user.id if user else None)
+
+
+def sheddable(update):
+    """
+    Что можно выбросить при перегрузке: личные сообщения не админов — команду
+    легко повторить. Посты в группе и нажатия кнопок не выбрасываются: непроверенный
+    пост остался бы в группе, а решение по заявке потерялось бы.
+    """
+    message = update.message
+    return (
+        message is not None and message.chat.type == "private"
+        and message.from_user is not None and message.from_user.id not in ADMIN_IDS
+    )
+
+
+class _Job:
+    __slots__ = ("update_id", "run", "enqueued_at")
+
+    def __init__(self, update_id, run):
+        self.update_id = update_id
+        self.run = run
+        self.enqueued_at = time.monotonic()
+
+
+# ------------------- ПЛАНИРОВЩИК АПДЕЙТОВ -------------------
+class UpdateScheduler:
+    """
+    Слой между приёмом апдейтов (polling, webhook, разбор пропущенного при
+    запуске) и хэндлерами:
+    - concurrency обработчиков, медленный хэндлер не задерживает остальных;
+    - у каждого ключа order_key своя очередь: пока апдейт ключа выполняется,
+      следующий того же ключа ждёт, ключи обслуживаются по кругу;
+    - при max_pending апдейтов в очереди submit() ждёт — polling перестаёт
+      забирать новые апдейты, webhook отвечает Telegram позже;
+    - с глубины shed_pending личные сообщения не админов выбрасываются.
+    """
+
+    def __init__(self, concurrency=UPDATE_CONCURRENCY, max_pending=UPDATE_MAX_PENDING,
+                 shed_pending=UPDATE_SHED_PENDING):
+        self.concurrency = max(concurrency, 1)
+        self.max_pending = max(max_pending, 1)
+        self.shed_pending = shed_pending
+        self._queues = {}            # ключ -> deque[_Job]; ключ живёт, пока у него есть апдейты
+        self._ready = None           # asyncio.Queue ключей, ждущих свободного обработчика
+        self._pending = 0            # апдейтов в очередях и в работе
+        self._running = 0
+        self._space = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._space.set()
+        self._idle.set()
+        self._workers = []
+
+        self.processed = 0
+        self.failed = 0
+        self.shed = 0
+        self._latencies = deque(maxlen=1000)
+
+    def __len__(self):
+        return self._pending
+
+    @property
+    def running(self):
+        return bool(self._workers)
+
+    @property
+    def depth(self):
+        """Апдейтов ждёт обработчика."""
+        return self._pending - self._running
+
+    @property
+    def in_flight(self):
+        return self._running
+
+    @property
+    def keys(self):
+        """Ключей с апдейтами в очереди или в работе."""
+        return len(self._queues)
+
+    # ------------------- ПОСТАНОВКА В ОЧЕРЕДЬ -------------------
+    async def submit(self, update, run):
+        """
+        Ставит run() в очередь ключа апдейта. Ждёт, пока очередь переполнена.
+        Возвращает False, если апдейт выброшен из-за перегрузки.
+        """
+        key = order_key(update)
+        queue = self._queues.get(key)
+        if sheddable(update) and (
+            self._pending >= self.shed_pending or (queue is not None and len(queue) >= KEY_SHED_PENDING)
+        ):
+            self.shed += 1
+            registry.inc("updates_shed_total")
+            return False
+
+        while self._pending >= self.max_pending:
+            self._space.clear()
+            await self._space.wait()
+
+        queue = self._queues.get(key)  # пока ждали, очередь ключа могла опустеть и удалиться
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append(_Job(update.update_id, run))
+        self._pending += 1
+        self._idle.clear()
+        return True
+
+    async def join(self):
+        """Ждёт, пока все поставленные апдейты обработаются."""
+        await self._idle.wait()
+
+    def oldest_waiting(self):
+        """Самый ранний update_id, который ещё не начал обрабатываться; None — таких нет."""
+        return min((job.update_id for queue in self._queues.values() for job in queue), default=None)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return {
+            "depth": self.depth,
+            "in_flight": self.in_flight,
+            "keys": self.keys,
+            "processed": self.processed,
+            "failed": self.failed,
+            "shed": self.shed,
+            "latency_p50": percentile(0.5),
+            "latency_p99": percentile(0.99),
+        }
+
+    # ------------------- ОБРАБОТЧИКИ -------------------
+    def start(self):
+        if self._workers:
+            return
+        self._ready = asyncio.Queue()
+        for key in self._queues:
+            self._ready.put_nowait(key)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self, timeout=10.0):
+        """Дожидается очереди (не дольше timeout) и останавливает обработчики."""
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            log.warning("Не дождались обработки апдейтов: %s", self._pending)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            job = queue.popleft()
+            self._running += 1
+            registry.observe("update_wait_seconds", time.monotonic() - job.enqueued_at)
+            # все записи логов этого апдейта получают update_id, а от хэндлера — user_id, chat_id и его имя
+            token = logs.scope(update_id=job.update_id)
+            try:
+                await job.run()
+            except Exception:
+                self.failed += 1
+                log.exception("Апдейт %s не обработан", job.update_id)
+            finally:
+                logs.reset(token)
+                self._running -= 1
+                self._done(key, queue, job)
+
+    def _done(self, key, queue, job):
+        self.processed += 1
+        self._latencies.append(time.monotonic() - job.enqueued_at)
+        if queue:
+            self._ready.put_nowait(key)  # в конец: остальные ключи не ждут, пока этот разберёт всё
+        else:
+            del self._queues[key]
+        self._pending -= 1
+        if self._pending < self.max_pending:
+            self._space.set()
+        if not self._pending:
+            self._idle.set()
+
+
+scheduler = UpdateScheduler()
+
+
+class SchedulerMiddleware(BaseMiddleware):
+    """
+    Самый внешний middleware апдейтов: остальная цепочка (middleware и хэндлеры)
+    выполняется обработчиком планировщика, а приём сразу берёт следующий апдейт.
+    Пока планировщик не запущен, апдейт обрабатывается на месте.
+    """
+
+    async def __call__(self, handler, event, data):
+        if not scheduler.running:
+            return await handler(event, data)
+        await scheduler.submit(event, lambda: handler(event, data))
+        return None
+
+
+def setup(dp):
+    # до остальных внешних middleware (restart.tracker): они выполняются уже в обработчике
+    dp.update.outer_middleware(SchedulerMiddleware())
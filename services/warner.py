@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from aiogram.exceptions import TelegramAPIError
+from config import bot, WARNING_TTL, WARNING_CHAT_LIMIT, WARNING_EDIT_DELAY
+from services.deleter import deleter
+from services.outbox import outbox
+
+log = logging.getLogger(__name__)
+
+
+class _Warning:
+    __slots__ = ("chat_id", "count", "reason", "render", "ttl", "expires_at", "message_id", "edit_pending")
+
+    def __init__(self, chat_id, reason, render, count, ttl):
+        self.chat_id = chat_id
+        self.count = count
+        self.reason = reason
+        self.render = render
+        self.ttl = ttl
+        self.expires_at = time.monotonic() + ttl
+        self.message_id = None
+        self.edit_pending = False
+
+
+# ------------------- ПРЕДУПРЕЖДЕНИЯ В ГРУППЕ -------------------
+class Warner:
+    """
+    Одно живое предупреждение на пользователя: повторные нарушения
+    обновляют текст и продлевают его жизнь, а не присылают новое.
+    В чате одновременно висит не больше WARNING_CHAT_LIMIT предупреждений.
+    """
+
+    def __init__(self):
+        self._live = {}  # (chat_id, user_id) -> _Warning
+        self._tasks = set()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _live_in_chat(self, chat_id, now):
+        return sum(1 for w in self._live.values() if w.chat_id == chat_id and w.expires_at > now)
+
+    def _prune(self, now):
+        for key in [key for key, w in self._live.items() if w.expires_at <= now]:
+            del self._live[key]
+
+    def warn(self, chat_id, user_id, render, reason, count=1, ttl=WARNING_TTL):
+        """
+        render(reason, count) -> текст предупреждения, count — сколько сообщений удалено,
+        ttl — сколько секунд оно висит (у каждой группы своё).
+        Ничего не ждёт: отправка и правка идут в фоне.
+        """
+        now = time.monotonic()
+        key = (chat_id, user_id)
+        warning = self._live.get(key)
+
+        if warning and warning.expires_at > now:
+            warning.count += count
+            warning.reason = reason
+            warning.render = render
+            warning.ttl = ttl
+            warning.expires_at = now + ttl
+            if warning.message_id:
+                deleter.schedule(chat_id, warning.message_id, ttl)
+                self._schedule_edit(warning)
+            return
+
+        self._prune(now)
+        if self._live_in_chat(chat_id, now) >= WARNING_CHAT_LIMIT:
+            return  # в чате и так достаточно предупреждений
+
+        warning = _Warning(chat_id, reason, render, count, ttl)
+        self._live[key] = warning
+        self._spawn(self._post(warning))
+
+    async def _post(self, warning):
+        sent_count = warning.count
+        message = await outbox.send(warning.chat_id, warning.render(warning.reason, sent_count), coalesce=False)
+        if message is None:
+            warning.expires_at = 0
+            return
+        warning.message_id = message.message_id
+        deleter.schedule(warning.chat_id, message.message_id, max(warning.expires_at - time.monotonic(), 0))
+        # пока сообщение стояло в очереди, могли прийти новые нарушения
+        if warning.count != sent_count:
+            self._schedule_edit(warning)
+
+    def _schedule_edit(self, warning):
+        # правки одного предупреждения склеиваются: не чаще раза в WARNING_EDIT_DELAY
+        if warning.edit_pending:
+            return
+        warning.edit_pending = True
+        self._spawn(self._edit(warning))
+
+    async def _edit(self, warning):
+        await asyncio.sleep(WARNING_EDIT_DELAY)
+        warning.edit_pending = False
+        if warning.expires_at <= time.monotonic():
+            return
+        try:
+            await bot.edit_message_text(
+                warning.render(warning.reason, warning.count),
+                chat_id=warning.chat_id,
+                message_id=warning.message_id
+            )
+        except TelegramAPIError as e:
+            log.warning("Не удалось обновить предупреждение: %s", e, extra={"chat_id": warning.chat_id})
+
+
+warner = Warner()
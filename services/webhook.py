@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (
+    dp,
+    bot,
+    WEBHOOK_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    HEALTH_PATH,
+)
+from services.outbox import outbox
+from services.updates import scheduler
+from services import metrics
+
+log = logging.getLogger(__name__)
+
+
+# ------------------- HEALTH CHECK -------------------
+async def health(request: web.Request):
+    return web.json_response(
+        {"status": "ok", "mode": "webhook", "updates": scheduler.stats(), "outbox": outbox.stats()}
+    )
+
+
+# ------------------- ПРИЛОЖЕНИЕ AIOHTTP -------------------
+def build_app():
+    """
+    aiohttp-приложение: POST на WEBHOOK_PATH принимает апдейты Telegram,
+    GET на HEALTH_PATH — проверка живости для балансировщика.
+    Запуск и остановка фоновых задач идут через dp.startup / dp.shutdown.
+    """
+    app = web.Application()
+    app.router.add_get(HEALTH_PATH, health)
+    if metrics.METRICS_ENABLED:
+        app.router.add_get("/metrics", metrics.metrics_view)
+
+    # апдейты без правильного X-Telegram-Bot-Api-Secret-Token получают 401;
+    # ответ на POST — только когда апдейт встал в очередь планировщика: при полной
+    # очереди Telegram ждёт ответа и не шлёт новые, а не плодит задачи у нас
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=False,
+        secret_token=WEBHOOK_SECRET or None,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook():
+    app = build_app()
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    log.info("Webhook-сервер слушает %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    # без WEBHOOK_URL сервер работает локально — апдейты можно слать curl'ом
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
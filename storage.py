@@ -0,0 +1,44 @@
+"""
+Хранилище бота. Бэкенд выбирается переменной STORAGE_BACKEND:
+
+    sqlite — database.py: локальный файл DB_PATH, один процесс бота;
+    redis  — services/redis_store.py: общее состояние на сервере с протоколом Redis,
+             с ним можно запускать несколько экземпляров за балансировщиком.
+
+Оба модуля реализуют один набор функций, и хэндлеры обращаются только к нему:
+
+    connect, close, init_db
+    list_groups, save_group, delete_group
+    get_access, list_access, iter_access_page, filter_user_ids, list_deadlines
+    grant_access, delete_access, set_expires, set_max_posts, reset_posts, expire_access
+    extend_access_many, set_max_posts_many, reset_posts_many, delete_access_many
+    consume_post
+    claim_request, add_request, list_requests_since, delete_requests_before
+    open_decision, add_decision_cards, get_decision, decide, delete_decisions_before
+    acquire_lease, release_lease
+    add_fingerprints, iter_fingerprints, delete_fingerprints_before
+    append_events, iter_events, delete_events_before
+    stats_totals, iter_stats_days, user_stats
+    get_state, set_state
+
+Доступы и квоты принадлежат группе: функции доступов принимают group_id
+первым аргументом, а list_deadlines и expire_access работают с ключами
+(group_id, user_id).
+
+append_events вместе с событиями пополняет сводку: счётчики по группам, дням
+(номера day_index) и пользователям. Её читают stats_totals, iter_stats_days и user_stats.
+
+Время в аргументах и результатах — datetime с часовым поясом; как оно
+хранится (SQLite и Redis держат целые секунды Unix), решает бэкенд.
+
+SHARED — True, если состояние могут менять другие экземпляры (кэши надо перечитывать).
+"""
+from config import STORAGE_BACKEND
+from database import AccessRow, QuotaResult, AccessFilter, Event, Decision, Fingerprint, GroupPolicy  # noqa: F401
+
+if STORAGE_BACKEND == "redis":
+    from services import redis_store as store
+elif STORAGE_BACKEND == "sqlite":
+    import database as store
+else:
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
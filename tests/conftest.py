@@ -0,0 +1,54 @@
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+
+# config.py читает окружение при импорте — задаём его до импорта модулей бота
+os.environ.setdefault("API_TOKEN", "123456:TEST")
+os.environ.setdefault("ADMIN_IDS", "1")
+os.environ.setdefault("GROUP_ID", "-100")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from bench.kv_standin import KVStandin  # noqa: E402
+from services import redis_store  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Пустой файл базы для теста; блокировка записи — своя на цикл событий теста."""
+    path = str(tmp_path / "test.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    monkeypatch.setattr(database, "_write_lock", asyncio.Lock())
+    return path
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend(request, db_path, monkeypatch):
+    """
+    Бэкенд хранилища: модуль и контекст, который подключает его внутри
+    цикла событий теста. Redis — заглушка из bench/kv_standin.py.
+    """
+    @asynccontextmanager
+    async def opened():
+        server = None
+        if request.param == "redis":
+            server = KVStandin()
+            monkeypatch.setattr(redis_store, "REDIS_URL", f"redis://127.0.0.1:{await server.start()}/0")
+            store = redis_store
+        else:
+            store = database
+        await store.connect()
+        try:
+            await store.init_db()
+            yield store
+        finally:
+            await store.close()
+            if server is not None:
+                await server.stop()
+
+    opened.name = request.param
+    return opened
@@ -0,0 +1,41 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import database
+from handlers import admin
+from handlers.admin import parse_events_args, parse_report_args
+from services.journal import Journal
+
+NOW = datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc)
+
+
+def test_events_date_range():
+    since, until, user_id, fmt = parse_events_args(["2026-10-01", "2026-10-15", "csv"], NOW)
+    assert (since.day, until.day, user_id, fmt) == (1, 16, None, "csv")
+
+
+def test_reversed_date_range_is_rejected():
+    assert parse_events_args(["2026-10-15", "2026-10-01"], NOW) is None
+    assert parse_report_args(["2026-10-15", "2026-10-01"], NOW.date().toordinal()) is None
+
+
+def test_journal_flush_failure_is_answered(monkeypatch):
+    async def broken(events):
+        raise OSError("disk I/O error")
+
+    monkeypatch.setattr(database, "append_events", broken)
+    answers = []
+
+    async def answer(text, **kwargs):
+        answers.append(text)
+
+    async def scenario():
+        journal = Journal(batch=2)
+        monkeypatch.setattr(admin, "journal", journal)
+        for _ in range(5):
+            journal.record("approved", user_id=7)
+        return await admin.flush_journal(SimpleNamespace(answer=answer)), len(journal)
+
+    assert asyncio.run(scenario()) == (False, 5)
+    assert answers == ["❌ Не удалось записать журнал: disk I/O error"]
@@ -0,0 +1,41 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import database
+from handlers.request import decision
+
+ADMIN_ID, STRANGER_ID = 1, 42
+
+
+def click(user_id, data, answers):
+    async def answer(text=None, show_alert=False):
+        answers.append(text)
+
+    return SimpleNamespace(
+        data=data, from_user=SimpleNamespace(id=user_id), answer=answer,
+        message=SimpleNamespace(chat=SimpleNamespace(id=user_id), message_id=1),
+    )
+
+
+def test_only_admins_decide_and_legacy_cards_need_a_request(db_path):
+    async def scenario():
+        await database.connect()
+        try:
+            await database.init_db()
+            await database.open_decision("tok", -100, 7, "bob", datetime.now(timezone.utc))
+            answers = []
+            await decision(click(STRANGER_ID, "approve:tok", answers))
+            await decision(click(STRANGER_ID, "approve_7_bob", answers))
+            await decision(click(ADMIN_ID, "approve_8_eve", answers))
+            return answers, await database.get_decision("tok"), await database.get_decision("u8")
+        finally:
+            await database.close()
+
+    answers, pending, legacy = asyncio.run(scenario())
+    assert answers == [
+        "❌ У вас нет прав для этой команды.", "❌ У вас нет прав для этой команды.",
+        "❌ Заявка не найдена или устарела.",
+    ]
+    assert pending.action is None
+    assert legacy is None
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+
+from services.duplicates import DuplicateIndex, make_entry
+
+AD = (
+    "Требуется менеджер по продажам в офис на Тверской. Зарплата от 80 000 рублей, "
+    "график 5/2 с 9 до 18, опыт работы от года."
+)
+NOW = datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc)
+GROUP_ID = -100
+
+
+def test_repost_within_window_is_found():
+    index = DuplicateIndex(window=timedelta(hours=24), max_distance=3, capacity=100)
+    assert index.claim(make_entry(AD, 1, GROUP_ID, 10, NOW - timedelta(hours=1)), NOW - timedelta(hours=1)) is None
+    assert index.claim(make_entry(AD, 2, GROUP_ID, 11, NOW), NOW).user_id == 1
+
+
+def test_out_of_order_old_post_is_not_a_duplicate():
+    index = DuplicateIndex(window=timedelta(hours=24), max_distance=3, capacity=100)
+    other = "Ищем водителя категории B на доставку по Москве, оплата 3000 в день, график 2/2, звоните."
+    index.add(make_entry(other, 3, GROUP_ID, 9, NOW - timedelta(hours=1)))
+    # отпечаток из пропущенных апдейтов встал в кольцо после более нового
+    index.add(make_entry(AD, 1, GROUP_ID, 10, NOW - timedelta(hours=30)))
+
+    assert index.find(*make_entry(AD, 2, GROUP_ID, 11, NOW)[1:3], GROUP_ID, NOW) is None
+    # пост принят — его отпечаток заменяет старый, и следующий повтор уже находится
+    assert index.claim(make_entry(AD, 2, GROUP_ID, 11, NOW), NOW) is None
+    assert index.claim(make_entry(AD, 4, GROUP_ID, 12, NOW), NOW).user_id == 2
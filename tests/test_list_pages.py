@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from handlers.admin import decode_anchor, encode_anchor, parse_list_filter
+from database import AccessFilter, AccessRow
+from services import redis_store
+
+GROUP_ID = -100
+NOW = datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc)
+
+
+async def fill(store):
+    # 1..5 — со сроком (у 4 и 5 один срок), 6..9 — бессрочные
+    for user_id in range(1, 10):
+        expires = NOW + timedelta(days=min(user_id, 4)) if user_id <= 5 else None
+        await store.grant_access(GROUP_ID, user_id, f"{'even' if user_id % 2 == 0 else 'odd'}{user_id}", expires, 3)
+
+
+async def walk(store, by_expiry, page_size, backwards=False, flt=None):
+    """Все страницы подряд, курсор — через callback_data, как у кнопок /list."""
+    pages, anchor = [], None
+    while True:
+        rows = [row async for row in store.iter_access_page(GROUP_ID, flt, by_expiry, anchor, backwards, page_size)]
+        if not rows:
+            return pages
+        pages.append([row.user_id for row in rows])
+        anchor = decode_anchor(*encode_anchor(rows[-1]).split(":"))
+
+
+def test_pages_cross_permanent_and_expiring_rows(backend):
+    async def scenario():
+        async with backend() as store:
+            await fill(store)
+            return (
+                await walk(store, True, 2), await walk(store, True, 3, backwards=True), await walk(store, False, 4)
+            )
+
+    by_expiry, backwards, by_id = asyncio.run(scenario())
+    assert by_expiry == [[1, 2], [3, 4], [5, 6], [7, 8], [9]]
+    assert backwards == [[9, 8, 7], [6, 5, 4], [3, 2, 1]]
+    assert by_id == [[1, 2, 3, 4], [5, 6, 7, 8], [9]]
+
+
+def test_next_page_after_anchor_was_deleted_or_extended(backend):
+    async def scenario():
+        async with backend() as store:
+            await fill(store)
+            first = [row async for row in store.iter_access_page(GROUP_ID, None, True, None, False, 3)]
+            permanent = [row async for row in store.iter_access_page(GROUP_ID, None, True, None, False, 6)][-1]
+            cursor, permanent_cursor = encode_anchor(first[-1]), encode_anchor(permanent)
+
+            await store.delete_access(GROUP_ID, first[-1].user_id)
+            await store.delete_access(GROUP_ID, permanent.user_id)
+            await store.set_expires(GROUP_ID, 1, NOW + timedelta(days=30))
+            after_deleted = [
+                row.user_id async for row in
+                store.iter_access_page(GROUP_ID, None, True, decode_anchor(*cursor.split(":")), False, 3)
+            ]
+            after_permanent = [
+                row.user_id async for row in
+                store.iter_access_page(GROUP_ID, None, True, decode_anchor(*permanent_cursor.split(":")), False, 3)
+            ]
+            return [row.user_id for row in first], after_deleted, after_permanent
+
+    first, after_deleted, after_permanent = asyncio.run(scenario())
+    assert first == [1, 2, 3]
+    # 3 удалён, 1 продлён на 30 дней — страница продолжается с того же места
+    assert after_deleted == [4, 5, 1]
+    assert after_permanent == [7, 8, 9]
+
+
+def test_filtered_pages_stay_in_group(backend, monkeypatch):
+    # куски индекса меньше страницы фильтра — отбор идёт в несколько запросов
+    monkeypatch.setattr(redis_store, "ACCESS_SCAN_CHUNK", 1)
+    expiring, even = AccessFilter(expiring_days=3, now=NOW), AccessFilter(username_prefix="EVEN", now=NOW)
+
+    async def scenario():
+        async with backend() as store:
+            await fill(store)
+            for user_id in range(1, 10):
+                await store.grant_access(GROUP_ID - 1, user_id, f"even{user_id}", NOW, 3)
+            return (
+                await walk(store, True, 2, flt=expiring), await walk(store, True, 2, backwards=True, flt=expiring),
+                await walk(store, False, 3, flt=even), await walk(store, False, 3, backwards=True, flt=even),
+                await store.filter_user_ids(GROUP_ID, expiring), await store.filter_user_ids(GROUP_ID, even),
+            )
+
+    assert asyncio.run(scenario()) == (
+        [[1, 2], [3]], [[3, 2], [1]], [[2, 4, 6], [8]], [[8, 6, 4], [2]], [1, 2, 3], [2, 4, 6, 8]
+    )
+
+
+def test_redis_group_indexes_are_built_from_global_index(backend):
+    if backend.name != "redis":
+        pytest.skip("индексы групп есть только в Redis")
+
+    async def scenario():
+        async with backend() as store:
+            await fill(store)
+            client = redis_store._client
+            await client.execute(
+                "DEL", redis_store.ACCESS_INDEXED, redis_store._by_user(GROUP_ID), redis_store._by_expiry(GROUP_ID)
+            )
+            await redis_store.init_db()
+            return await walk(store, True, 4), await store.filter_user_ids(GROUP_ID, None)
+
+    assert asyncio.run(scenario()) == ([[1, 2, 3, 4], [5, 6, 7, 8], [9]], list(range(1, 10)))
+
+
+def test_cursor_fits_callback_data():
+    spec = parse_list_filter(["exp", "100000", "full", "@" + "x" * 32])
+    row = AccessRow(-1009999999999, 2 ** 52, "x", datetime(2999, 12, 31, tzinfo=timezone.utc), 0, None, 3, None)
+    data = f"ls:{row.group_id}:n:{encode_anchor(row)}:{spec}"
+    assert len(data.encode()) <= 64
+    assert decode_anchor(*encode_anchor(row).split(":")) == (row.expires_at, row.user_id)
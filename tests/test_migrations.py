@@ -0,0 +1,76 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timezone
+
+import database
+
+# Схема из первой версии бота: даты — ISO-строки
+BASELINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS access (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    expires_at TEXT,
+    posts_today INTEGER DEFAULT 0,
+    last_post_date TEXT,
+    max_posts INTEGER DEFAULT 3
+);
+CREATE TABLE IF NOT EXISTS requests (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    requested_at TEXT
+);
+"""
+
+EXPIRES = datetime(2026, 11, 1, 12, 30, tzinfo=timezone.utc)
+LAST_POST = datetime(2026, 10, 1, 9, 15, tzinfo=timezone.utc)
+REQUESTED = datetime(2026, 10, 2, 18, 0, tzinfo=timezone.utc)
+
+
+def make_baseline_db(path):
+    db = sqlite3.connect(path)
+    db.executescript(BASELINE_SCHEMA)
+    db.executemany(
+        "INSERT INTO access (user_id, username, expires_at, posts_today, last_post_date, max_posts) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (101, "alice", EXPIRES.isoformat(), 2, LAST_POST.isoformat(), 3),
+            # без часового пояса бот писал время UTC
+            (102, "bob", EXPIRES.replace(tzinfo=None).isoformat(), 0, None, 5),
+        ]
+    )
+    db.execute("INSERT INTO requests VALUES (?, ?, ?)", (201, "carol", REQUESTED.isoformat()))
+    db.commit()
+    db.close()
+
+
+def test_baseline_schema_migrates(db_path):
+    make_baseline_db(db_path)
+
+    async def scenario():
+        await database.connect()
+        try:
+            await database.init_db()
+        finally:
+            await database.close()
+
+    asyncio.run(scenario())
+
+    db = sqlite3.connect(db_path)
+    try:
+        access = db.execute(
+            "SELECT group_id, user_id, username, expires_at, typeof(expires_at), posts_today, "
+            "last_post_date, max_posts FROM access ORDER BY user_id"
+        ).fetchall()
+        assert access == [
+            (-100, 101, "alice", int(EXPIRES.timestamp()), "integer", 2, int(LAST_POST.timestamp()), 3),
+            (-100, 102, "bob", int(EXPIRES.timestamp()), "integer", 0, None, 5),
+        ]
+        assert db.execute("SELECT user_id, username, requested_at, typeof(requested_at) FROM requests").fetchall() == [
+            (201, "carol", int(REQUESTED.timestamp()), "integer")
+        ]
+
+        indexes = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"idx_access_expires_at", "idx_requests_requested_at", "idx_events_at"} <= indexes
+        assert db.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+    finally:
+        db.close()
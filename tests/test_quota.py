@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+GROUP_ID = -100
+USER_ID = 7
+
+
+def test_concurrent_posts_respect_limit(backend):
+    async def scenario():
+        async with backend() as store:
+            now = datetime.now(timezone.utc)
+            await store.grant_access(GROUP_ID, USER_ID, "bob", now + timedelta(days=7), 3)
+
+            results = await asyncio.gather(
+                *(store.consume_post(GROUP_ID, USER_ID, "bob", now) for _ in range(50))
+            )
+            row = await store.get_access(GROUP_ID, USER_ID)
+            return results, row
+
+    results, row = asyncio.run(scenario())
+    assert sum(result.allowed for result in results) == 3
+    assert all(result.posts_today == 3 for result in results if not result.allowed)
+    assert row.posts_today == 3
+
+
+def test_post_after_revoke_does_not_restore_access(backend):
+    async def scenario():
+        async with backend() as store:
+            now = datetime.now(timezone.utc)
+            await store.grant_access(GROUP_ID, USER_ID, "bob", now + timedelta(days=7), 3)
+            posts = [store.consume_post(GROUP_ID, USER_ID, "bob", now) for _ in range(10)]
+            await asyncio.gather(*posts[:5], store.delete_access(GROUP_ID, USER_ID), *posts[5:])
+            # в Redis пост не должен оставить после снятия доступа даже хэш без max_posts
+            leftover = backend.name == "redis" and await store._client.execute(
+                "EXISTS", store._key("access", GROUP_ID, USER_ID)
+            )
+            return (
+                await store.get_access(GROUP_ID, USER_ID), await store.consume_post(GROUP_ID, USER_ID, "bob", now),
+                bool(leftover),
+            )
+
+    assert asyncio.run(scenario()) == (None, None, False)
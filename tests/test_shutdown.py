@@ -0,0 +1,27 @@
+import asyncio
+
+from services import decisions
+from services.outbox import Outbox
+
+
+def test_outbox_stop_resolves_unsent_messages():
+    async def scenario():
+        outbox = Outbox()  # цикл отправки не запущен — сообщения так и останутся в очереди
+        futures = outbox.send_many([1, 2], "текст")
+        await outbox.stop(timeout=0.1)
+        return await asyncio.wait_for(asyncio.gather(*futures), 1), outbox.depth
+
+    results, depth = asyncio.run(scenario())
+    assert results == [None, None]
+    assert depth == 0
+
+
+def test_decisions_stop_is_bounded(monkeypatch):
+    async def scenario():
+        stuck = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(decisions._register_cards("token", [stuck]))
+        monkeypatch.setattr(decisions, "_tasks", {task})
+        await asyncio.wait_for(decisions.stop(timeout=0.1), 1)
+        return task
+
+    assert asyncio.run(scenario()).cancelled()
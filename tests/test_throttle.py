@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta, timezone
+
+from services.throttle import RequestCooldown
+
+NOW = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_remaining_is_none_after_cooldown():
+    cooldown = RequestCooldown(ttl=60)
+    cooldown.add(1, NOW)
+    assert cooldown.remaining(1, NOW + timedelta(seconds=20)) == timedelta(seconds=40)
+    # старая запись за более новой: _expire до неё не дойдёт, но ждать уже нечего
+    cooldown._entries[2] = NOW - timedelta(seconds=61)
+    assert cooldown.remaining(2, NOW + timedelta(seconds=20)) is None
+
+
+def test_late_request_keeps_time_order():
+    cooldown = RequestCooldown(ttl=60)
+    cooldown.add(1, NOW)
+    cooldown.add(2, NOW + timedelta(seconds=30))
+    cooldown.add(3, NOW - timedelta(seconds=50))  # заявка из пропущенных апдейтов
+    assert list(cooldown._entries) == [3, 1, 2]
+
+    # через 15 секунд истекла только заявка 3, остальные ещё действуют
+    later = NOW + timedelta(seconds=15)
+    assert cooldown.remaining(3, later) is None
+    assert cooldown.remaining(1, later) == timedelta(seconds=45)
+    assert len(cooldown) == 2
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from aiogram import Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+from config import WEBHOOK_PATH
+from services import updates, webhook
+
+
+def group_message(update_id, user_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": -100, "type": "supergroup"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "x"},
+            "text": "пост",
+        },
+    }
+
+
+def test_full_queue_delays_webhook_response(monkeypatch):
+    dp = Dispatcher()
+    updates.setup(dp)
+    monkeypatch.setattr(webhook, "dp", dp)
+
+    async def scenario():
+        scheduler = updates.UpdateScheduler(concurrency=1, max_pending=1)
+        monkeypatch.setattr(updates, "scheduler", scheduler)
+        gate = asyncio.Event()
+
+        @dp.message()
+        async def slow(message):
+            await gate.wait()
+
+        scheduler.start()
+        client = TestClient(TestServer(webhook.build_app()))
+        await client.start_server()
+        try:
+            # первый апдейт занимает единственное место в очереди, ответ приходит сразу
+            first = await asyncio.wait_for(client.post(WEBHOOK_PATH, json=group_message(1, 5)), 2)
+            assert first.status == 200
+
+            # второй ждёт места: Telegram не получает ответа, пока очередь полна
+            second = asyncio.create_task(client.post(WEBHOOK_PATH, json=group_message(2, 6)))
+            await asyncio.sleep(0.3)
+            assert not second.done()
+
+            gate.set()
+            assert (await asyncio.wait_for(second, 2)).status == 200
+            await asyncio.wait_for(scheduler.join(), 2)
+            assert scheduler.processed == 2
+        finally:
+            await client.close()
+            await scheduler.stop(timeout=1)
+
+    asyncio.run(scenario())